@@ -1,21 +1,52 @@
-from typing import Dict, Optional
-from mutagen import File
-from mutagen.easyid3 import EasyID3
+from typing import Dict, List, Optional
+from collections import OrderedDict
+import base64
 import os
+import threading
+from audio.metadata_cache import MetadataCache
+from utils import profiling
+
+# mutagen is imported inside the readers so it loads with the first file read, not at startup
+
+DURATION_CACHE_SIZE = 4096
+REPLAYGAIN_KEYS = ('track_gain', 'track_peak', 'album_gain', 'album_peak')
+R128_OFFSET_DB = 5.0  # Opus R128 gains target -23 LUFS, ReplayGain -18 LUFS
+
+# path -> (size, mtime, length in seconds), least recently used first
+_duration_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_duration_lock = threading.Lock()
 
 class MetadataReader:
+    # Shared by every reader in the process; see cache.stats() for hit rates
+    cache = MetadataCache()
+    
     @staticmethod
     def read_metadata(file_path: str) -> Dict:
-        """Read metadata from an audio file."""
-        if not os.path.exists(file_path):
+        """Read metadata from an audio file, reusing cached results for unchanged files."""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
             return {}
         
+        cached = MetadataReader.cache.get(file_path, stat.st_size, stat.st_mtime)
+        if cached is not None:
+            return cached
+        
+        with profiling.span('metadata.read'):
+            metadata = MetadataReader._parse_metadata(file_path, stat)
+        MetadataReader.cache.put(metadata)
+        return metadata
+    
+    @staticmethod
+    def _parse_metadata(file_path: str, stat: os.stat_result) -> Dict:
+        """Parse the tags of an audio file with mutagen."""
+        from mutagen import File
         try:
             # Try to read ID3 tags first
             audio = File(file_path, easy=True)
             if audio is None:
                 # Fallback to basic file info
-                return MetadataReader._get_basic_info(file_path)
+                return MetadataReader._get_basic_info(file_path, stat)
             
             metadata = {
                 'title': MetadataReader._get_first(audio, 'title'),
@@ -24,19 +55,176 @@ class MetadataReader:
                 'genre': MetadataReader._get_first(audio, 'genre'),
                 'date': MetadataReader._get_first(audio, 'date'),
                 'track_number': MetadataReader._get_first(audio, 'tracknumber'),
+                'length': MetadataReader._get_length(audio),
             }
             
             # Add basic file info
-            metadata.update(MetadataReader._get_basic_info(file_path))
+            metadata.update(MetadataReader._get_basic_info(file_path, stat))
+            if metadata['length'] is not None:
+                MetadataReader._cache_duration(
+                    file_path, metadata['size'], metadata['modified'], metadata['length']
+                )
             
             return metadata
             
         except Exception as e:
             print(f"Error reading metadata for {file_path}: {e}")
-            return MetadataReader._get_basic_info(file_path)
+            return MetadataReader._get_basic_info(file_path, stat)
+    
+    @staticmethod
+    def read_duration(file_path: str) -> float:
+        """Read a track's duration in seconds from its stream headers.
+
+        Only the container headers are parsed, the audio is never decoded.
+        Results are cached per file and revalidated against size and mtime.
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return 0.0
+        
+        with _duration_lock:
+            cached = _duration_cache.get(file_path)
+            if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime:
+                _duration_cache.move_to_end(file_path)
+                return cached[2]
+        
+        from mutagen import File
+        try:
+            length = MetadataReader._get_length(File(file_path))
+        except Exception as e:
+            print(f"Error reading duration for {file_path}: {e}")
+            length = None
+        if length is None:
+            return 0.0
+        MetadataReader._cache_duration(file_path, stat.st_size, stat.st_mtime, length)
+        return length
+    
+    @staticmethod
+    def read_artwork(file_path: str) -> Optional[bytes]:
+        """Return the encoded embedded cover image of an audio file, or None."""
+        from mutagen import File
+        from mutagen.flac import Picture
+        if not os.path.exists(file_path):
+            return None
+        try:
+            audio = File(file_path)
+        except Exception as e:
+            print(f"Error reading artwork for {file_path}: {e}")
+            return None
+        if audio is None:
+            return None
+        
+        # FLAC keeps pictures outside the tags
+        pictures = getattr(audio, 'pictures', None)
+        if pictures:
+            return MetadataReader._front_cover(pictures)
+        tags = audio.tags
+        if not tags:
+            return None
+        if hasattr(tags, 'getall'):
+            # ID3, used by MP3 and WAV
+            return MetadataReader._front_cover(tags.getall('APIC'))
+        try:
+            if 'covr' in tags:
+                # MP4
+                return bytes(tags['covr'][0])
+            if 'metadata_block_picture' in tags:
+                # Vorbis comments store base64 encoded FLAC picture blocks
+                return MetadataReader._front_cover([
+                    Picture(base64.b64decode(block)) for block in tags['metadata_block_picture']
+                ])
+        except Exception as e:
+            print(f"Error reading artwork for {file_path}: {e}")
+        return None
+    
+    @staticmethod
+    def read_replaygain(file_path: str) -> Dict[str, float]:
+        """Return the ReplayGain values tagged in a file (gains in dB, linear peaks).
+
+        Understands REPLAYGAIN_* comments (Vorbis, FLAC, APE), ID3 TXXX and
+        RVA2 frames, iTunes freeform atoms and Opus R128_* gains. Keys are
+        track_gain, track_peak, album_gain and album_peak; missing ones are left out.
+        """
+        from mutagen import File
+        try:
+            audio = File(file_path)
+        except Exception as e:
+            print(f"Error reading ReplayGain tags for {file_path}: {e}")
+            return {}
+        tags = getattr(audio, 'tags', None) if audio is not None else None
+        if not tags:
+            return {}
+        
+        values = {}
+        if hasattr(tags, 'getall'):
+            # ID3: foobar2000 style TXXX frames, else the RVA2 frames EasyID3 writes
+            for frame in tags.getall('TXXX'):
+                values[frame.desc.lower()] = frame.text[0] if frame.text else ''
+            for frame in tags.getall('RVA2'):
+                if frame.channel == 1 and frame.desc.lower() in ('track', 'album'):
+                    values.setdefault(f"replaygain_{frame.desc.lower()}_gain", str(frame.gain))
+                    values.setdefault(f"replaygain_{frame.desc.lower()}_peak", str(frame.peak))
+        else:
+            for key, value in tags.items():
+                if isinstance(value, list):
+                    value = value[0] if value else ''
+                if isinstance(value, bytes):
+                    # MP4 freeform atoms
+                    value = bytes(value).decode('utf-8', 'replace')
+                # iTunes stores them as ----:com.apple.iTunes:replaygain_track_gain
+                values[key.rsplit(':', 1)[-1].lower()] = str(value)
+        
+        gains = {}
+        for key in REPLAYGAIN_KEYS:
+            number = MetadataReader._parse_gain(values.get(f"replaygain_{key}"))
+            if number is not None:
+                gains[key] = number
+        for key in ('track', 'album'):
+            r128 = MetadataReader._parse_gain(values.get(f"r128_{key}_gain"))
+            if r128 is not None and f"{key}_gain" not in gains:
+                # Q7.8 fixed point
+                gains[f"{key}_gain"] = r128 / 256 + R128_OFFSET_DB
+        return gains
+    
+    @staticmethod
+    def _parse_gain(text: Optional[str]) -> Optional[float]:
+        """Parse values such as "-6.54 dB" or "0.988553"."""
+        if not text:
+            return None
+        try:
+            return float(str(text).strip().split()[0])
+        except (ValueError, IndexError):
+            return None
+    
+    @staticmethod
+    def _front_cover(pictures: List) -> Optional[bytes]:
+        """Pick the front cover from ID3 APIC frames or FLAC pictures, else the first one."""
+        if not pictures:
+            return None
+        for picture in pictures:
+            if picture.type == 3:  # Cover (front)
+                return picture.data
+        return pictures[0].data
+    
+    @staticmethod
+    def _cache_duration(file_path: str, size: int, mtime: float, length: float):
+        """Remember a file's duration, evicting the least recently used entries."""
+        with _duration_lock:
+            _duration_cache[file_path] = (size, mtime, length)
+            _duration_cache.move_to_end(file_path)
+            while len(_duration_cache) > DURATION_CACHE_SIZE:
+                _duration_cache.popitem(last=False)
+    
+    @staticmethod
+    def _get_length(audio) -> Optional[float]:
+        """Get the stream length in seconds from the parsed headers."""
+        info = getattr(audio, 'info', None)
+        length = getattr(info, 'length', None)
+        return float(length) if length else None
     
     @staticmethod
-    def _get_first(audio: EasyID3, key: str) -> Optional[str]:
+    def _get_first(audio, key: str) -> Optional[str]:
         """Get first value from a metadata field."""
         try:
             return audio[key][0] if key in audio else None
@@ -44,16 +232,18 @@ class MetadataReader:
             return None
     
     @staticmethod
-    def _get_basic_info(file_path: str) -> Dict:
+    def _get_basic_info(file_path: str, stat: Optional[os.stat_result] = None) -> Dict:
         """Get basic file information when metadata is unavailable."""
         filename = os.path.basename(file_path)
         name, ext = os.path.splitext(filename)
+        if stat is None:
+            stat = os.stat(file_path)
         
         return {
             'filename': filename,
             'title': name,  # Use filename as title
             'extension': ext.lower(),
             'path': file_path,
-            'size': os.path.getsize(file_path),
-            'modified': os.path.getmtime(file_path)
+            'size': stat.st_size,
+            'modified': stat.st_mtime
         }
@@ -0,0 +1,122 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+DEFAULT_MAX_ENTRIES = 20000
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+def entry_size(metadata: Dict) -> int:
+    """Estimate the memory held by a metadata dict in bytes."""
+    size = sys.getsizeof(metadata)
+    for key, value in metadata.items():
+        size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
+
+
+class MetadataCache:
+    """Process-wide LRU of parsed metadata, validated by file size and mtime.
+
+    Entries are evicted least recently used first once either the entry count
+    or the estimated memory use goes over its bound. An optional store with a
+    get_track(path) method, such as the library catalog, is consulted on a
+    miss so metadata read in an earlier session is not parsed again. The
+    store is only read here; the library writes it. Worker processes each
+    get their own cache.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES, store=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store = store
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # path -> (metadata, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set_store(self, store):
+        """Use a persistent store for misses, or None to stop using one."""
+        self.store = store
+
+    def get(self, path: str, size: int, mtime: float) -> Optional[Dict]:
+        """Return a copy of the metadata for an unchanged file, or None."""
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached is not None:
+                metadata = cached[0]
+                if metadata.get('size') == size and metadata.get('modified') == mtime:
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    return dict(metadata)
+                self._drop(path)
+
+        store = self.store
+        if store is not None:
+            try:
+                stored = store.get_track(path)
+            except Exception as e:
+                print(f"Error reading cached metadata for {path}: {e}")
+                stored = None
+            if stored and stored.get('size') == size and stored.get('modified') == mtime:
+                stored.pop('folder', None)
+                self.put(stored)
+                with self._lock:
+                    self.store_hits += 1
+                return stored
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, metadata: Dict):
+        """Remember metadata for metadata['path'], evicting old entries as needed."""
+        path = metadata.get('path')
+        if not path:
+            return
+        metadata = dict(metadata)
+        size = entry_size(metadata)
+        with self._lock:
+            self._drop(path)
+            self._entries[path] = (metadata, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._bytes > self.max_bytes):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def invalidate(self, path: str):
+        """Forget a file, e.g. after it was removed from the library."""
+        with self._lock:
+            self._drop(path)
+
+    def clear(self):
+        """Forget every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.store_hits = self.misses = 0
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and current memory use for tuning."""
+        with self._lock:
+            lookups = self.hits + self.store_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'store_hits': self.store_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.store_hits) / lookups if lookups else 0.0,
+            }
+
+    def _drop(self, path: str):
+        cached = self._entries.pop(path, None)
+        if cached is not None:
+            self._bytes -= cached[1]
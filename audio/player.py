@@ -1,34 +1,126 @@
-import pygame
-import threading
 import time
 from typing import Optional, Callable
+from audio.metadata import MetadataReader
+from utils import profiling
+
+# pygame is imported when the first track is loaded, keeping it off the startup path
+pygame = None
+
+# Posted by pygame.mixer.music when a track ends or is stopped, set once pygame is loaded
+TRACK_END_EVENT: Optional[int] = None
+
+def _import_pygame():
+    """Import pygame on first use."""
+    global pygame, TRACK_END_EVENT
+    if pygame is None:
+        import pygame as module
+        TRACK_END_EVENT = module.USEREVENT + 1
+        pygame = module
+    return pygame
+
+class PlaybackClock:
+    """Playback position from a monotonic clock plus the last seek target.
+    
+    pygame's get_pos() counts from the last play() call and restarts at zero
+    after a seek, so the position is tracked here instead.
+    """
+    def __init__(self):
+        self.offset_ms = 0  # Position when the clock was last set or paused
+        self._started: Optional[float] = None  # Monotonic time playback resumed
+    
+    @property
+    def running(self) -> bool:
+        """Return True while the clock is counting."""
+        return self._started is not None
+    
+    def start(self):
+        """Start counting from the current offset."""
+        self._started = time.monotonic()
+    
+    def pause(self):
+        """Stop counting, keeping the current position."""
+        self.offset_ms = self.position()
+        self._started = None
+    
+    def set(self, position_ms: int):
+        """Jump to a position, continuing to count if running."""
+        self.offset_ms = position_ms
+        if self._started is not None:
+            self._started = time.monotonic()
+    
+    def position(self) -> int:
+        """Return the current position in milliseconds."""
+        if self._started is None:
+            return self.offset_ms
+        return self.offset_ms + int((time.monotonic() - self._started) * 1000)
 
 class AudioPlayer:
     def __init__(self):
-        pygame.mixer.init()
+        self.backend_ready = False  # The mixer is started by the first load_track()
         self.current_track: Optional[str] = None
         self.is_playing = False
         self.is_paused = False
         self.volume = 1.0  # Range: 0.0 to 1.0
+        # Optional audio.replaygain.ReplayGain; its factor scales the user volume per track
+        self.replay_gain = None
+        self.track_gain = 1.0
+        self.queued_gain = 1.0
         self.position = 0  # Current position in milliseconds
         self.duration = 0  # Track duration in milliseconds
-        self.update_thread: Optional[threading.Thread] = None
-        self.should_stop = False
+        self.clock = PlaybackClock()
+        self.end_events = False
+        self.queued_track: Optional[str] = None  # Plays right after the current track
+        self.queued_duration = 0
+        self.stale_queue = False  # The mixer still holds a queued track nobody wants
+        self.last_seek_latency_ms = 0.0  # Time the mixer took to apply the last seek
         
-        # Callbacks
+        # Callbacks, invoked from poll() on the caller's thread
         self.on_track_finished: Optional[Callable] = None
         self.on_position_changed: Optional[Callable] = None
+        self.on_track_started: Optional[Callable] = None  # Called with the path of a queued track that took over
+    
+    @staticmethod
+    def _init_end_events() -> bool:
+        """Have the mixer post TRACK_END_EVENT, if the host already runs pygame's event queue.
+        
+        pygame only reads events once its display is initialised. Under Qt
+        it is not, and starting it would put SDL's video subsystem next to
+        Qt's, so the end of a track is found by polling instead.
+        """
+        if not pygame.display.get_init():
+            return False
+        try:
+            pygame.mixer.music.set_endevent(TRACK_END_EVENT)
+            return True
+        except pygame.error as e:
+            print(f"Falling back to polling for end of track: {e}")
+            return False
+    
+    def _ensure_backend(self):
+        """Start the audio backend if this is its first use."""
+        if self.backend_ready:
+            return
+        _import_pygame()
+        pygame.mixer.init()
+        self.end_events = self._init_end_events()
+        self.backend_ready = True
+        self._apply_volume()
     
     def load_track(self, track_path: str) -> bool:
         """Load a track from file."""
         try:
-            self.stop()
-            pygame.mixer.music.load(track_path)
-            self.current_track = track_path
-            # Get audio length (this is approximate as pygame doesn't provide exact duration)
-            sound = pygame.mixer.Sound(track_path)
-            self.duration = int(sound.get_length() * 1000)  # Convert to milliseconds
-            self.position = 0
+            with profiling.span('player.load_track'):
+                self._ensure_backend()
+                self.stop()
+                # pygame.mixer.music streams from disk, the file is never fully decoded
+                pygame.mixer.music.load(track_path)
+                self.current_track = track_path
+                self.queued_track = None
+                self.track_gain = self._gain_for(track_path)
+                self._apply_volume()
+                # Duration comes from the container headers
+                self.duration = int(MetadataReader.read_duration(track_path) * 1000)  # Convert to milliseconds
+                self.position = 0
             return True
         except Exception as e:
             print(f"Error loading track: {e}")
@@ -43,74 +135,171 @@ class AudioPlayer:
             pygame.mixer.music.unpause()
         else:
             pygame.mixer.music.play(start=self.position / 1000.0)  # Convert ms to seconds
-            
-            # Start position tracking thread
-            self.should_stop = False
-            self.update_thread = threading.Thread(target=self._track_position)
-            self.update_thread.daemon = True
-            self.update_thread.start()
+            self.clock.set(self.position)
+            if self.queued_track:
+                # Stopping dropped the mixer's queue
+                self._queue(self.queued_track)
+        self.clock.start()
         
         self.is_playing = True
         self.is_paused = False
     
-    def _track_position(self):
-        """Track the current playback position."""
-        while not self.should_stop and self.is_playing:
-            if not pygame.mixer.music.get_busy() and not self.is_paused:
-                # Track finished
-                self.stop()
-                if self.on_track_finished:
-                    self.on_track_finished()
-                break
-            
-            # Update position (this is approximate)
-            if not self.is_paused:
-                self.position = int(pygame.mixer.music.get_pos())
-                if self.on_position_changed:
-                    self.on_position_changed(self.position)
-            
-            time.sleep(0.1)  # Update every 100ms
+    def queue_next(self, track_path: Optional[str]) -> bool:
+        """Prepare the track that should start the moment the current one ends.
+        
+        The mixer opens the file ahead of time and switches to it without
+        a stop/load cycle. Returns False if the track could not be prepared,
+        in which case the caller loads it normally when on_track_finished fires.
+        """
+        if track_path is None:
+            # pygame cannot unqueue; a queued track that is no longer wanted
+            # is stopped as soon as it starts
+            if self.queued_track and (self.is_playing or self.is_paused):
+                self.stale_queue = True
+            self.queued_track = None
+            return True
+        if not self.current_track:
+            return False
+        try:
+            self.queued_duration = int(MetadataReader.read_duration(track_path) * 1000)
+            self.queued_gain = self._gain_for(track_path)
+            if self.is_playing or self.is_paused:
+                # Replaces any track still in the mixer's queue
+                self._queue(track_path)
+                self.stale_queue = False
+            self.queued_track = track_path
+            return True
+        except Exception as e:
+            print(f"Error preparing next track: {e}")
+            self.queued_track = None
+            return False
+    
+    def _queue(self, track_path: str):
+        """Hand a track to the mixer's queue."""
+        pygame.mixer.music.queue(track_path)
+    
+    def poll(self) -> bool:
+        """Deliver end-of-track and position callbacks, return True if the track ended.
+        
+        Call this from the thread that owns the callbacks, e.g. from a GUI timer.
+        """
+        if not self.is_playing:
+            return False
+        
+        if self._track_ended():
+            if self.queued_track and pygame.mixer.music.get_busy():
+                # The mixer already moved on to the queued track
+                overshoot = max(0, self.clock.position() - self.duration)
+                self.current_track = self.queued_track
+                self.duration = self.queued_duration
+                self.queued_track = None
+                self.track_gain = self.queued_gain
+                self._apply_volume()
+                self.position = overshoot
+                self.clock.set(overshoot)
+                if self.on_track_started:
+                    self.on_track_started(self.current_track)
+                return True
+            self.stop()
+            if self.on_track_finished:
+                self.on_track_finished()
+            return True
+        
+        self.position = self.get_position()
+        if self.on_position_changed:
+            self.on_position_changed(self.position)
+        return False
+    
+    def _track_ended(self) -> bool:
+        """Check whether the mixer finished the current track."""
+        if self.end_events:
+            return bool(pygame.event.get(TRACK_END_EVENT))
+        if (self.queued_track or self.stale_queue) and self.duration:
+            # A queued track keeps the mixer busy across the switch, even an unwanted one
+            return self.clock.position() >= self.duration
+        return not pygame.mixer.music.get_busy()
     
     def pause(self):
         """Pause playback."""
         if self.is_playing:
             pygame.mixer.music.pause()
+            self.clock.pause()
+            self.position = self.clock.position()
             self.is_paused = True
             self.is_playing = False
     
     def stop(self):
         """Stop playback."""
-        self.should_stop = True
-        if self.update_thread:
-            self.update_thread.join(timeout=1.0)
-        pygame.mixer.music.stop()
+        if self.backend_ready:
+            pygame.mixer.music.stop()
+        if self.end_events:
+            # Stopping posts an end event too; it must not end the next track
+            pygame.event.get(TRACK_END_EVENT)
+        self.stale_queue = False  # Stopping empties the mixer's queue
         self.is_playing = False
         self.is_paused = False
         self.position = 0
+        self.clock.pause()
+        self.clock.set(0)
     
     def set_volume(self, volume: float):
         """Set playback volume (0.0 to 1.0)."""
         self.volume = max(0.0, min(1.0, volume))
-        pygame.mixer.music.set_volume(self.volume)
+        self._apply_volume()
+    
+    def _gain_for(self, track_path: str) -> float:
+        """Return the stored ReplayGain factor of a track; nothing is decoded here."""
+        if self.replay_gain is None:
+            return 1.0
+        return self.replay_gain.factor(track_path)
+    
+    def _apply_volume(self):
+        """Set the mixer to the user volume scaled by the current track's gain."""
+        if self.backend_ready:
+            pygame.mixer.music.set_volume(self.volume * self.track_gain)
     
     def seek(self, position_ms: int):
-        """Seek to position in milliseconds."""
+        """Seek to position in milliseconds, repositioning the running stream in place."""
         if not self.current_track:
             return
         
-        was_playing = self.is_playing
-        self.stop()
+        started = time.perf_counter()
         self.position = max(0, min(position_ms, self.duration))
-        
-        if was_playing:
-            self.play()
+        if self.is_playing or self.is_paused:
+            with profiling.span('player.seek'):
+                try:
+                    self._set_stream_position(self.position / 1000.0)
+                except pygame.error:
+                    # Format without in-place seeking: restart the stream at the target
+                    self._restart_stream(self.position / 1000.0)
+        self.clock.set(self.position)
+        self.last_seek_latency_ms = (time.perf_counter() - started) * 1000
+    
+    def _set_stream_position(self, seconds: float):
+        """Move the playing or paused stream to an absolute position."""
+        if self.current_track.lower().endswith('.mp3'):
+            # Some SDL_mixer versions treat MP3 positions as relative
+            pygame.mixer.music.rewind()
+        pygame.mixer.music.set_pos(seconds)
+    
+    def _restart_stream(self, seconds: float):
+        """Restart the loaded stream at a position, keeping pause and queue state."""
+        pygame.mixer.music.play(start=seconds)
+        if self.end_events:
+            # Restarting halts the old stream, which posts an end event
+            pygame.event.get(TRACK_END_EVENT)
+        self.stale_queue = False
+        if self.is_paused:
+            pygame.mixer.music.pause()
+        if self.queued_track:
+            self._queue(self.queued_track)
     
     def get_position(self) -> int:
         """Get current playback position in milliseconds."""
-        if self.is_playing:
-            pos = pygame.mixer.music.get_pos()
-            return pos if pos >= 0 else self.position
-        return self.position
+        position = self.clock.position()
+        if self.duration:
+            position = min(position, self.duration)
+        return position
     
     def get_duration(self) -> int:
         """Get track duration in milliseconds."""
@@ -0,0 +1,241 @@
+import math
+import os
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from audio.metadata import MetadataReader
+from audio.waveform import DECODE_RATE
+from utils import profiling
+
+REPLAYGAIN_ENV = 'MUSIC_APP_REPLAYGAIN'  # off, track or album
+REFERENCE_LOUDNESS = -18.0  # LUFS, ReplayGain 2.0
+SUB_BLOCK_SECONDS = 0.1  # Gating blocks are 400 ms long and overlap by 75%
+CHUNK_SUB_BLOCKS = 600  # Sub-blocks transformed at once, bounds the FFT memory
+ABSOLUTE_GATE = -70.0  # LUFS
+RELATIVE_GATE = -10.0  # LU below the loudness of the absolute-gated blocks
+
+# ITU-R BS.1770 K-weighting: high shelf, then the RLB high-pass (48 kHz coefficients)
+SHELF = ((1.53512485958697, -2.69169618940638, 1.19839281085285),
+         (1.0, -1.69065929318241, 0.73248077421585))
+HIGH_PASS = ((1.0, -2.0, 1.0), (1.0, -1.99004745483398, 0.99007225036621))
+
+
+def default_mode() -> str:
+    """Return the ReplayGain mode, overridable with MUSIC_APP_REPLAYGAIN."""
+    mode = os.environ.get(REPLAYGAIN_ENV, 'track').lower()
+    return mode if mode in ('off', 'track', 'album') else 'track'
+
+
+def gain_factor(gain_db: Optional[float], peak: Optional[float] = None) -> float:
+    """Convert a gain to a volume factor; pygame cannot amplify, so it is capped at 1."""
+    if gain_db is None:
+        return 1.0
+    factor = 10 ** (gain_db / 20)
+    if peak:
+        # Never push the loudest sample past full scale
+        factor = min(factor, 1 / peak)
+    return min(factor, 1.0)
+
+
+def _k_weighting(frequencies):
+    """Return the K-weighting power response at the given frequencies in Hz."""
+    import numpy as np
+    z = np.exp(-2j * np.pi * frequencies / 48000)
+    response = np.ones_like(z)
+    for b, a in (SHELF, HIGH_PASS):
+        response *= (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return np.abs(response) ** 2
+
+
+def measure_loudness(samples, rate: int = DECODE_RATE) -> Optional[Tuple[float, float, int]]:
+    """Return (integrated loudness in LUFS, sample peak, gated block count) of (frames, channels) samples.
+
+    Follows BS.1770 gating, with the K-weighting applied in the frequency
+    domain of each 100 ms sub-block rather than as a time-domain filter.
+    None if the track is shorter than one block or silent.
+    """
+    import numpy as np
+    size = int(rate * SUB_BLOCK_SECONDS)
+    count = samples.shape[0] // size
+    if count < 4:
+        return None
+    peak = float(np.abs(samples).max()) / 32768.0
+
+    # Parseval weights: the bins between DC and Nyquist stand for two
+    weights = _k_weighting(np.fft.rfftfreq(size, 1 / rate)) * 2
+    weights[0] /= 2
+    if size % 2 == 0:
+        weights[-1] /= 2
+    weights /= size * size
+
+    powers = np.empty(count)
+    for start in range(0, count, CHUNK_SUB_BLOCKS):
+        stop = min(count, start + CHUNK_SUB_BLOCKS)
+        chunk = samples[start * size:stop * size].astype(np.float32) / 32768.0
+        # (sub-blocks, channels, samples)
+        chunk = chunk.reshape(stop - start, size, -1).transpose(0, 2, 1)
+        spectrum = np.fft.rfft(chunk, axis=2)
+        # Channel powers are summed, each with weight 1 for front channels
+        powers[start:stop] = ((np.square(spectrum.real) + np.square(spectrum.imag)) @ weights).sum(axis=1)
+
+    # 400 ms blocks overlapping by 75% are means of 4 consecutive sub-blocks
+    cumulative = np.concatenate(([0.0], np.cumsum(powers)))
+    blocks = (cumulative[4:] - cumulative[:-4]) / 4
+    gated = blocks[blocks > 10 ** ((ABSOLUTE_GATE + 0.691) / 10)]
+    if gated.size == 0:
+        return None
+    relative = gated.mean() * 10 ** (RELATIVE_GATE / 10)
+    gated = gated[gated > relative]
+    return -0.691 + 10 * math.log10(gated.mean()), peak, int(gated.size)
+
+
+def album_loudness(tracks: Iterable[Tuple[float, int]]) -> Optional[float]:
+    """Combine (loudness, gated blocks) of an album's tracks into the album loudness."""
+    energy = 0.0
+    blocks = 0
+    for loudness, count in tracks:
+        energy += count * 10 ** ((loudness + 0.691) / 10)
+        blocks += count
+    if not blocks:
+        return None
+    return -0.691 + 10 * math.log10(energy / blocks)
+
+
+class ReplayGain:
+    """Per-track volume factors from ReplayGain tags or loudness analysis.
+
+    factor() is a dictionary or catalog lookup and never touches the audio.
+    Untagged tracks are measured by the background waveform pass
+    (ui.waveform_cache.WaveformCache), which decodes each track once for
+    both its envelope and its loudness: prepare() stores tagged gains and
+    says whether a track must be measured, store_analysis() records the
+    result. Album gains are computed once every track of an album (same
+    folder and album tag) registered with analyze() has been measured.
+    """
+
+    def __init__(self, catalog, mode: Optional[str] = None):
+        self.catalog = catalog
+        self.mode = mode or default_mode()
+        self._factors: Dict[str, float] = {}  # path -> factor for the current mode
+        self._lock = threading.Lock()
+        self._album_of: Dict[str, Tuple] = {}  # path -> (folder, album) of registered tracks
+        self._albums: Dict[Tuple, set] = {}  # (folder, album) -> paths of registered tracks
+        self._known: Optional[Dict[str, Tuple[int, float]]] = None  # Stored rows, read on first use
+        self._stopped = False
+
+    def set_mode(self, mode: str):
+        """Switch between 'off', 'track' and 'album' gain."""
+        with self._lock:
+            self.mode = mode
+            self._factors.clear()
+
+    def factor(self, track_path: str) -> float:
+        """Return the volume factor for a track, 1.0 while it has no gain."""
+        if self.mode == 'off':
+            return 1.0
+        factor = self._factors.get(track_path)
+        if factor is None:
+            try:
+                row = self.catalog.get_replaygain(track_path)
+            except Exception as e:
+                print(f"Error reading ReplayGain for {track_path}: {e}")
+                return 1.0
+            factor = self._row_factor(row) if row else 1.0
+            if row:
+                self._factors[track_path] = factor
+        return factor
+
+    def _row_factor(self, row: Dict) -> float:
+        if self.mode == 'album' and row.get('album_gain') is not None:
+            return gain_factor(row['album_gain'], row.get('album_peak'))
+        return gain_factor(row.get('track_gain'), row.get('track_peak'))
+
+    def analyze(self, tracks: Iterable[Dict]):
+        """Register library tracks (metadata dicts) so their album gains can be computed."""
+        with self._lock:
+            if self._stopped:
+                return
+            for track in tracks:
+                key = self._album_key(track)
+                if key is not None:
+                    self._album_of[track['path']] = key
+                    self._albums.setdefault(key, set()).add(track['path'])
+
+    def shutdown(self):
+        """Stop storing gains; results still arriving from the waveform pass are dropped."""
+        with self._lock:
+            self._stopped = True
+
+    @staticmethod
+    def _album_key(track: Dict) -> Optional[Tuple]:
+        album = track.get('album')
+        if not album:
+            return None
+        return (track.get('folder') or os.path.dirname(track['path']), album)
+
+    def prepare(self, path: str, stat: os.stat_result) -> bool:
+        """Store a track's tagged gains; return True if its loudness must be measured.
+
+        Called from the waveform pass before it decodes a track.
+        """
+        signature = (stat.st_size, stat.st_mtime)
+        with self._lock:
+            if self._stopped:
+                return False
+            if self._known is None:
+                try:
+                    self._known = self.catalog.get_replaygain_signatures()
+                except Exception as e:
+                    print(f"Error reading ReplayGain rows: {e}")
+                    self._known = {}
+            if self._known.get(path) == signature:
+                return False
+        gains = MetadataReader.read_replaygain(path)
+        if 'track_gain' not in gains:
+            return True
+        try:
+            self._store({'path': path, 'size': signature[0], 'modified': signature[1], **gains})
+        except Exception as e:
+            print(f"Error storing ReplayGain for {path}: {e}")
+        return False
+
+    def store_analysis(self, path: str, stat: os.stat_result,
+                       result: Optional[Tuple[float, float, int]]):
+        """Store a measured track and finish its album if it was the last one."""
+        if self._stopped:
+            return
+        row = {'path': path, 'size': stat.st_size, 'modified': stat.st_mtime}
+        if result is not None:
+            loudness, peak, blocks = result
+            row.update(track_gain=REFERENCE_LOUDNESS - loudness, track_peak=peak,
+                       loudness=loudness, blocks=blocks)
+        try:
+            self._store(row)
+            profiling.count('replaygain.analyzed')
+            with self._lock:
+                album = set(self._albums.get(self._album_of.get(path), ()))
+            if album:
+                self._finish_album(album)
+        except Exception as e:
+            print(f"Error storing ReplayGain for {path}: {e}")
+
+    def _store(self, row: Dict):
+        self.catalog.store_replaygain([row])
+        self._factors.pop(row['path'], None)
+        with self._lock:
+            if self._known is not None:
+                self._known[row['path']] = (row['size'], row['modified'])
+
+    def _finish_album(self, paths):
+        """Set the album gain once every track of the album has been measured."""
+        rows = self.catalog.get_replaygain_rows(paths)
+        if len(rows) < len(paths) or not all(row.get('blocks') for row in rows.values()):
+            # Tracks left to measure, or gains taken from tags
+            return
+        loudness = album_loudness((row['loudness'], row['blocks']) for row in rows.values())
+        if loudness is None:
+            return
+        peak = max(row.get('track_peak') or 0.0 for row in rows.values())
+        self.catalog.set_album_replaygain(rows, REFERENCE_LOUDNESS - loudness, peak)
+        for path in rows:
+            self._factors.pop(path, None)
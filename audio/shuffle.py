@@ -0,0 +1,186 @@
+import random
+from collections import deque
+from typing import Dict, Optional
+
+DEFAULT_NO_REPEAT_WINDOW = 5  # Plays before a track may come up again across rounds
+DEFAULT_HISTORY_SIZE = 1000  # Plays remembered for previous()
+
+
+class ShuffleEngine:
+    """Shuffled play order over playlist indices 0..size-1.
+
+    The permutation is drawn one step at a time with Fisher-Yates over a
+    sparse array, so next() is O(1) and memory grows only with the number of
+    tracks drawn in the current round, never with the playlist size. Every
+    index is played once per round; when a round ends a new one starts, and
+    the last no_repeat_window plays are kept out of its first draws.
+    """
+
+    def __init__(self, size: int = 0, seed=None,
+                 no_repeat_window: int = DEFAULT_NO_REPEAT_WINDOW,
+                 history_size: int = DEFAULT_HISTORY_SIZE):
+        self.random = random.Random(seed)
+        self.no_repeat_window = no_repeat_window
+        self.history = deque(maxlen=history_size)
+        self.reset(size)
+
+    def seed(self, seed):
+        """Reseed the generator so the following draws are reproducible."""
+        self.random.seed(seed)
+
+    def reset(self, size: int):
+        """Start a fresh shuffle over a playlist of the given size."""
+        self.size = size
+        self._drawn = 0  # Positions before this are played in the current round
+        self._slot: Dict[int, int] = {}  # Position -> index, only where they differ
+        self._where: Dict[int, int] = {}  # Index -> position, inverse of _slot
+        self._recent = deque(maxlen=max(self.no_repeat_window, 0))
+        self._blocked = set()  # Indices kept out of the first draws of a round
+        self.history.clear()
+        self._cursor = -1  # Position of the current track in history
+        self._peeked = False  # The last history entry was drawn by peek() and not played yet
+
+    @property
+    def current(self) -> Optional[int]:
+        """Return the index of the current track, or None."""
+        if 0 <= self._cursor < len(self.history):
+            return self.history[self._cursor]
+        return None
+
+    def next(self) -> Optional[int]:
+        """Return the next index, replaying history after previous() calls."""
+        if self.size == 0:
+            return None
+        if self._cursor < len(self.history) - 1:
+            self._cursor += 1
+            if self._cursor == len(self.history) - 1:
+                self._peeked = False
+            return self.history[self._cursor]
+        index = self._draw()
+        self._push(index)
+        return index
+
+    def peek(self) -> Optional[int]:
+        """Return the index the next call to next() will return, drawing it now if needed."""
+        if self.size == 0:
+            return None
+        if self._cursor < len(self.history) - 1:
+            return self.history[self._cursor + 1]
+        if len(self.history) == self.history.maxlen:
+            # The oldest entry is dropped on append
+            self._cursor -= 1
+        index = self._draw()
+        self.history.append(index)
+        self._peeked = True
+        return index
+
+    def previous(self) -> Optional[int]:
+        """Step back in the play history, or return None at its start."""
+        if self._cursor > 0:
+            self._cursor -= 1
+            return self.history[self._cursor]
+        return None
+
+    def mark_played(self, index: int):
+        """Record an index chosen by the user as the current track."""
+        if not 0 <= index < self.size:
+            return
+        if self._peeked:
+            # The peeked track will not be played next; put it back in the round
+            self.history.pop()
+            if self._recent:
+                self._recent.pop()
+            self._drawn -= 1
+            self._peeked = False
+        position = self._where.get(index, index)
+        if position >= self._drawn:
+            # Take it out of the undrawn part of the current round
+            self._swap(self._drawn, position)
+            self._drawn += 1
+        self._recent.append(index)
+        self._push(index)
+
+    def resize(self, size: int):
+        """Follow a playlist that grew or shrank, keeping the current round."""
+        if size >= self.size:
+            # New positions hold their own index and are undrawn
+            self.size = size
+            return
+
+        drawn = [self._get(p) for p in range(self._drawn)]
+        undrawn = [self._get(p) for p in range(self._drawn, self.size)]
+        drawn = [index for index in drawn if index < size]
+        undrawn = [index for index in undrawn if index < size]
+        self.size = size
+        self._drawn = len(drawn)
+        self._slot.clear()
+        self._where.clear()
+        for position, index in enumerate(drawn + undrawn):
+            self._set(position, index)
+
+        history = [index for index in self.history if index < size]
+        self.history = deque(history, maxlen=self.history.maxlen)
+        self._cursor = len(self.history) - 1
+        self._recent = deque((i for i in self._recent if i < size), maxlen=self._recent.maxlen)
+        self._blocked = {i for i in self._blocked if i < size}
+        self._peeked = False
+
+    def _draw(self) -> int:
+        """Draw the next undrawn index, starting a new round when needed."""
+        if self._drawn >= self.size:
+            self._slot.clear()
+            self._where.clear()
+            self._drawn = 0
+            # Leave at least one candidate free in tiny playlists
+            window = min(len(self._recent), self.size - 1)
+            self._blocked = set(list(self._recent)[len(self._recent) - window:]) if window > 0 else set()
+
+        if self._drawn >= len(self._blocked):
+            self._blocked = set()
+        position = self.random.randrange(self._drawn, self.size)
+        if self._blocked and self._get(position) in self._blocked:
+            # Rejection sampling; blocked indices are few compared to the candidates
+            for _ in range(8):
+                position = self.random.randrange(self._drawn, self.size)
+                if self._get(position) not in self._blocked:
+                    break
+            else:
+                allowed = [
+                    p for p in range(self._drawn, self.size)
+                    if self._get(p) not in self._blocked
+                ]
+                if allowed:
+                    position = allowed[0]
+
+        index = self._get(position)
+        self._swap(self._drawn, position)
+        self._drawn += 1
+        self._recent.append(index)
+        return index
+
+    def _push(self, index: int):
+        """Make index the newest history entry and the current track."""
+        # Drawing after stepping back drops the entries that were ahead
+        while len(self.history) > self._cursor + 1:
+            self.history.pop()
+        self.history.append(index)
+        self._cursor = len(self.history) - 1
+
+    def _get(self, position: int) -> int:
+        """Return the index stored at a position of the sparse array."""
+        return self._slot.get(position, position)
+
+    def _set(self, position: int, index: int):
+        """Store an index at a position, keeping only non-identity entries."""
+        if index == position:
+            self._slot.pop(position, None)
+            self._where.pop(index, None)
+        else:
+            self._slot[position] = index
+            self._where[index] = position
+
+    def _swap(self, a: int, b: int):
+        """Swap the indices at two positions."""
+        index_a, index_b = self._get(a), self._get(b)
+        self._set(a, index_b)
+        self._set(b, index_a)
@@ -0,0 +1,91 @@
+import os
+import sys
+from typing import NamedTuple, Optional, Tuple
+
+WAVEFORM_BINS = 1024  # Envelope points per track, whatever its length
+DECODE_RATE = 22050  # Tracks are decoded to stereo at this rate for analysis
+BELOW_NORMAL_PRIORITY_CLASS = 0x4000
+
+
+class Waveform(NamedTuple):
+    """Per-bin peak and RMS levels of a track, each scaled to 0-255 of full scale."""
+    peaks: bytes
+    rms: bytes
+
+
+def lower_process_priority():
+    """Make the current process yield the CPU to playback and the GUI."""
+    try:
+        if hasattr(os, 'nice'):
+            os.nice(10)
+        elif sys.platform == 'win32':
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), BELOW_NORMAL_PRIORITY_CLASS)
+    except OSError as e:
+        print(f"Error lowering analysis priority: {e}")
+
+
+def init_decoder_process():
+    """Worker process initializer: low priority and a silent stereo mixer used only to decode."""
+    lower_process_priority()
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    import pygame
+    # Stereo, loudness is measured per channel
+    pygame.mixer.init(frequency=DECODE_RATE, size=-16, channels=2)
+
+
+def decode_samples(file_path: str):
+    """Decode a track to 16-bit samples at DECODE_RATE with the mixer of this process.
+
+    Returns a (frames, channels) array in the mixer's channel layout.
+    """
+    import numpy as np
+    import pygame
+    channels = pygame.mixer.get_init()[2]
+    sound = pygame.mixer.Sound(file_path)
+    return np.frombuffer(sound.get_raw(), dtype=np.int16).reshape(-1, channels)
+
+
+def compute_waveform(samples, bins: int = WAVEFORM_BINS) -> Optional[Waveform]:
+    """Reduce samples to a peak and RMS envelope of up to bins points."""
+    import numpy as np
+    if samples.size == 0:
+        return None
+    bins = min(bins, samples.size)
+    # Bin i covers samples [edges[i], edges[i + 1]), sizes differ by at most one
+    edges = (np.arange(bins, dtype=np.int64) * samples.size) // bins
+    levels = np.abs(samples.astype(np.float32)) / 32768.0
+    peaks = np.maximum.reduceat(levels, edges)
+    counts = np.diff(np.append(edges, samples.size))
+    rms = np.sqrt(np.add.reduceat(np.square(levels), edges) / counts)
+    return Waveform(
+        peaks=np.round(np.clip(peaks, 0, 1) * 255).astype(np.uint8).tobytes(),
+        rms=np.round(np.clip(rms, 0, 1) * 255).astype(np.uint8).tobytes(),
+    )
+
+
+def analyze_track(file_path: str, loudness: bool = False) -> Tuple[Optional[Waveform], Optional[tuple]]:
+    """Worker process entry point: decode a track once for its envelope and, if asked, its loudness.
+
+    Returns (waveform, audio.replaygain.measure_loudness() result); both
+    are None if the track cannot be decoded.
+    """
+    try:
+        samples = decode_samples(file_path)
+    except Exception as e:
+        print(f"Error decoding {file_path}: {e}")
+        return None, None
+    waveform = measured = None
+    try:
+        waveform = compute_waveform(samples.mean(axis=1, dtype='float32'))
+    except Exception as e:
+        print(f"Error computing waveform for {file_path}: {e}")
+    if loudness:
+        from audio.replaygain import measure_loudness
+        try:
+            measured = measure_loudness(samples)
+        except Exception as e:
+            print(f"Error measuring loudness of {file_path}: {e}")
+    return waveform, measured
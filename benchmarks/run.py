@@ -0,0 +1,203 @@
+"""Time the library, search and playback hot paths on a synthetic library.
+
+    python -m benchmarks.run --tracks 2000 --output results.json
+
+Runs headless (offscreen Qt, dummy SDL audio) and writes JSON, so results
+from two revisions can be compared with the same --tracks and --seed.
+"""
+import os
+
+# Must be set before Qt and pygame are imported
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from benchmarks.synthetic_library import generate_library
+
+SEARCH_QUERIES = ['a', 'night', 'silver har', 'golden 12', 'zzz', 'café',
+                  'genre:rock year:2000..2010', 'ext:flac -night']
+FUZZY_QUERIES = ['nigth', 'silvr harbr', 'golden sumer']  # Typed a key at a time
+LOADABLE_FORMATS = ('.wav', '.mp3', '.flac')  # pygame has no Opus decoder for the .ogg files
+
+
+def measure(function: Callable, repeats: int, setup: Callable = None, items: int = 1) -> Dict:
+    """Run function repeats times and return timing statistics in milliseconds."""
+    samples = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    result = {
+        'repeats': repeats,
+        'min_ms': min(samples),
+        'median_ms': statistics.median(samples),
+        'mean_ms': statistics.fmean(samples),
+        'max_ms': max(samples),
+    }
+    if items > 1:
+        result['items'] = items
+        result['median_per_item_us'] = result['median_ms'] * 1000 / items
+    return result
+
+
+def git_revision() -> str:
+    """Return the checked out commit, or an empty string outside a git tree."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run_benchmarks(library_root: str, paths: List[str], repeats: int, seed: int) -> Dict:
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+
+    from audio.metadata import MetadataReader
+    from audio.player import AudioPlayer
+    from audio.shuffle import ShuffleEngine
+    from database.catalog import LibraryCatalog
+    from utils.file_utils import MusicLibrary
+    from ui.library_view import LibraryView
+    from ui.playback_controls import PlaybackControls
+
+    results = {}
+
+    results['scan_folder'] = measure(
+        lambda: MusicLibrary().scan_folder(library_root), repeats, items=len(paths))
+
+    results['read_metadata'] = measure(
+        lambda: [MetadataReader.read_metadata(path) for path in paths], repeats,
+        setup=MetadataReader.cache.clear, items=len(paths))
+    results['read_metadata_cached'] = measure(
+        lambda: [MetadataReader.read_metadata(path) for path in paths], repeats, items=len(paths))
+
+    # A library whose tags are already stored, so update_library_view adds rows synchronously
+    library = MusicLibrary(LibraryCatalog(':memory:'))
+    library.register_folder(library_root)
+    files = library.scan_folder(library_root)
+    library.store_metadata([MetadataReader.read_metadata(path) for path in files])
+    snapshot_path = os.path.join(tempfile.mkdtemp(prefix='music-bench-'), 'library.snapshot')
+    views = []
+
+    def new_view():
+        view = LibraryView(library.catalog, defer_load=True, snapshot_path=snapshot_path)
+        view.library = library
+        view.library_loaded = True
+        views.append(view)
+
+    results['update_library_view'] = measure(
+        lambda: views[-1].update_library_view(files), repeats, setup=new_view, items=len(files))
+    view = views[-1]
+    view.index_queued_tracks()
+    view.search_index.build_pending()
+    for query in SEARCH_QUERIES:
+        # filter_library only debounces; apply_filter is the search itself
+        results[f'filter_library[{query}]'] = measure(
+            lambda: (view.apply_filter(''), view.apply_filter(query)), repeats)
+    view.set_fuzzy_search(True)
+    for query in FUZZY_QUERIES:
+        # Start each run without the word scores cached by the previous one
+        results[f'fuzzy_search[{query}]'] = measure(
+            lambda: [view.apply_filter(query[:end]) for end in range(1, len(query) + 1)],
+            repeats, setup=view.search_index._word_scores.clear, items=len(query))
+    view.set_fuzzy_search(False)
+
+    engine = ShuffleEngine(len(paths) * 100, seed=seed)
+    results['shuffle_engine_next'] = measure(
+        lambda: [engine.next() for _ in range(10000)], repeats, items=10000)
+
+    loadable = [path for path in files if path.endswith(LOADABLE_FORMATS)][:200]
+    controls = PlaybackControls()
+    controls.shuffle.seed(seed)
+    controls.toggle_shuffle()
+    controls.set_playlist(loadable, 0)
+    steps = min(50, len(loadable))
+    results['next_track_shuffle'] = measure(
+        lambda: [controls.next_track() for _ in range(steps)], repeats, items=steps)
+    controls.player.stop()
+    controls.waveforms.shutdown()
+
+    player = AudioPlayer()
+    for extension in LOADABLE_FORMATS:
+        tracks = [path for path in loadable if path.endswith(extension)][:50]
+        if tracks:
+            results[f'load_track[{extension}]'] = measure(
+                lambda: [player.load_track(path) for path in tracks], repeats, items=len(tracks))
+    player.stop()
+
+    app.processEvents()
+    for view in views:
+        view.metadata_loader.cancel()
+        view.artwork.shutdown()
+    shutil.rmtree(os.path.dirname(snapshot_path), ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=1000, help="size of the synthetic library")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--library', help="reuse or create the library in this folder instead of a temp one")
+    parser.add_argument('--output', help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    temp_root = None
+    root = args.library
+    if root is None:
+        temp_root = root = tempfile.mkdtemp(prefix='music-library-')
+    # Keep the app's own data folder untouched
+    data_dir = tempfile.mkdtemp(prefix='music-bench-data-')
+    os.environ['MUSIC_APP_DATA_DIR'] = data_dir
+
+    try:
+        started = time.perf_counter()
+        existing = sorted(
+            os.path.join(folder, name) for folder, _, names in os.walk(root) for name in names
+        ) if args.library else []
+        paths = existing or generate_library(root, args.tracks, args.seed)
+        generation_ms = (time.perf_counter() - started) * 1000
+        results = run_benchmarks(root, paths, args.repeats, args.seed)
+    finally:
+        if temp_root is not None:
+            shutil.rmtree(temp_root, ignore_errors=True)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'tracks': len(paths),
+            'seed': args.seed,
+            'repeats': args.repeats,
+            'generation_ms': generation_ms,
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""Generate synthetic music libraries of tiny but valid tagged audio files.
+
+    python -m benchmarks.synthetic_library /tmp/library --tracks 1000
+"""
+import argparse
+import os
+import random
+import struct
+import wave
+from typing import Dict, List, Optional
+
+FORMATS = ('.wav', '.mp3', '.flac', '.ogg')
+
+ARTIST_WORDS = ['Silver', 'Night', 'Echo', 'Velvet', 'Static', 'Northern', 'Paper', 'Glass',
+                'Hollow', 'Electric', 'Quiet', 'Crimson', 'Golden', 'Midnight', 'Sonic', 'Björk']
+NOUNS = ['Harbor', 'Lights', 'Machine', 'Garden', 'Rivers', 'Signals', 'Horizon', 'Animals',
+         'Window', 'Season', 'Engine', 'Mirror', 'Parade', 'Summer', 'Ghosts', 'Café']
+GENRES = ['Rock', 'Pop', 'Jazz', 'Electronic', 'Classical', 'Hip-Hop', 'Folk', 'Ambient']
+
+MP3_FRAME_HEADER = b'\xff\xfb\x90\xc0'  # MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, mono
+MP3_FRAME_SIZE = 417
+MP3_FRAME_SAMPLES = 1152
+FLAC_BLOCK_SIZE = 4096
+OPUS_FRAME_SAMPLES = 960  # 20 ms at 48 kHz
+OPUS_PRE_SKIP = 312
+
+
+def write_wav(path: str, seconds: float):
+    """Write a silent 8 kHz mono 16-bit PCM WAV file."""
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(b'\x00\x00' * int(8000 * seconds))
+
+
+def write_mp3(path: str, seconds: float):
+    """Write silent MPEG-1 Layer III frames with zeroed side info."""
+    frames = max(1, int(seconds * 44100 / MP3_FRAME_SAMPLES))
+    frame = MP3_FRAME_HEADER + b'\x00' * (MP3_FRAME_SIZE - len(MP3_FRAME_HEADER))
+    with open(path, 'wb') as f:
+        f.write(frame * frames)
+
+
+def _crc8(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def _crc16(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x8005) & 0xFFFF if crc & 0x8000 else (crc << 1) & 0xFFFF
+    return crc
+
+
+def write_flac(path: str, seconds: float):
+    """Write a 44.1 kHz mono 16-bit FLAC file of constant (silent) subframes."""
+    frames = max(1, int(seconds * 44100 / FLAC_BLOCK_SIZE))
+    samples = frames * FLAC_BLOCK_SIZE
+    streaminfo = struct.pack('>HH', FLAC_BLOCK_SIZE, FLAC_BLOCK_SIZE) + b'\x00' * 6
+    # Sample rate (20 bits), channels - 1 (3 bits), bits per sample - 1 (5 bits), total samples (36 bits)
+    packed = (44100 << 44) | (0 << 41) | (15 << 36) | samples
+    streaminfo += packed.to_bytes(8, 'big') + b'\x00' * 16
+    with open(path, 'wb') as f:
+        f.write(b'fLaC')
+        f.write(bytes([0x80]) + len(streaminfo).to_bytes(3, 'big') + streaminfo)
+        for number in range(frames):
+            # Fixed 4096 sample blocks at 44.1 kHz, mono, 16 bits
+            header = b'\xff\xf8\xc9\x08' + chr(number).encode('utf-8')
+            header += bytes([_crc8(header)])
+            frame = header + b'\x00\x00\x00'  # CONSTANT subframe holding sample value 0
+            f.write(frame + _crc16(frame).to_bytes(2, 'big'))
+
+
+def write_ogg(path: str, seconds: float):
+    """Write an Ogg Opus file of silent (empty) 20 ms packets."""
+    from mutagen.ogg import OggPage
+
+    serial = random.Random(path).getrandbits(31)
+    head = b'OpusHead' + struct.pack('<BBHIhB', 1, 1, OPUS_PRE_SKIP, 48000, 0, 0)
+    vendor = b'synthetic'
+    tags = b'OpusTags' + struct.pack('<I', len(vendor)) + vendor + struct.pack('<I', 0)
+    packets = [b'\xf8'] * max(1, int(seconds * 48000 / OPUS_FRAME_SAMPLES))
+
+    pages = []
+    for sequence, packet in enumerate((head, tags)):
+        page = OggPage()
+        page.serial = serial
+        page.sequence = sequence
+        page.position = 0
+        page.first = sequence == 0
+        page.packets = [packet]
+        pages.append(page)
+    position = OPUS_PRE_SKIP
+    for start in range(0, len(packets), 200):
+        chunk = packets[start:start + 200]
+        position += len(chunk) * OPUS_FRAME_SAMPLES
+        page = OggPage()
+        page.serial = serial
+        page.sequence = len(pages)
+        page.position = position
+        page.packets = chunk
+        pages.append(page)
+    pages[-1].last = True
+    with open(path, 'wb') as f:
+        for page in pages:
+            f.write(page.write())
+
+
+WRITERS = {'.wav': write_wav, '.mp3': write_mp3, '.flac': write_flac, '.ogg': write_ogg}
+
+
+def tag_file(path: str, tags: Dict[str, str]):
+    """Write title, artist, album, genre, date and track number tags with mutagen."""
+    extension = os.path.splitext(path)[1]
+    if extension == '.wav':
+        from mutagen.wave import WAVE
+        from mutagen.id3 import TIT2, TPE1, TALB, TCON, TDRC, TRCK
+        audio = WAVE(path)
+        audio.add_tags()
+        for frame, key in ((TIT2, 'title'), (TPE1, 'artist'), (TALB, 'album'),
+                           (TCON, 'genre'), (TDRC, 'date'), (TRCK, 'tracknumber')):
+            audio.tags.add(frame(encoding=3, text=tags[key]))
+        audio.save()
+        return
+    if extension == '.mp3':
+        from mutagen.easyid3 import EasyID3
+        audio = EasyID3()
+    elif extension == '.flac':
+        from mutagen.flac import FLAC
+        audio = FLAC(path)
+    else:
+        from mutagen.oggopus import OggOpus
+        audio = OggOpus(path)
+    for key, value in tags.items():
+        audio[key] = value
+    if extension == '.mp3':
+        audio.save(path)
+    else:
+        audio.save()
+
+
+def generate_library(root: str, tracks: int, seed: int = 0, seconds: float = 1.0,
+                     formats: Optional[List[str]] = None, tagged: bool = True) -> List[str]:
+    """Create tracks files under root as Artist/Album/NN Title.ext and return their paths.
+
+    The same seed always produces the same layout, tags and formats.
+    """
+    rng = random.Random(seed)
+    formats = list(formats or FORMATS)
+    artists = [f"{rng.choice(ARTIST_WORDS)} {rng.choice(NOUNS)}" for _ in range(max(1, tracks // 40))]
+    paths = []
+    number = 0
+    while number < tracks:
+        artist = rng.choice(artists)
+        album = f"{rng.choice(NOUNS)} {rng.choice(['I', 'II', 'Live', 'Sessions', 'Remixes', 'of Time'])}"
+        genre = rng.choice(GENRES)
+        year = str(rng.randint(1960, 2024))
+        folder = os.path.join(root, artist, f"{year} - {album}")
+        os.makedirs(folder, exist_ok=True)
+        for track_number in range(1, rng.randint(6, 14) + 1):
+            if number >= tracks:
+                break
+            title = f"{rng.choice(ARTIST_WORDS)} {rng.choice(NOUNS)} {number}"
+            extension = formats[number % len(formats)]
+            path = os.path.join(folder, f"{track_number:02d} {title}{extension}")
+            WRITERS[extension](path, seconds)
+            if tagged:
+                tag_file(path, {
+                    'title': title, 'artist': artist, 'album': album, 'genre': genre,
+                    'date': year, 'tracknumber': str(track_number),
+                })
+            paths.append(path)
+            number += 1
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('root', help="folder to create the library in")
+    parser.add_argument('--tracks', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--seconds', type=float, default=1.0, help="length of each track")
+    parser.add_argument('--formats', default=','.join(FORMATS),
+                        help="comma separated extensions, e.g. .wav,.mp3")
+    parser.add_argument('--untagged', action='store_true', help="write no tags")
+    args = parser.parse_args()
+    paths = generate_library(args.root, args.tracks, args.seed, args.seconds,
+                             args.formats.split(','), not args.untagged)
+    print(f"Wrote {len(paths)} tracks to {args.root}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.file_utils import get_app_data_dir
+
+# Columns persisted for every track, in table order (path is the primary key)
+TRACK_COLUMNS = (
+    'path', 'folder', 'filename', 'title', 'artist', 'album', 'genre',
+    'date', 'track_number', 'extension', 'size', 'modified', 'length',
+)
+
+# ReplayGain columns; loudness (LUFS) and blocks (gated 400 ms blocks) are only set by analysis
+REPLAYGAIN_COLUMNS = (
+    'path', 'size', 'modified', 'track_gain', 'track_peak',
+    'album_gain', 'album_peak', 'loudness', 'blocks',
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY,
+    added REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tracks (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    title TEXT,
+    artist TEXT,
+    album TEXT,
+    genre TEXT,
+    date TEXT,
+    track_number TEXT,
+    extension TEXT,
+    size INTEGER,
+    modified REAL,
+    length REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tracks_folder ON tracks(folder);
+CREATE INDEX IF NOT EXISTS idx_tracks_artist ON tracks(artist);
+CREATE INDEX IF NOT EXISTS idx_tracks_album ON tracks(album);
+
+CREATE TABLE IF NOT EXISTS playlists (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS playlist_tracks (
+    playlist_id INTEGER NOT NULL REFERENCES playlists(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (playlist_id, path)
+);
+CREATE INDEX IF NOT EXISTS idx_playlist_tracks_path ON playlist_tracks(path);
+CREATE INDEX IF NOT EXISTS idx_playlist_tracks_position ON playlist_tracks(playlist_id, position);
+
+CREATE TABLE IF NOT EXISTS replaygain (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    modified REAL,
+    track_gain REAL,
+    track_peak REAL,
+    album_gain REAL,
+    album_peak REAL,
+    loudness REAL,
+    blocks INTEGER
+);
+"""
+
+
+def default_catalog_path() -> str:
+    """Return the location of the library database in the app data folder."""
+    return os.path.join(get_app_data_dir(), 'library.db')
+
+
+class LibraryCatalog:
+    """SQLite-backed store for library folders, tracks and playlists."""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or default_catalog_path()
+        if self.db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        with self._lock, self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self.conn.close()
+
+    # Folders
+
+    def add_folder(self, folder_path: str):
+        """Register a music folder."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO folders (path, added) VALUES (?, ?)",
+                (folder_path, time.time())
+            )
+
+    def remove_folder(self, folder_path: str, remove_tracks: bool = True) -> int:
+        """Forget a music folder and, unless remove_tracks is False, every track stored below it."""
+        prefix = folder_path.rstrip(os.sep) + os.sep
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM folders WHERE path = ?", (folder_path,))
+            if not remove_tracks:
+                return 0
+            cursor = self.conn.execute(
+                "DELETE FROM tracks WHERE folder = ? OR substr(folder, 1, ?) = ?",
+                (folder_path, len(prefix), prefix)
+            )
+            return cursor.rowcount
+
+    def get_folders(self) -> List[str]:
+        """Return all registered music folders in the order they were added."""
+        with self._lock:
+            rows = self.conn.execute("SELECT path FROM folders ORDER BY added").fetchall()
+        return [row['path'] for row in rows]
+
+    # Tracks
+
+    def upsert_tracks(self, tracks: Iterable[Dict]) -> int:
+        """Insert or update track rows in a single transaction."""
+        columns = ', '.join(TRACK_COLUMNS)
+        placeholders = ', '.join('?' for _ in TRACK_COLUMNS)
+        updates = ', '.join(f"{c} = excluded.{c}" for c in TRACK_COLUMNS[1:])
+        sql = (
+            f"INSERT INTO tracks ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT(path) DO UPDATE SET {updates}"
+        )
+        rows = [self._track_row(track) for track in tracks]
+        if not rows:
+            return 0
+        with self._lock, self.conn:
+            self.conn.executemany(sql, rows)
+        return len(rows)
+
+    def remove_tracks(self, paths: Iterable[str]) -> int:
+        """Delete the given tracks."""
+        rows = [(path,) for path in paths]
+        if not rows:
+            return 0
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM tracks WHERE path = ?", rows)
+        return len(rows)
+
+    def get_track(self, path: str) -> Optional[Dict]:
+        """Return the stored row for a track, or None if unknown."""
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM tracks WHERE path = ?", (path,)).fetchone()
+        return self._track_dict(row) if row else None
+
+    def get_all_tracks(self) -> List[Dict]:
+        """Return every stored track in insertion order."""
+        with self._lock:
+            rows = self.conn.execute("SELECT * FROM tracks ORDER BY rowid").fetchall()
+        return [self._track_dict(row) for row in rows]
+
+    def get_signatures(self) -> Dict[str, Tuple[int, float]]:
+        """Return path -> (size, mtime) for every stored track."""
+        with self._lock:
+            rows = self.conn.execute("SELECT path, size, modified FROM tracks").fetchall()
+        return {row['path']: (row['size'], row['modified']) for row in rows}
+
+    def track_count(self) -> int:
+        """Return the number of stored tracks."""
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    # Playlists
+
+    def create_playlist(self, name: str) -> bool:
+        """Create an empty playlist, returning False if the name is taken."""
+        with self._lock, self.conn:
+            cursor = self.conn.execute("INSERT OR IGNORE INTO playlists (name) VALUES (?)", (name,))
+            return cursor.rowcount > 0
+
+    def delete_playlist(self, name: str):
+        """Delete a playlist and its entries."""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM playlists WHERE name = ?", (name,))
+
+    def get_playlists(self) -> Dict[str, List[str]]:
+        """Return name -> ordered track paths for every playlist, in creation order."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT p.name, t.path FROM playlists p "
+                "LEFT JOIN playlist_tracks t ON t.playlist_id = p.id "
+                "ORDER BY p.id, t.position"
+            ).fetchall()
+        playlists = {}
+        for row in rows:
+            paths = playlists.setdefault(row['name'], [])
+            if row['path'] is not None:
+                paths.append(row['path'])
+        return playlists
+
+    def get_playlist_tracks(self, name: str) -> List[str]:
+        """Return the track paths of a playlist in order."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT t.path FROM playlist_tracks t JOIN playlists p ON p.id = t.playlist_id "
+                "WHERE p.name = ? ORDER BY t.position", (name,)
+            ).fetchall()
+        return [row['path'] for row in rows]
+
+    def add_playlist_tracks(self, name: str, paths: Iterable[str]) -> int:
+        """Append tracks to a playlist, skipping ones already in it.
+
+        paths may be a generator; rows are inserted as they are produced.
+        """
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                "SELECT p.id, COALESCE(MAX(t.position), -1) FROM playlists p "
+                "LEFT JOIN playlist_tracks t ON t.playlist_id = p.id WHERE p.name = ?", (name,)
+            ).fetchone()
+            if row is None or row[0] is None:
+                return 0
+            playlist_id, last = row[0], row[1]
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO playlist_tracks (playlist_id, position, path) VALUES (?, ?, ?)",
+                ((playlist_id, position, path) for position, path in enumerate(paths, last + 1))
+            )
+            return self.conn.total_changes - before
+
+    def remove_playlist_tracks(self, name: str, paths: Iterable[str]) -> int:
+        """Remove tracks from a playlist; the other tracks keep their positions."""
+        with self._lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "DELETE FROM playlist_tracks WHERE path = ? AND "
+                "playlist_id = (SELECT id FROM playlists WHERE name = ?)",
+                ((path, name) for path in paths)
+            )
+            return self.conn.total_changes - before
+
+    def move_playlist_track(self, name: str, path: str, index: int) -> bool:
+        """Move a track to a position of its playlist, counted without the track itself.
+
+        Positions are sparse: the track takes a position between its new
+        neighbours, so only its own row is updated. The playlist is
+        renumbered only once repeated moves leave no room between two rows.
+        Returns False if the track is not in the playlist.
+        """
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                "SELECT t.playlist_id FROM playlist_tracks t JOIN playlists p ON p.id = t.playlist_id "
+                "WHERE p.name = ? AND t.path = ?", (name, path)
+            ).fetchone()
+            if row is None:
+                return False
+            playlist_id = row[0]
+            index = max(index, 0)
+            # The rows on either side of the new position
+            neighbours = [r[0] for r in self.conn.execute(
+                "SELECT position FROM playlist_tracks WHERE playlist_id = ? AND path != ? "
+                "ORDER BY position LIMIT ? OFFSET ?",
+                (playlist_id, path, 2 if index else 1, max(index - 1, 0))
+            )]
+            if not neighbours:
+                # Past the end, or the only track
+                neighbours = [r[0] for r in self.conn.execute(
+                    "SELECT MAX(position) FROM playlist_tracks WHERE playlist_id = ? AND path != ?",
+                    (playlist_id, path)
+                ) if r[0] is not None]
+                if not neighbours:
+                    return True
+            if index == 0:
+                position = neighbours[0] - 1
+            elif len(neighbours) == 1:
+                position = neighbours[0] + 1
+            else:
+                position = (neighbours[0] + neighbours[1]) / 2
+                if position in neighbours:
+                    self._renumber_playlist(playlist_id, path, index)
+                    return True
+            self.conn.execute(
+                "UPDATE playlist_tracks SET position = ? WHERE playlist_id = ? AND path = ?",
+                (position, playlist_id, path)
+            )
+            return True
+
+    def _renumber_playlist(self, playlist_id: int, path: str, index: int):
+        """Give a playlist's tracks consecutive positions, with path at index."""
+        paths = [row[0] for row in self.conn.execute(
+            "SELECT path FROM playlist_tracks WHERE playlist_id = ? AND path != ? ORDER BY position",
+            (playlist_id, path)
+        )]
+        paths.insert(index, path)
+        self.conn.executemany(
+            "UPDATE playlist_tracks SET position = ? WHERE playlist_id = ? AND path = ?",
+            ((position, playlist_id, other) for position, other in enumerate(paths))
+        )
+
+    # ReplayGain
+
+    def get_replaygain(self, path: str) -> Optional[Dict]:
+        """Return the stored ReplayGain row of a track, or None if it was not read or analyzed yet."""
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM replaygain WHERE path = ?", (path,)).fetchone()
+        return self._track_dict(row) if row else None
+
+    def get_replaygain_rows(self, paths: Iterable[str]) -> Dict[str, Dict]:
+        """Return path -> stored ReplayGain row for the given tracks that have one."""
+        rows = {}
+        with self._lock:
+            for path in paths:
+                row = self.conn.execute("SELECT * FROM replaygain WHERE path = ?", (path,)).fetchone()
+                if row is not None:
+                    rows[path] = self._track_dict(row)
+        return rows
+
+    def get_replaygain_signatures(self) -> Dict[str, Tuple[int, float]]:
+        """Return path -> (size, mtime) of the files each ReplayGain row was made from."""
+        with self._lock:
+            rows = self.conn.execute("SELECT path, size, modified FROM replaygain").fetchall()
+        return {row['path']: (row['size'], row['modified']) for row in rows}
+
+    def store_replaygain(self, rows: Iterable[Dict]) -> int:
+        """Insert or replace ReplayGain rows keyed by path."""
+        values = [tuple(row.get(column) for column in REPLAYGAIN_COLUMNS) for row in rows]
+        if not values:
+            return 0
+        columns = ', '.join(REPLAYGAIN_COLUMNS)
+        placeholders = ', '.join('?' for _ in REPLAYGAIN_COLUMNS)
+        with self._lock, self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO replaygain ({columns}) VALUES ({placeholders})", values
+            )
+        return len(values)
+
+    def set_album_replaygain(self, paths: Iterable[str], gain: float, peak: float):
+        """Set the album gain and peak of the given tracks."""
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "UPDATE replaygain SET album_gain = ?, album_peak = ? WHERE path = ?",
+                ((gain, peak, path) for path in paths)
+            )
+
+    @staticmethod
+    def _track_row(track: Dict) -> Tuple:
+        """Convert a track dict into a row tuple matching TRACK_COLUMNS."""
+        row = dict(track)
+        if not row.get('folder'):
+            row['folder'] = os.path.dirname(row['path'])
+        if not row.get('filename'):
+            row['filename'] = os.path.basename(row['path'])
+        return tuple(row.get(column) for column in TRACK_COLUMNS)
+
+    @staticmethod
+    def _track_dict(row: sqlite3.Row) -> Dict:
+        """Convert a stored row into a track dict, dropping empty fields."""
+        return {key: row[key] for key in row.keys() if row[key] is not None}
@@ -0,0 +1,129 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import List, NamedTuple, Optional, Sequence
+
+from utils.file_utils import get_app_data_dir
+
+MAGIC = b'MLSN'
+VERSION = 2
+# Magic, version, byte order (0 little, 1 big), row count, section count
+HEADER = struct.Struct('<4sIIII')
+SECTION_LENGTH = struct.Struct('<Q')
+SECTION_COUNT = 7
+SEPARATOR = '\x00'
+
+
+class LibrarySnapshot(NamedTuple):
+    """Display columns of the library view, in row order."""
+    paths: List[str]
+    titles: List[str]
+    strings: List[str]  # Artist and album names and track numbers, referenced by id
+    artists: array  # Ids into strings
+    albums: array
+    lengths: array  # Whole seconds
+    track_numbers: array  # Ids into strings
+
+
+def default_snapshot_path() -> str:
+    """Return the location of the library view snapshot in the app data folder."""
+    return os.path.join(get_app_data_dir(), 'library.snapshot')
+
+
+def _join(strings: Sequence[str]) -> bytes:
+    return SEPARATOR.join(text.replace(SEPARATOR, '') for text in strings).encode('utf-8')
+
+
+def _split(data, count: int) -> List[str]:
+    if count == 0:
+        return []
+    return str(data, 'utf-8').split(SEPARATOR)
+
+
+def write_snapshot(snapshot: LibrarySnapshot, path: Optional[str] = None):
+    """Write the view columns to a snapshot file, replacing it atomically."""
+    path = path or default_snapshot_path()
+    sections = (
+        _join(snapshot.paths),
+        _join(snapshot.titles),
+        _join(snapshot.strings),
+        snapshot.artists.tobytes(),
+        snapshot.albums.tobytes(),
+        snapshot.lengths.tobytes(),
+        snapshot.track_numbers.tobytes(),
+    )
+    byte_order = 0 if sys.byteorder == 'little' else 1
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, byte_order, len(snapshot.paths), len(sections)))
+        f.write(struct.pack('<I', len(snapshot.strings)))
+        for section in sections:
+            f.write(SECTION_LENGTH.pack(len(section)))
+            f.write(section)
+    os.replace(temp_path, path)
+
+
+def read_snapshot(path: Optional[str] = None) -> Optional[LibrarySnapshot]:
+    """Load a snapshot written by write_snapshot(), or None if missing or unusable.
+
+    The file is memory-mapped and each column is decoded straight from the
+    mapping in one call, so loading cost does not grow with per-row work.
+    """
+    path = path or default_snapshot_path()
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            view = memoryview(data)
+            try:
+                return _parse(view)
+            finally:
+                # Views into the mapping must be gone before it is closed
+                view.release()
+    except (OSError, ValueError, struct.error, UnicodeDecodeError) as e:
+        if os.path.exists(path):
+            print(f"Ignoring library snapshot {path}: {e}")
+        return None
+
+
+def _parse(view: memoryview) -> Optional[LibrarySnapshot]:
+    magic, version, byte_order, rows, section_count = HEADER.unpack_from(view, 0)
+    native = 0 if sys.byteorder == 'little' else 1
+    if magic != MAGIC or version != VERSION or byte_order != native or section_count != SECTION_COUNT:
+        return None
+    offset = HEADER.size
+    (string_count,) = struct.unpack_from('<I', view, offset)
+    offset += 4
+
+    sections = []
+    try:
+        for _ in range(section_count):
+            (length,) = SECTION_LENGTH.unpack_from(view, offset)
+            offset += SECTION_LENGTH.size
+            if offset + length > len(view):
+                raise ValueError("truncated snapshot")
+            sections.append(view[offset:offset + length])
+            offset += length
+
+        columns = []
+        for section in sections[3:]:
+            column = array('I')
+            column.frombytes(section)
+            columns.append(column)
+        snapshot = LibrarySnapshot(
+            _split(sections[0], rows),
+            _split(sections[1], rows),
+            _split(sections[2], string_count),
+            *columns,
+        )
+    finally:
+        for section in sections:
+            section.release()
+
+    if not all(len(column) == rows for column in (snapshot.paths, snapshot.titles, *snapshot[3:])):
+        raise ValueError("column lengths do not match")
+    if len(snapshot.strings) != string_count:
+        raise ValueError("string table length does not match")
+    if rows and max(max(snapshot.artists), max(snapshot.albums), max(snapshot.track_numbers)) >= string_count:
+        raise ValueError("string id out of range")
+    return snapshot
@@ -0,0 +1,68 @@
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+from audio.waveform import Waveform
+from utils.file_utils import get_app_data_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS waveforms (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    modified REAL NOT NULL,
+    peaks BLOB NOT NULL,
+    rms BLOB NOT NULL
+);
+"""
+
+# Stored for tracks that could not be decoded, so they are not retried every session
+EMPTY_WAVEFORM = Waveform(b'', b'')
+
+
+def default_waveform_store_path() -> str:
+    """Return the location of the waveform cache in the app data folder."""
+    return os.path.join(get_app_data_dir(), 'waveforms.db')
+
+
+class WaveformStore:
+    """SQLite cache of track envelopes, valid while a file's size and mtime are unchanged.
+
+    Kept apart from the library catalog so it can be deleted without losing
+    anything but analysis time.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or default_waveform_store_path()
+        if self.db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self.conn.close()
+
+    def get(self, path: str, size: int, modified: float) -> Optional[Waveform]:
+        """Return the stored envelope if it matches the file signature, EMPTY_WAVEFORM if undecodable."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT size, modified, peaks, rms FROM waveforms WHERE path = ?", (path,)
+            ).fetchone()
+        if row is None or row[0] != size or row[1] != modified:
+            return None
+        return Waveform(bytes(row[2]), bytes(row[3]))
+
+    def put(self, path: str, size: int, modified: float, waveform: Optional[Waveform]):
+        """Store a track's envelope; None records that it could not be decoded."""
+        waveform = waveform or EMPTY_WAVEFORM
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO waveforms (path, size, modified, peaks, rms) VALUES (?, ?, ?, ?, ?)",
+                (path, size, modified, waveform.peaks, waveform.rms)
+            )
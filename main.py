@@ -4,18 +4,31 @@ import os
 # Add the app directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from utils.startup_timing import startup_timer
 from PyQt5.QtWidgets import QApplication
-from ui.main_window import MainWindow
+from PyQt5.QtCore import QTimer
 from ui.themes import ThemeManager
+startup_timer.mark("import Qt")
 
 def main():
     app = QApplication(sys.argv)
+    startup_timer.mark("create application")
     
     # Apply initial light theme
     ThemeManager.apply_theme(app, is_dark=False)
+    startup_timer.mark("apply theme")
+    
+    # Imported here so the timing report shows what the UI modules cost
+    from ui.main_window import MainWindow
+    startup_timer.mark("import main window")
     
     window = MainWindow()
+    startup_timer.mark("build window")
     window.show()
+    startup_timer.mark("show window")
+    
+    # Queued after the deferred library load, so the report covers it
+    QTimer.singleShot(0, startup_timer.report)
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
@@ -0,0 +1,78 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from PyQt5.QtCore import QCoreApplication
+
+from audio.metadata import MetadataReader
+from ui.metadata_loader import MetadataLoader
+
+
+class MetadataLoaderCancelTest(unittest.TestCase):
+    """Files loaded right after cancel() must not be dropped with the cancelled work."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+
+    def setUp(self):
+        self.release = threading.Event()  # Holds reads of the first batch until set
+        self.started = threading.Event()
+        self.emitted = []
+        self.finished = threading.Event()
+        self.cancelled = []
+        self.loader = MetadataLoader(workers=2, use_processes=False, batch_interval=0.01)
+        # Signals are queued to this thread, see wait_finished()
+        self.loader.batchReady.connect(lambda batch: self.emitted.extend(m['path'] for m in batch))
+        self.loader.finished.connect(self.on_finished)
+
+    def on_finished(self, cancelled):
+        self.cancelled.append(cancelled)
+        self.finished.set()
+
+    def wait_finished(self, timeout=10):
+        """Run the event loop until the loader reports it is done."""
+        deadline = time.monotonic() + timeout
+        while not self.finished.is_set() and time.monotonic() < deadline:
+            self.app.processEvents()
+            time.sleep(0.01)
+        self.app.processEvents()
+        return self.finished.is_set()
+
+    def read_metadata(self, path):
+        if path.startswith('/old/'):
+            self.started.set()
+            self.release.wait(5)
+        return {'path': path, 'title': path}
+
+    def test_load_after_cancel_while_reading(self):
+        old = [f'/old/{i}' for i in range(20)]
+        new = [f'/new/{i}' for i in range(20)]
+        with mock.patch.object(MetadataReader, 'read_metadata', side_effect=self.read_metadata):
+            self.loader.load(old)
+            self.assertTrue(self.started.wait(5))
+            self.loader.cancel()
+            self.loader.load(new)
+            self.release.set()
+            self.assertTrue(self.wait_finished())
+
+        self.assertEqual(sorted(self.emitted), sorted(new))
+        self.assertEqual(self.cancelled, [True])
+        self.assertFalse(self.loader.is_running())
+
+    def test_cancel_drops_running_reads(self):
+        old = [f'/old/{i}' for i in range(20)]
+        with mock.patch.object(MetadataReader, 'read_metadata', side_effect=self.read_metadata):
+            self.loader.load(old)
+            self.assertTrue(self.started.wait(5))
+            self.loader.cancel()
+            self.release.set()
+            self.assertTrue(self.wait_finished())
+
+        self.assertEqual(self.emitted, [])
+        self.assertEqual(self.cancelled, [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+
+from database.catalog import LibraryCatalog
+from utils.playlists import Playlist
+
+PATHS = [f'/music/{name}.mp3' for name in 'abcde']
+
+
+class PlaylistOrderTest(unittest.TestCase):
+    """Playlist order in memory and in the catalog, across moves, removals and reloads."""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.folder.name, 'library.db')
+        self.catalog = LibraryCatalog(self.db_path)
+        self.catalog.create_playlist('mix')
+        self.catalog.add_playlist_tracks('mix', PATHS)
+        self.playlist = Playlist('mix', PATHS)
+
+    def tearDown(self):
+        self.catalog.close()
+        self.folder.cleanup()
+
+    def move(self, path, index):
+        index = self.playlist.move(path, index)
+        self.catalog.move_playlist_track('mix', path, index)
+
+    def assertOrder(self, names):
+        expected = [f'/music/{name}.mp3' for name in names]
+        self.assertEqual(self.playlist.paths(), expected)
+        self.assertEqual(self.catalog.get_playlist_tracks('mix'), expected)
+
+    def test_move(self):
+        self.move('/music/e.mp3', 0)
+        self.assertOrder('eabcd')
+        self.move('/music/a.mp3', 3)
+        self.assertOrder('ebcad')
+        self.move('/music/e.mp3', 99)
+        self.assertOrder('bcade')
+        self.move('/music/d.mp3', 2)
+        self.assertOrder('bcdae')
+
+    def test_move_keeps_other_positions(self):
+        positions = dict(self.catalog.conn.execute("SELECT path, position FROM playlist_tracks"))
+        self.move('/music/d.mp3', 1)
+        moved = dict(self.catalog.conn.execute("SELECT path, position FROM playlist_tracks"))
+        changed = [path for path in PATHS if positions[path] != moved[path]]
+        self.assertEqual(changed, ['/music/d.mp3'])
+
+    def test_repeated_moves_into_one_gap(self):
+        for step in range(1200):
+            self.move('/music/c.mp3' if step % 2 else '/music/b.mp3', 1)
+        self.assertEqual(self.catalog.get_playlist_tracks('mix'), self.playlist.paths())
+
+    def test_remove(self):
+        self.assertTrue(self.playlist.remove('/music/b.mp3'))
+        self.assertFalse(self.playlist.remove('/music/b.mp3'))
+        self.assertEqual(self.catalog.remove_playlist_tracks('mix', ['/music/b.mp3']), 1)
+        self.assertOrder('acde')
+        self.move('/music/e.mp3', 1)
+        self.assertOrder('aecd')
+
+    def test_reload(self):
+        self.move('/music/c.mp3', 0)
+        self.playlist.remove('/music/a.mp3')
+        self.catalog.remove_playlist_tracks('mix', ['/music/a.mp3'])
+        self.move('/music/b.mp3', 3)
+        self.catalog.add_playlist_tracks('mix', ['/music/f.mp3'])
+        self.catalog.close()
+
+        self.catalog = LibraryCatalog(self.db_path)
+        reloaded = Playlist('mix', self.catalog.get_playlists()['mix'])
+        expected = [f'/music/{name}.mp3' for name in 'cdebf']
+        self.assertEqual(reloaded.paths(), expected)
+        self.assertEqual(self.catalog.get_playlist_tracks('mix'), expected)
+
+    def test_move_missing_track(self):
+        self.assertFalse(self.catalog.move_playlist_track('mix', '/music/z.mp3', 0))
+        self.assertOrder('abcde')
+
+
+if __name__ == '__main__':
+    unittest.main()
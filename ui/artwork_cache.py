@@ -0,0 +1,195 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from PyQt5.QtCore import QObject, Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+
+from audio.metadata import MetadataReader
+from utils.file_utils import get_app_data_dir
+
+THUMBNAIL_SIZE = 256  # Edge of the thumbnails kept on disk, in pixels
+PIXMAP_CACHE_BYTES = 16 * 1024 * 1024
+ARTWORK_WORKERS = 2
+
+_NOT_READ = object()
+
+
+def default_thumbnail_dir() -> str:
+    """Return the folder holding cached artwork thumbnails."""
+    path = os.path.join(get_app_data_dir(), 'artwork')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class ArtworkCache(QObject):
+    """Embedded cover art, decoded and downscaled on worker threads.
+
+    Images are identified by the hash of their encoded bytes, so every track
+    of an album shares one decode, one thumbnail file on disk and one pixmap
+    in memory. pixmap() never blocks: on a miss it queues the track and
+    artworkReady is emitted once its art can be shown.
+    """
+    artworkReady = pyqtSignal(str)  # Track path
+    _decoded = pyqtSignal(str, object, list)  # Image hash, QImage, track paths
+
+    def __init__(self, thumbnail_dir: Optional[str] = None,
+                 max_bytes: int = PIXMAP_CACHE_BYTES, parent=None):
+        super().__init__(parent)
+        self.thumbnail_dir = thumbnail_dir or default_thumbnail_dir()
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=ARTWORK_WORKERS, thread_name_prefix='artwork')
+        self._lock = threading.Lock()
+        self._key_of: Dict[str, Optional[str]] = {}  # path -> image hash, None without art
+        self._requested = set()  # Paths queued or being read
+        self._decoding: Dict[str, List[str]] = {}  # hash -> paths waiting for its decode
+        self._loaded = set()  # Hashes with a full-size pixmap in memory
+
+        # (hash, size) -> QPixmap, least recently used first; GUI thread only
+        self._pixmaps: "OrderedDict[tuple, QPixmap]" = OrderedDict()
+        self._bytes = 0
+        self._decoded.connect(self._on_decoded, Qt.QueuedConnection)
+
+    def pixmap(self, track_path: str, size: int = THUMBNAIL_SIZE) -> Optional[QPixmap]:
+        """Return a track's art scaled to fit size, or None if missing or still loading."""
+        with self._lock:
+            key = self._key_of.get(track_path, _NOT_READ)
+        if key is None:
+            return None
+        if key is not _NOT_READ:
+            pixmap = self._get((key, size))
+            if pixmap is not None:
+                return pixmap
+            full = self._get((key, THUMBNAIL_SIZE))
+            if full is not None:
+                pixmap = full.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+                self._put((key, size), pixmap)
+                return pixmap
+        self.request(track_path)
+        return None
+
+    def request(self, track_path: str):
+        """Queue a track's art to be loaded in the background."""
+        with self._lock:
+            if track_path in self._requested:
+                return
+            self._requested.add(track_path)
+        self._executor.submit(self._load, track_path)
+
+    def shutdown(self):
+        """Drop queued work; running reads finish in the background."""
+        try:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        except TypeError:
+            # Python 3.8 has no cancel_futures; queued reads still run
+            self._executor.shutdown(wait=False)
+
+    def _thumbnail_path(self, key: str) -> str:
+        return os.path.join(self.thumbnail_dir, key + '.jpg')
+
+    def _load(self, track_path: str):
+        """Worker: find the track's image hash and decode it unless already loaded."""
+        try:
+            with self._lock:
+                key = self._key_of.get(track_path, _NOT_READ)
+            data = None
+            if key is _NOT_READ:
+                data = MetadataReader.read_artwork(track_path)
+                key = hashlib.sha1(data).hexdigest() if data else None
+
+            with self._lock:
+                self._key_of[track_path] = key
+                if key is None:
+                    self._requested.discard(track_path)
+                    return
+                if key in self._loaded:
+                    self._requested.discard(track_path)
+                    loaded = True
+                elif key in self._decoding:
+                    # Another track of the same album is decoding this image
+                    self._decoding[key].append(track_path)
+                    return
+                else:
+                    self._decoding[key] = [track_path]
+                    loaded = False
+            if loaded:
+                self._decoded.emit(key, None, [track_path])
+                return
+
+            image = self._read_thumbnail(key, data, track_path)
+            with self._lock:
+                paths = self._decoding.pop(key, [])
+                self._requested.difference_update(paths)
+                if image is None:
+                    for path in paths:
+                        self._key_of[path] = None
+                    return
+            self._decoded.emit(key, image, paths)
+        except Exception as e:
+            print(f"Error loading artwork for {track_path}: {e}")
+            with self._lock:
+                self._requested.discard(track_path)
+
+    def _read_thumbnail(self, key: str, data: Optional[bytes], track_path: str) -> Optional[QImage]:
+        """Worker: load the cached thumbnail, or decode, downscale and store the image."""
+        thumbnail_path = self._thumbnail_path(key)
+        if os.path.exists(thumbnail_path):
+            image = QImage(thumbnail_path)
+            if not image.isNull():
+                return image
+        if data is None:
+            data = MetadataReader.read_artwork(track_path)
+            if not data:
+                return None
+        image = QImage.fromData(data)
+        if image.isNull():
+            return None
+        if image.width() > THUMBNAIL_SIZE or image.height() > THUMBNAIL_SIZE:
+            image = image.scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        # Write then rename so a partly written file is never read back
+        temp_path = thumbnail_path + '.tmp'
+        if image.save(temp_path, 'JPG', 90):
+            os.replace(temp_path, thumbnail_path)
+        return image
+
+    def _on_decoded(self, key: str, image, paths: List[str]):
+        """GUI thread: turn a decoded image into a cached pixmap and notify."""
+        if image is not None:
+            self._put((key, THUMBNAIL_SIZE), QPixmap.fromImage(image))
+        elif self._get((key, THUMBNAIL_SIZE)) is None:
+            # Evicted since the worker checked; read the thumbnail again
+            for path in paths:
+                self.request(path)
+            return
+        for path in paths:
+            self.artworkReady.emit(path)
+
+    def _get(self, cache_key: tuple) -> Optional[QPixmap]:
+        pixmap = self._pixmaps.get(cache_key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(cache_key)
+        return pixmap
+
+    def _put(self, cache_key: tuple, pixmap: QPixmap):
+        """Add a pixmap, evicting the least recently used ones over the byte budget."""
+        old = self._pixmaps.pop(cache_key, None)
+        if old is not None:
+            self._bytes -= self._pixmap_bytes(old)
+        self._pixmaps[cache_key] = pixmap
+        self._bytes += self._pixmap_bytes(pixmap)
+        if cache_key[1] == THUMBNAIL_SIZE:
+            with self._lock:
+                self._loaded.add(cache_key[0])
+        while len(self._pixmaps) > 1 and self._bytes > self.max_bytes:
+            evicted_key, evicted = self._pixmaps.popitem(last=False)
+            self._bytes -= self._pixmap_bytes(evicted)
+            if evicted_key[1] == THUMBNAIL_SIZE:
+                with self._lock:
+                    self._loaded.discard(evicted_key[0])
+
+    @staticmethod
+    def _pixmap_bytes(pixmap: QPixmap) -> int:
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
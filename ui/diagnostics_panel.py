@@ -0,0 +1,121 @@
+import os
+
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QCheckBox,
+                             QTableWidget, QTableWidgetItem, QHeaderView, QFileDialog,
+                             QLineEdit, QLabel, QMessageBox)
+from PyQt5.QtCore import Qt, QTimer
+
+from audio.metadata import MetadataReader
+from utils import profiling
+from utils.file_utils import get_app_data_dir
+
+REFRESH_MS = 1000
+COLUMNS = ['Span / counter', 'Count', 'Total ms', 'Mean ms', 'p95 ms', 'Max ms']
+
+
+class DiagnosticsPanel(QDialog):
+    """Live view of the profiling spans and counters, with export and cProfile controls."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Diagnostics")
+        self.resize(640, 420)
+        layout = QVBoxLayout(self)
+
+        controls = QHBoxLayout()
+        self.record_box = QCheckBox("Record spans")
+        self.record_box.setChecked(profiling.is_enabled())
+        self.record_box.toggled.connect(profiling.set_enabled)
+        controls.addWidget(self.record_box)
+        controls.addWidget(QLabel("cProfile spans:"))
+        self.profiled_edit = QLineEdit(os.environ.get(profiling.CPROFILE_ENV, ''))
+        self.profiled_edit.setPlaceholderText("e.g. search.filter,player.load_track or all")
+        self.profiled_edit.editingFinished.connect(self.update_profiled_spans)
+        controls.addWidget(self.profiled_edit)
+        layout.addLayout(controls)
+
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.verticalHeader().hide()
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        for text, slot in (("Reset", self.reset), ("Export JSON...", self.export),
+                           ("Dump cProfile...", self.dump_profile)):
+            button = QPushButton(text)
+            button.clicked.connect(slot)
+            buttons.addWidget(button)
+        buttons.addStretch()
+        layout.addLayout(buttons)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.refresh_timer.start()
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        """Show the current spans, counters and metadata cache statistics."""
+        report = profiling.snapshot()
+        rows = []
+        for name, stats in report['spans'].items():
+            rows.append([name, stats['count'], stats['total_ms'], stats['mean_ms'],
+                         stats['p95_ms'], stats['max_ms']])
+        for name, value in report['counters'].items():
+            rows.append([name, value])
+        for name, value in MetadataReader.cache.stats().items():
+            rows.append([f"metadata_cache.{name}", round(value, 3) if isinstance(value, float) else value])
+
+        self.table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                text = f"{value:.2f}" if isinstance(value, float) and column > 1 else str(value)
+                item = QTableWidgetItem(text)
+                if column:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, column, item)
+
+    def update_profiled_spans(self):
+        names = {name.strip() for name in self.profiled_edit.text().split(',') if name.strip()}
+        profiling.set_profiled_spans(names)
+
+    def reset(self):
+        profiling.reset()
+        self.refresh()
+
+    def export(self):
+        """Save the spans and counters as JSON."""
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export Diagnostics", os.path.join(get_app_data_dir(), 'diagnostics.json'),
+            "JSON files (*.json)"
+        )
+        if path:
+            try:
+                profiling.export(path)
+            except OSError as e:
+                QMessageBox.warning(self, "Error", f"Error exporting diagnostics: {e}")
+
+    def dump_profile(self):
+        """Save the cProfile stats collected for the profiled spans."""
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Dump cProfile Stats", os.path.join(get_app_data_dir(), 'profile.pstats'),
+            "pstats files (*.pstats)"
+        )
+        if not path:
+            return
+        try:
+            dumped = profiling.dump_profile(path)
+        except OSError as e:
+            QMessageBox.warning(self, "Error", f"Error writing profile: {e}")
+            return
+        if not dumped:
+            QMessageBox.information(self, "Diagnostics", "No profiled spans have run yet")
@@ -0,0 +1,79 @@
+import os
+from typing import Dict, List
+
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
+                             QTreeWidget, QTreeWidgetItem, QHeaderView, QMessageBox)
+from PyQt5.QtCore import Qt
+
+from .library_model import display_values
+
+ACTION_REMOVE = 1  # Forget the checked copies, leave the files alone
+ACTION_TRASH = 2  # Move the checked copies to the trash and forget them
+
+
+class DuplicatesDialog(QDialog):
+    """Lists groups of identical tracks; every copy but the first is checked for removal."""
+
+    def __init__(self, groups: List[List[str]], tracks: Dict[str, Dict], parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Duplicate Tracks")
+        self.resize(760, 480)
+        self.action = None
+        layout = QVBoxLayout(self)
+
+        copies = sum(len(group) - 1 for group in groups)
+        layout.addWidget(QLabel(f"{len(groups)} tracks have {copies} extra copies. "
+                                "Checked copies are removed."))
+
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels(["Track", "Size"])
+        self.tree.header().setSectionResizeMode(0, QHeaderView.Stretch)
+        for group in groups:
+            title, artist, _, _ = display_values(tracks.get(group[0]) or {'filename': os.path.basename(group[0])})
+            parent_item = QTreeWidgetItem([f"{artist} - {title} ({len(group)} copies)"])
+            for number, path in enumerate(group):
+                size = (tracks.get(path) or {}).get('size') or 0
+                child = QTreeWidgetItem([path, f"{size / (1024 * 1024):.1f} MB"])
+                child.setData(0, Qt.UserRole, path)
+                child.setFlags(child.flags() | Qt.ItemIsUserCheckable)
+                child.setCheckState(0, Qt.Checked if number else Qt.Unchecked)
+                parent_item.addChild(child)
+            self.tree.addTopLevelItem(parent_item)
+        self.tree.expandAll()
+        layout.addWidget(self.tree)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        remove_button = QPushButton("Remove from Library")
+        remove_button.clicked.connect(lambda: self.finish(ACTION_REMOVE))
+        buttons.addWidget(remove_button)
+        trash_button = QPushButton("Move to Trash")
+        trash_button.clicked.connect(lambda: self.finish(ACTION_TRASH))
+        buttons.addWidget(trash_button)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.reject)
+        buttons.addWidget(close_button)
+        layout.addLayout(buttons)
+
+    def checked_paths(self) -> List[str]:
+        """Return the copies checked for removal."""
+        paths = []
+        for row in range(self.tree.topLevelItemCount()):
+            group = self.tree.topLevelItem(row)
+            for index in range(group.childCount()):
+                child = group.child(index)
+                if child.checkState(0) == Qt.Checked:
+                    paths.append(child.data(0, Qt.UserRole))
+        return paths
+
+    def finish(self, action: int):
+        """Accept with an action, after confirming moves to the trash."""
+        paths = self.checked_paths()
+        if not paths:
+            return
+        if action == ACTION_TRASH and QMessageBox.question(
+            self, "Move to Trash", f"Move {len(paths)} files to the trash?"
+        ) != QMessageBox.Yes:
+            return
+        self.action = action
+        self.accept()
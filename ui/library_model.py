@@ -0,0 +1,610 @@
+import re
+from array import array
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QAbstractProxyModel, QModelIndex
+from PyQt5.QtGui import QPixmap
+
+from database.snapshot import LibrarySnapshot
+from utils import profiling
+
+HEADERS = ['Title', 'Artist', 'Album', 'Duration']
+TITLE_COLUMN, ARTIST_COLUMN, ALBUM_COLUMN, DURATION_COLUMN = range(len(HEADERS))
+TRACK_NUMBER_KEY = len(HEADERS)  # Sort key for the track number, which has no column of its own
+# Keys that break ties when sorting by a column, most significant first
+SORT_TIEBREAKS = {
+    TITLE_COLUMN: (ARTIST_COLUMN, ALBUM_COLUMN),
+    ARTIST_COLUMN: (ALBUM_COLUMN, TRACK_NUMBER_KEY, TITLE_COLUMN),
+    ALBUM_COLUMN: (TRACK_NUMBER_KEY, TITLE_COLUMN),
+    DURATION_COLUMN: (TITLE_COLUMN,),
+}
+ARTICLES = ('the ',)  # Leading words ignored when sorting names
+ARTWORK_ICON_SIZE = 16  # Cover art shown next to titles, in pixels
+REMOVE_RESET_RUNS = 32  # Scattered removals with more runs than this reset the model once
+
+
+def format_duration(seconds: float) -> str:
+    """Format duration in seconds to MM:SS format."""
+    minutes = int(seconds) // 60
+    seconds = int(seconds) % 60
+    return f"{minutes}:{seconds:02d}"
+
+
+def display_values(track: Dict) -> tuple:
+    """Return the (title, artist, album, whole seconds) a row shows for a track."""
+    return (
+        track.get('title') or track.get('filename') or 'Unknown Title',
+        track.get('artist') or 'Unknown Artist',
+        track.get('album') or 'Unknown Album',
+        int(track.get('length') or 0),
+    )
+
+
+def row_values(track: Dict) -> tuple:
+    """Return everything a row stores for a track: the display values and the track number."""
+    return display_values(track) + (track.get('track_number') or '',)
+
+
+def collation_key(text: str) -> str:
+    """Return the sort key of a name: casefolded, without a leading article."""
+    key = text.casefold()
+    for article in ARTICLES:
+        if key.startswith(article) and len(key) > len(article):
+            return key[len(article):]
+    return key
+
+
+def natural_key(text: str) -> Tuple:
+    """Return a key ordering track numbers naturally, so '2' < '10' and '3/12' sorts as 3."""
+    parts = re.split(r'(\d+)', text.split('/')[0].strip().casefold())
+    # Alternating text and digit runs, paired so every key has the same shape
+    return tuple(
+        (parts[i], int(parts[i + 1]) if i + 1 < len(parts) else -1)
+        for i in range(0, len(parts), 2)
+    )
+
+
+class StringTable:
+    """Interns repeated strings so each distinct value is stored once."""
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    def intern(self, text: str) -> int:
+        """Return the id of a string, adding it to the table if new."""
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(text)
+            self.ids[text] = string_id
+        return string_id
+
+    def __getitem__(self, string_id: int) -> str:
+        return self.strings[string_id]
+
+    @classmethod
+    def from_list(cls, strings: List[str]) -> 'StringTable':
+        """Build a table whose ids are the positions in a list of distinct strings."""
+        table = cls()
+        table.strings = strings
+        table.ids = {text: string_id for string_id, text in enumerate(strings)}
+        return table
+
+
+class LibraryModel(QAbstractTableModel):
+    """Table model for the library backed by parallel column arrays.
+
+    Rows are never materialized as items: data() builds display values on
+    demand from the columns. Artist and album names and track numbers are
+    interned, since a library repeats them across many tracks.
+
+    Sorting uses cached collation keys: one per title, kept with the row,
+    and one per interned string, from which a rank per distinct name is
+    derived. Sorting by artist or album then compares small integers.
+    """
+
+    LIST_COLUMNS = ('paths', 'titles', '_title_keys')
+    ARRAY_COLUMNS = ('artists', 'albums', 'lengths', 'track_numbers')
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.strings = StringTable()
+        self.paths: List[str] = []
+        self.titles: List[str] = []
+        self.artists = array('I')  # Ids into self.strings
+        self.albums = array('I')
+        self.lengths = array('I')  # Whole seconds
+        self.track_numbers = array('I')  # Ids into self.strings, '' when unknown
+        self._title_keys: List[Optional[str]] = []  # collation_key(title), None until needed
+        self._string_keys: List[str] = []  # collation_key() of self.strings, extended on demand
+        self._string_ranks: Optional[List[int]] = None  # Sort rank per string id, equal keys share one
+        self._row_of: Dict[str, int] = {}  # path -> row, kept in step with self.paths
+        self._path_snapshot: Optional[tuple] = None
+        self.artwork = None  # Optional ui.artwork_cache.ArtworkCache for title icons
+        self._blank_icon: Optional[QPixmap] = None
+
+    # Qt model interface
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole or role == Qt.ToolTipRole:
+            column = index.column()
+            if column == TITLE_COLUMN:
+                return self.titles[row]
+            if column == ARTIST_COLUMN:
+                return self.strings[self.artists[row]]
+            if column == ALBUM_COLUMN:
+                return self.strings[self.albums[row]]
+            if column == DURATION_COLUMN:
+                return format_duration(self.lengths[row])
+        elif role == Qt.UserRole:
+            return self.paths[row]
+        elif role == Qt.DecorationRole:
+            if index.column() == TITLE_COLUMN and self.artwork is not None:
+                # Art is requested for visible rows only, as the view asks for them
+                return self.artwork.pixmap(self.paths[row], ARTWORK_ICON_SIZE) or self._blank()
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return HEADERS[section]
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Sort all rows by a column, breaking ties with the columns that usually go with it."""
+        if not 0 <= column < len(HEADERS):
+            return
+        self.sort_by([(column, order)] + [(key, Qt.AscendingOrder) for key in SORT_TIEBREAKS[column]])
+
+    def sort_by(self, keys: Sequence[Tuple[int, int]]):
+        """Sort all rows by several (column, order) keys, the first one most significant.
+
+        Each key is one pass of Python's stable sort, least significant
+        first, so rows equal on every key keep their current order.
+        """
+        with profiling.span('model.sort'):
+            rows = list(range(len(self.paths)))
+            for column, order in reversed(keys):
+                rows.sort(key=self._sort_keys(column).__getitem__,
+                          reverse=order == Qt.DescendingOrder)
+        self.apply_row_order(rows)
+
+    # Library interface
+
+    def add_tracks(self, tracks: Iterable[Dict]) -> int:
+        """Append new tracks in one insert and refresh rows already present."""
+        new_tracks = []
+        for track in tracks:
+            row = self._row_of.get(track['path'])
+            if row is None:
+                new_tracks.append(track)
+            else:
+                self._set_row(row, track)
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(HEADERS) - 1))
+
+        # The same path may appear twice within one batch
+        unique = {}
+        for track in new_tracks:
+            unique[track['path']] = track
+        if not unique:
+            return 0
+
+        first = len(self.paths)
+        self._path_snapshot = None
+        with profiling.span('model.insert'):
+            self.beginInsertRows(QModelIndex(), first, first + len(unique) - 1)
+            for row, track in enumerate(unique.values(), first):
+                self.paths.append(track['path'])
+                self.titles.append('')
+                self.artists.append(0)
+                self.albums.append(0)
+                self.lengths.append(0)
+                self.track_numbers.append(0)
+                self._title_keys.append(None)
+                self._row_of[track['path']] = row
+                self._set_row(row, track)
+            self.endInsertRows()
+        profiling.count('model.rows_inserted', len(unique))
+        return len(unique)
+
+    def remove_paths(self, paths: Iterable[str]) -> int:
+        """Remove the rows showing the given tracks."""
+        rows = sorted({self._row_of[path] for path in paths if path in self._row_of})
+        if not rows:
+            return 0
+
+        # Remove contiguous runs from the bottom up so row numbers stay valid
+        runs = []
+        start = end = rows[0]
+        for row in rows[1:]:
+            if row == end + 1:
+                end = row
+            else:
+                runs.append((start, end))
+                start = end = row
+        runs.append((start, end))
+
+        self._path_snapshot = None
+        if len(runs) > REMOVE_RESET_RUNS:
+            # One reset is cheaper for views than many separate removals
+            self.beginResetModel()
+            removed = set(rows)
+            keep = [row for row in range(len(self.paths)) if row not in removed]
+            self._reorder_columns(keep)
+            self._row_of = {path: row for row, path in enumerate(self.paths)}
+            self.endResetModel()
+            return len(rows)
+
+        for start, end in reversed(runs):
+            for path in self.paths[start:end + 1]:
+                del self._row_of[path]
+            self.beginRemoveRows(QModelIndex(), start, end)
+            for column in self._columns():
+                del column[start:end + 1]
+            self.endRemoveRows()
+
+        # Only rows below the first removed one moved
+        row_of = self._row_of
+        for row in range(rows[0], len(self.paths)):
+            row_of[self.paths[row]] = row
+        return len(rows)
+
+    def apply_row_order(self, rows: List[int]):
+        """Reorder the rows so that new row i shows old row rows[i]."""
+        self.layoutAboutToBeChanged.emit()
+        self._path_snapshot = None
+        self._reorder_columns(rows)
+
+        new_row = [0] * len(rows)
+        for new, old in enumerate(rows):
+            new_row[old] = new
+        persistent = self.persistentIndexList()
+        self.changePersistentIndexList(
+            persistent,
+            [self.index(new_row[index.row()], index.column()) for index in persistent]
+        )
+        self._row_of = {path: row for row, path in enumerate(self.paths)}
+        self.layoutChanged.emit()
+
+    def path_snapshot(self) -> tuple:
+        """Return the paths in row order, reusing one tuple until the rows change."""
+        if self._path_snapshot is None:
+            self._path_snapshot = tuple(self.paths)
+        return self._path_snapshot
+
+    def path_at(self, row: int) -> Optional[str]:
+        """Return the path shown in a row."""
+        if 0 <= row < len(self.paths):
+            return self.paths[row]
+        return None
+
+    def contains(self, path: str) -> bool:
+        """Return True if a track is shown in the model."""
+        return path in self._row_of
+
+    def row_of(self, path: str) -> Optional[int]:
+        """Return the row showing a track, or None."""
+        return self._row_of.get(path)
+
+    def artwork_changed(self, path: str):
+        """Repaint the title icon of a track whose art finished loading."""
+        row = self._row_of.get(path)
+        if row is not None:
+            index = self.index(row, TITLE_COLUMN)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def row_text(self, row: int) -> List[str]:
+        """Return the display text of every column in a row."""
+        return [self.data(self.index(row, column)) for column in range(len(HEADERS))]
+
+    def load_snapshot(self, snapshot: LibrarySnapshot):
+        """Replace all rows with the columns of a saved snapshot, in one reset."""
+        self.beginResetModel()
+        self.strings = StringTable.from_list(snapshot.strings)
+        self.paths = snapshot.paths
+        self.titles = snapshot.titles
+        self.artists = snapshot.artists
+        self.albums = snapshot.albums
+        self.lengths = snapshot.lengths
+        self.track_numbers = snapshot.track_numbers
+        self._title_keys = [None] * len(self.paths)
+        self._string_keys = []
+        self._string_ranks = None
+        self._row_of = {path: row for row, path in enumerate(self.paths)}
+        self._path_snapshot = None
+        self.endResetModel()
+
+    def to_snapshot(self) -> LibrarySnapshot:
+        """Return the current columns, in row order, for saving."""
+        return LibrarySnapshot(
+            self.paths, self.titles, self.strings.strings,
+            self.artists, self.albums, self.lengths, self.track_numbers,
+        )
+
+    def _set_row(self, row: int, track: Dict):
+        """Store the display values of a track in a row."""
+        title, artist, album, length, track_number = row_values(track)
+        self.titles[row] = title
+        self._title_keys[row] = collation_key(title)
+        self.artists[row] = self.strings.intern(artist)
+        self.albums[row] = self.strings.intern(album)
+        self.lengths[row] = length
+        self.track_numbers[row] = self.strings.intern(track_number)
+
+    def _sort_keys(self, column: int) -> Sequence:
+        """Return a key per row for sorting by a column or TRACK_NUMBER_KEY."""
+        if column == DURATION_COLUMN:
+            return self.lengths
+        if column == TITLE_COLUMN:
+            if None in self._title_keys:
+                # Rows loaded from a snapshot get their keys on the first sort
+                self._title_keys = [
+                    key if key is not None else collation_key(title)
+                    for key, title in zip(self._title_keys, self.titles)
+                ]
+            return self._title_keys
+        if column == TRACK_NUMBER_KEY:
+            # Few distinct track numbers; unknown ones sort last
+            strings = self.strings
+            distinct = sorted(set(self.track_numbers),
+                              key=lambda string_id: (not strings[string_id], natural_key(strings[string_id])))
+            rank = {string_id: position for position, string_id in enumerate(distinct)}
+            return [rank[string_id] for string_id in self.track_numbers]
+        ranks = self._ranks()
+        ids = self.artists if column == ARTIST_COLUMN else self.albums
+        return [ranks[string_id] for string_id in ids]
+
+    def _ranks(self) -> List[int]:
+        """Return the sort rank of every interned string, recomputed only when strings were added."""
+        strings = self.strings.strings
+        if self._string_ranks is not None and len(self._string_ranks) == len(strings):
+            return self._string_ranks
+        keys = self._string_keys
+        keys.extend(collation_key(text) for text in strings[len(keys):])
+        ranks = [0] * len(keys)
+        rank = -1
+        previous = None
+        for string_id in sorted(range(len(keys)), key=keys.__getitem__):
+            if keys[string_id] != previous:
+                rank += 1
+                previous = keys[string_id]
+            ranks[string_id] = rank
+        self._string_ranks = ranks
+        return ranks
+
+    def _reorder_columns(self, rows: List[int]):
+        """Rebuild every column so that new row i holds old row rows[i]."""
+        # One itemgetter gathers a whole column in C; it returns a bare value for one row
+        pick = itemgetter(*rows) if len(rows) > 1 else (lambda column: [column[row] for row in rows])
+        for name in self.LIST_COLUMNS:
+            setattr(self, name, list(pick(getattr(self, name))))
+        for name in self.ARRAY_COLUMNS:
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, pick(column)))
+
+    def _blank(self) -> QPixmap:
+        """Return a transparent icon keeping titles aligned in rows without art."""
+        if self._blank_icon is None:
+            self._blank_icon = QPixmap(ARTWORK_ICON_SIZE, ARTWORK_ICON_SIZE)
+            self._blank_icon.fill(Qt.transparent)
+        return self._blank_icon
+
+    def _columns(self):
+        return tuple(getattr(self, name) for name in self.LIST_COLUMNS + self.ARRAY_COLUMNS)
+
+
+class LibraryFilterModel(QAbstractProxyModel):
+    """Proxy showing a subset of library rows, in the order they were given.
+
+    A filter is applied in one step from a list of source rows, so the cost
+    depends on the number of matches rather than on the library size. With
+    no filter set, rows map one to one onto the source model.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows: Optional[List[int]] = None  # Proxy row -> source row, None when unfiltered
+        self._proxy_of: Optional[Dict[int, int]] = None  # Built on first mapFromSource
+        self._ranked = False  # Ranked rows keep their given order across source sorts
+        self._layout_paths: List[Optional[str]] = []
+
+    def setSourceModel(self, model):
+        self.beginResetModel()
+        super().setSourceModel(model)
+        model.modelAboutToBeReset.connect(self._on_source_about_to_be_reset)
+        model.modelReset.connect(self._on_source_reset)
+        model.rowsAboutToBeInserted.connect(self._on_rows_about_to_be_inserted)
+        model.rowsInserted.connect(self._on_rows_inserted)
+        model.rowsAboutToBeRemoved.connect(self._on_rows_about_to_be_removed)
+        model.rowsRemoved.connect(self._on_rows_removed)
+        model.layoutAboutToBeChanged.connect(self._on_layout_about_to_be_changed)
+        model.layoutChanged.connect(self._on_layout_changed)
+        model.dataChanged.connect(self._on_data_changed)
+        self.endResetModel()
+
+    def is_filtered(self) -> bool:
+        """Return True while only a subset of the rows is shown."""
+        return self._rows is not None
+
+    def set_source_rows(self, rows: Optional[List[int]], ranked: bool = False):
+        """Show exactly the given source rows, in order, or every row for None.
+
+        Unless ``ranked`` is set, the rows follow the source order when the
+        source model is sorted again.
+        """
+        self.beginResetModel()
+        self._rows = list(rows) if rows is not None else None
+        self._ranked = ranked
+        self._proxy_of = None
+        self.endResetModel()
+
+    # Qt proxy interface
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not (0 <= row < self.rowCount()) or not (0 <= column < self.columnCount()):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=None):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() or self.sourceModel() is None:
+            return 0
+        if self._rows is None:
+            return self.sourceModel().rowCount()
+        return len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid() or self.sourceModel() is None:
+            return 0
+        return self.sourceModel().columnCount()
+
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid():
+            return QModelIndex()
+        row = proxy_index.row()
+        if self._rows is not None:
+            row = self._rows[row]
+        return self.sourceModel().index(row, proxy_index.column())
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid():
+            return QModelIndex()
+        row = source_index.row()
+        if self._rows is not None:
+            if self._proxy_of is None:
+                self._proxy_of = {source: proxy for proxy, source in enumerate(self._rows)}
+            row = self._proxy_of.get(row)
+            if row is None:
+                return QModelIndex()
+        return self.createIndex(row, source_index.column())
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        return self.sourceModel().headerData(section, orientation, role)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sourceModel().sort(column, order)
+
+    # Source model signals
+
+    def _on_source_about_to_be_reset(self):
+        self.beginResetModel()
+        self._remember_rows()
+
+    def _on_source_reset(self):
+        # Keep the filter, e.g. across the reset a large removal triggers
+        self._restore_rows()
+        self.endResetModel()
+
+    def _on_rows_about_to_be_inserted(self, parent, first, last):
+        if self._rows is None:
+            self.beginInsertRows(QModelIndex(), first, last)
+
+    def _on_rows_inserted(self, parent, first, last):
+        # Appended rows stay hidden while filtered, until the filter is reapplied
+        if self._rows is None:
+            self.endInsertRows()
+
+    def _on_rows_about_to_be_removed(self, parent, first, last):
+        if self._rows is None:
+            self.beginRemoveRows(QModelIndex(), first, last)
+        else:
+            self.beginResetModel()
+
+    def _on_rows_removed(self, parent, first, last):
+        if self._rows is None:
+            self.endRemoveRows()
+            return
+        removed = last - first + 1
+        self._rows = [
+            row if row < first else row - removed
+            for row in self._rows if not first <= row <= last
+        ]
+        self._proxy_of = None
+        self.endResetModel()
+
+    def _on_layout_about_to_be_changed(self):
+        self.layoutAboutToBeChanged.emit()
+        # Remember rows by path, source row numbers change with the layout
+        source = self.sourceModel()
+        self._layout_paths = [
+            source.path_at(self.mapToSource(index).row())
+            for index in self.persistentIndexList()
+        ]
+        self._remember_rows()
+
+    def _on_layout_changed(self):
+        source = self.sourceModel()
+        self._restore_rows()
+
+        persistent = self.persistentIndexList()
+        updated = []
+        for index, path in zip(persistent, self._layout_paths):
+            source_row = source.row_of(path) if path is not None else None
+            if source_row is None:
+                updated.append(QModelIndex())
+            else:
+                updated.append(self.mapFromSource(source.index(source_row, index.column())))
+        self.changePersistentIndexList(persistent, updated)
+        self._layout_paths = []
+        self.layoutChanged.emit()
+
+    def _remember_rows(self):
+        """Swap the filtered source rows for their paths before rows move."""
+        if self._rows is not None:
+            path_at = self.sourceModel().path_at
+            self._rows = [path_at(row) for row in self._rows]
+
+    def _restore_rows(self):
+        """Map remembered paths back to source rows, dropping removed tracks."""
+        if self._rows is not None:
+            row_of = self.sourceModel().row_of
+            rows = [row_of(path) for path in self._rows]
+            self._rows = [row for row in rows if row is not None]
+            if not self._ranked:
+                self._rows.sort()
+        self._proxy_of = None
+
+    def _on_data_changed(self, top_left, bottom_right, roles=None):
+        roles = roles or []
+        first, last = top_left.row(), bottom_right.row()
+        if self._rows is None:
+            self.dataChanged.emit(
+                self.index(first, top_left.column()),
+                self.index(last, bottom_right.column()),
+                roles
+            )
+            return
+        if last - first + 1 > len(self._rows):
+            proxy_rows = [proxy for proxy, row in enumerate(self._rows) if first <= row <= last]
+        else:
+            if self._proxy_of is None:
+                self._proxy_of = {source: proxy for proxy, source in enumerate(self._rows)}
+            proxy_rows = sorted(
+                proxy for proxy in map(self._proxy_of.get, range(first, last + 1))
+                if proxy is not None
+            )
+        # Emit each contiguous run of shown rows once
+        start = end = None
+        for row in proxy_rows + [None]:
+            if start is not None and row == end + 1:
+                end = row
+                continue
+            if start is not None:
+                self.dataChanged.emit(
+                    self.index(start, top_left.column()),
+                    self.index(end, bottom_right.column()),
+                    roles
+                )
+            start = end = row
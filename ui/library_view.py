@@ -1,21 +1,107 @@
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QPushButton, QTreeView, 
                             QFileDialog, QMessageBox, QLabel, QHBoxLayout, 
                             QFrame, QSplitter, QInputDialog, QListWidget,
-                            QMenu, QAction)
-from PyQt5.QtCore import Qt, QSize
-from PyQt5.QtGui import QStandardItemModel, QStandardItem, QFont, QIcon
+                            QMenu, QAction, QProgressBar, QDialog, QListWidgetItem)
+from PyQt5.QtCore import Qt, QSize, QTimer, QFile, pyqtSignal
+from PyQt5.QtGui import QFont, QIcon
+from collections import deque
+import os
+import threading
+import time
 
-from utils.file_utils import MusicLibrary
+from utils.file_utils import MusicLibrary, scan_music_files
+from utils.search_index import SearchIndex
+from utils.query import parse_query
+from utils.playlists import Playlist, LibraryPathResolver, iter_m3u, write_m3u
+from utils.duplicates import find_duplicates
+from database.catalog import LibraryCatalog
+from database.snapshot import default_snapshot_path, read_snapshot, write_snapshot
+from utils import profiling
 from audio.metadata import MetadataReader
+from .metadata_loader import MetadataLoader
+from .artwork_cache import ArtworkCache
+from .duplicates_dialog import DuplicatesDialog, ACTION_TRASH
+from .library_model import LibraryModel, LibraryFilterModel, display_values, row_values, format_duration
+
+SCAN_BATCH_SECONDS = 0.05  # Time the scan worker collects found files before sending them
+SEARCH_DEBOUNCE_MS = 150  # Quiet time after a keystroke before the search runs
+INDEX_BUILD_BATCH = 1000  # Tracks added to the search index per idle pass
+SNAPSHOT_IDLE_MS = 5000  # Quiet time after the rows change before the snapshot is rewritten
 
 class LibraryView(QWidget):
-    def __init__(self):
+    catalogLoaded = pyqtSignal(object)  # Result of the background catalog read in open_library()
+    duplicatesFound = pyqtSignal(object)  # Groups of identical tracks from find_duplicate_tracks()
+    duplicateProgress = pyqtSignal(int, int)  # Files hashed, files to hash in the current pass
+    queryExplained = pyqtSignal(str)  # Plan and timings of a query typed with the explain prefix
+    scanBatch = pyqtSignal(object, list)  # Cancel event of the scan, (path, filename, folder, stat) entries
+    scanFinished = pyqtSignal(object, bool)  # Cancel event of the scan, True if the whole folder was read
+    
+    def __init__(self, catalog: LibraryCatalog = None, defer_load: bool = False,
+                 snapshot_path: str = None):
         super().__init__()
-        self.library = MusicLibrary()
-        self.model = QStandardItemModel()
-        self.model.setHorizontalHeaderLabels(['Title', 'Artist', 'Album', 'Duration'])
-        self.playlists = {}  # Dictionary to store playlists
+        self.catalog = catalog if catalog is not None else LibraryCatalog()
+        # With defer_load the stored library is read by a later load_library() call
+        self.library = MusicLibrary(self.catalog, load=not defer_load)
+        self.library_loaded = not defer_load
+        # Metadata read in earlier sessions is served from the catalog
+        MetadataReader.cache.set_store(self.catalog)
+        self.model = LibraryModel(self)
+        self.filter_model = LibraryFilterModel(self)
+        self.filter_model.setSourceModel(self.model)
+        
+        # The rows are saved to a snapshot that open_library() shows before the catalog is read
+        self.snapshot_path = snapshot_path or default_snapshot_path()
+        self.snapshot_dirty = False
+        self.snapshot_timer = QTimer(self)
+        self.snapshot_timer.setSingleShot(True)
+        self.snapshot_timer.setInterval(SNAPSHOT_IDLE_MS)
+        self.snapshot_timer.timeout.connect(self.save_snapshot)
+        self.model.rowsInserted.connect(self.mark_snapshot_dirty)
+        self.model.rowsRemoved.connect(self.mark_snapshot_dirty)
+        self.model.modelReset.connect(self.mark_snapshot_dirty)
+        self.model.layoutChanged.connect(self.mark_snapshot_dirty)
+        self.model.dataChanged.connect(self.on_model_data_changed)
+        self.catalogLoaded.connect(self.on_catalog_loaded, Qt.QueuedConnection)
+        self.duplicatesFound.connect(self.on_duplicates_found, Qt.QueuedConnection)
+        self.duplicateProgress.connect(self.on_duplicate_progress, Qt.QueuedConnection)
+        self.duplicate_cancel = None  # Set while a duplicate search runs
+        
+        # Cover art is loaded in the background as rows become visible
+        self.artwork = ArtworkCache(parent=self)
+        self.model.artwork = self.artwork
+        self.artwork.artworkReady.connect(self.model.artwork_changed)
+        
+        # Search runs against an index, once typing pauses
+        self.search_index = SearchIndex()
+        self.search_text = ''
+        self.fuzzy_search = False  # Rank typo-tolerant matches instead of filtering by substring
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(lambda: self.apply_filter(self.search_text))
+        self.index_queue = deque()  # Paths whose tracks still have to be added to the index
+        self.index_timer = QTimer(self)
+        self.index_timer.setInterval(0)
+        self.index_timer.timeout.connect(self.build_search_index)
+        self.playlists = {}  # name -> Playlist, persisted in the catalog
+        
+        # Tags are read on a worker pool and delivered back in batches
+        self.metadata_loader = MetadataLoader()
+        self.metadata_loader.batchReady.connect(self.on_metadata_batch, Qt.QueuedConnection)
+        self.metadata_loader.progressChanged.connect(self.on_metadata_progress, Qt.QueuedConnection)
+        self.metadata_loader.finished.connect(self.on_metadata_finished, Qt.QueuedConnection)
+        
+        # Folders are walked on a worker thread; found files come back in batches so rows appear early
+        self.scan_queue = deque()
+        self.scan_folder = None
+        self.scan_cancel = None  # Set while a folder scan runs
+        self.scan_found = []
+        self.scanBatch.connect(self.on_scan_batch, Qt.QueuedConnection)
+        self.scanFinished.connect(self.on_scan_finished, Qt.QueuedConnection)
+        
         self.init_ui()
+        if not defer_load:
+            self.load_library()
     
     def init_ui(self):
         main_layout = QVBoxLayout()
@@ -52,11 +138,37 @@ class LibraryView(QWidget):
         self.add_folder_button.clicked.connect(self.add_music_folder)
         library_header.addWidget(self.add_folder_button)
         
+        self.remove_folder_button = QPushButton("Remove Folder")
+        self.remove_folder_button.setStyleSheet(self.add_folder_button.styleSheet())
+        self.remove_folder_button.clicked.connect(self.choose_folder_to_remove)
+        library_header.addWidget(self.remove_folder_button)
+        
+        self.find_duplicates_button = QPushButton("Find Duplicates")
+        self.find_duplicates_button.setStyleSheet(self.add_folder_button.styleSheet())
+        self.find_duplicates_button.clicked.connect(self.find_duplicate_tracks)
+        library_header.addWidget(self.find_duplicates_button)
+        
         library_layout.addLayout(library_header)
         
+        # Metadata scan progress, hidden while idle
+        progress_layout = QHBoxLayout()
+        self.scan_progress = QProgressBar()
+        self.scan_progress.setTextVisible(True)
+        self.scan_progress.setFormat("Reading tags %v/%m")
+        progress_layout.addWidget(self.scan_progress)
+        
+        self.cancel_scan_button = QPushButton("Cancel")
+        self.cancel_scan_button.clicked.connect(self.cancel_scan)
+        progress_layout.addWidget(self.cancel_scan_button)
+        
+        self.scan_progress.hide()
+        self.cancel_scan_button.hide()
+        library_layout.addLayout(progress_layout)
+        
         # Library tree view
         self.tree_view = QTreeView()
-        self.tree_view.setModel(self.model)
+        self.tree_view.setModel(self.filter_model)
+        self.tree_view.setUniformRowHeights(True)
         self.tree_view.setAlternatingRowColors(True)
         self.tree_view.setSortingEnabled(True)
         self.tree_view.setStyleSheet("""
@@ -111,9 +223,14 @@ class LibraryView(QWidget):
                 background-color: #1976D2;
             }
         """)
-        self.create_playlist_button.clicked.connect(self.create_playlist)
+        self.create_playlist_button.clicked.connect(lambda: self.create_playlist())
         playlists_header.addWidget(self.create_playlist_button)
         
+        self.import_playlist_button = QPushButton("Import")
+        self.import_playlist_button.setStyleSheet(self.create_playlist_button.styleSheet())
+        self.import_playlist_button.clicked.connect(lambda: self.import_playlist())
+        playlists_header.addWidget(self.import_playlist_button)
+        
         playlists_layout.addLayout(playlists_header)
         
         # Add playlist list widget
@@ -143,6 +260,14 @@ class LibraryView(QWidget):
         # Double click to play playlist
         self.playlist_list.itemDoubleClicked.connect(self.play_playlist)
         
+        # Tracks of the selected playlist, reordered through their context menu
+        self.playlist_tracks_list = QListWidget()
+        self.playlist_tracks_list.setStyleSheet(self.playlist_list.styleSheet())
+        self.playlist_tracks_list.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.playlist_tracks_list.customContextMenuRequested.connect(self.show_playlist_track_menu)
+        playlists_layout.addWidget(self.playlist_tracks_list)
+        self.playlist_list.currentItemChanged.connect(lambda *args: self.show_playlist_tracks())
+        
         # Add playlists widget to splitter
         splitter.addWidget(playlists_widget)
         
@@ -161,63 +286,418 @@ class LibraryView(QWidget):
         )
         if folder:
             try:
-                # Scan folder for music files
-                new_files = self.library.add_folder(folder)
-                self.update_library_view(new_files)
-                QMessageBox.information(
-                    self,
-                    "Success",
-                    f"Added {len(new_files)} tracks to library"
-                )
+                folder = self.library.register_folder(folder)
             except Exception as e:
                 QMessageBox.warning(
                     self,
                     "Error",
                     f"Error adding folder: {str(e)}"
                 )
+                return
+            # Scan folder for music files
+            self.start_folder_scan(folder)
+    
+    def choose_folder_to_remove(self):
+        """Ask which library folder to remove."""
+        folders = self.library.music_folders
+        if not folders:
+            QMessageBox.information(self, "Remove Folder", "No folders in the library")
+            return
+        folder, ok = QInputDialog.getItem(
+            self, "Remove Folder", "Folder to remove:", folders, 0, False
+        )
+        if ok and folder:
+            self.remove_music_folder(folder)
+    
+    def remove_music_folder(self, folder):
+        """Remove a folder and its tracks from the library and the view."""
+        if folder == self.scan_folder and self.scan_cancel is not None:
+            self.scan_cancel.set()
+            self.next_folder_scan()
+        if folder in self.scan_queue:
+            self.scan_queue.remove(folder)
+        removed = self.library.remove_folder(folder)
+        self.remove_tracks_from_view(removed)
+        self.update_scan_status()
+        return removed
+    
+    def find_duplicate_tracks(self):
+        """Look for copies of the same audio in the background."""
+        if self.duplicate_cancel is not None:
+            return
+        self.duplicate_cancel = threading.Event()
+        self.find_duplicates_button.setEnabled(False)
+        self.find_duplicates_button.setText("Finding Duplicates...")
+        tracks = list(self.library.tracks.values())
+        threading.Thread(
+            target=self.search_duplicates, args=(tracks, self.duplicate_cancel), daemon=True
+        ).start()
+    
+    def search_duplicates(self, tracks, cancel):
+        """Worker: group the tracks by identical audio."""
+        try:
+            with profiling.span('duplicates.find'):
+                groups = find_duplicates(tracks, progress=self.duplicateProgress.emit, cancel=cancel)
+        except Exception as e:
+            print(f"Error finding duplicates: {e}")
+            groups = []
+        self.duplicatesFound.emit(None if cancel.is_set() else groups)
+    
+    def on_duplicate_progress(self, done, total):
+        self.find_duplicates_button.setText(f"Comparing {done}/{total}")
+    
+    def on_duplicates_found(self, groups):
+        """Let the user pick the copies to remove."""
+        self.duplicate_cancel = None
+        self.find_duplicates_button.setEnabled(True)
+        self.find_duplicates_button.setText("Find Duplicates")
+        if groups is None:
+            return
+        if not groups:
+            QMessageBox.information(self, "Find Duplicates", "No duplicate tracks found")
+            return
+        dialog = DuplicatesDialog(groups, self.library.tracks, self)
+        if dialog.exec_() == QDialog.Accepted:
+            self.resolve_duplicates(dialog.checked_paths(), trash=dialog.action == ACTION_TRASH)
+    
+    def resolve_duplicates(self, paths, trash=False):
+        """Remove duplicate copies from the library, moving the files to the trash if asked."""
+        if trash:
+            failed = [path for path in paths if not QFile.moveToTrash(path)[0]]
+            if failed:
+                QMessageBox.warning(
+                    self, "Error", f"{len(failed)} files could not be moved to the trash"
+                )
+                failed = set(failed)
+                paths = [path for path in paths if path not in failed]
+        removed = self.library.remove_tracks(paths)
+        self.remove_tracks_from_view(removed)
+        return removed
+    
+    def start_folder_scan(self, folder):
+        """Queue a folder to be scanned in the background."""
+        self.scan_queue.append(folder)
+        if self.scan_cancel is None:
+            self.next_folder_scan()
+        self.update_scan_status()
+    
+    def next_folder_scan(self):
+        """Start scanning the next queued folder, if any."""
+        if not self.scan_queue:
+            self.scan_folder = None
+            self.scan_cancel = None
+            return
+        self.scan_folder = self.scan_queue.popleft()
+        self.scan_found = []
+        self.scan_cancel = threading.Event()
+        threading.Thread(
+            target=self.walk_folder, args=(self.scan_folder, self.scan_cancel), daemon=True
+        ).start()
+    
+    def walk_folder(self, folder, cancel):
+        """Worker: list the music files below a folder, sending them in batches."""
+        batch = []
+        sent = time.monotonic()
+        complete = False
+        try:
+            with profiling.span('scan.walk'):
+                for entry in scan_music_files(folder, cancel):
+                    batch.append(entry)
+                    if time.monotonic() - sent >= SCAN_BATCH_SECONDS:
+                        self.scanBatch.emit(cancel, batch)
+                        batch = []
+                        sent = time.monotonic()
+            complete = not cancel.is_set()
+        except Exception as e:
+            print(f"Error scanning {folder}: {e}")
+        if batch:
+            self.scanBatch.emit(cancel, batch)
+        self.scanFinished.emit(cancel, complete)
+    
+    def on_scan_batch(self, cancel, entries):
+        """Add a batch of files found by the running scan."""
+        if cancel is not self.scan_cancel or cancel.is_set():
+            return
+        with profiling.span('scan.batch'):
+            paths = [self.library.add_scanned_file(*entry) for entry in entries]
+        profiling.count('scan.files', len(paths))
+        self.scan_found.extend(paths)
+        self.update_library_view(paths)
+    
+    def on_scan_finished(self, cancel, complete):
+        """Drop tracks the scan did not find and move on to the next folder."""
+        if cancel is not self.scan_cancel or cancel.is_set():
+            return
+        folder, found = self.scan_folder, self.scan_found
+        if complete:
+            # The whole folder was seen, so anything not found is gone from disk
+            self.remove_tracks_from_view(self.library.prune_missing(folder, found))
+        self.next_folder_scan()
+        self.update_scan_status()
+        if complete:
+            QMessageBox.information(
+                self,
+                "Success",
+                f"Added {len(found)} tracks to library"
+            )
+    
+    def cancel_scan(self):
+        """Stop folder scanning, metadata reading and duplicate searches."""
+        if self.duplicate_cancel is not None:
+            self.duplicate_cancel.set()
+        self.scan_queue.clear()
+        if self.scan_cancel is not None:
+            self.scan_cancel.set()
+        self.next_folder_scan()
+        self.metadata_loader.cancel()
+        self.update_scan_status()
+    
+    def update_scan_status(self):
+        """Show the scan progress while scanning or reading tags."""
+        busy = self.scan_cancel is not None or self.metadata_loader.is_running()
+        self.scan_progress.setVisible(busy)
+        self.cancel_scan_button.setVisible(busy)
+    
+    def load_library(self):
+        """Show the tracks stored in the catalog by a previous session."""
+        if not self.library_loaded:
+            self.library.load_from_catalog()
+            self.library_loaded = True
+        self.show_playlists(self.catalog.get_playlists())
+        self.update_library_view(list(self.library.tracks))
+
+    def open_library(self):
+        """Show the saved snapshot at once, then reconcile it with the catalog in the background."""
+        if self.model.rowCount() == 0:
+            snapshot = read_snapshot(self.snapshot_path)
+            if snapshot is not None:
+                self.model.load_snapshot(snapshot)
+                self.snapshot_dirty = False
+        
+        # The worker compares against copies, the model may change meanwhile
+        shown = self.model.to_snapshot()
+        shown = (tuple(shown.paths), tuple(shown.titles), tuple(shown.strings),
+                 shown.artists[:], shown.albums[:], shown.lengths[:], shown.track_numbers[:])
+        threading.Thread(target=self.read_catalog, args=shown, daemon=True).start()
+    
+    def read_catalog(self, paths, titles, strings, artists, albums, lengths, track_numbers):
+        """Worker: load the catalog and find the shown rows that differ from it."""
+        try:
+            folders = self.catalog.get_folders()
+            tracks = self.catalog.get_all_tracks()
+            playlists = self.catalog.get_playlists()
+        except Exception as e:
+            print(f"Error reading library catalog: {e}")
+            return
+        shown = {
+            path: (titles[row], strings[artists[row]], strings[albums[row]], lengths[row],
+                   strings[track_numbers[row]])
+            for row, path in enumerate(paths)
+        }
+        changed = [track for track in tracks if shown.get(track['path']) != row_values(track)]
+        stored = {track['path'] for track in tracks}
+        removed = [path for path in paths if path not in stored]
+        self.catalogLoaded.emit((folders, tracks, changed, removed, playlists))
+    
+    def on_catalog_loaded(self, result):
+        """Take over the catalog read by open_library() and fix rows the snapshot got wrong."""
+        folders, tracks, changed, removed, playlists = result
+        # Folders and tracks added while the catalog was read are kept
+        self.library.music_folders = folders + [
+            folder for folder in self.library.music_folders if folder not in folders
+        ]
+        self.library.merge_tracks(tracks)
+        self.library_loaded = True
+        self.show_playlists(playlists)
+        
+        self.remove_tracks_from_view(removed)
+        self.model.add_tracks(changed)
+        # Indexed in idle steps; a search before then finishes the queue first
+        self.index_queue.extend(track['path'] for track in tracks)
+        self.index_timer.start()
+        if self.filter_model.is_filtered():
+            self.search_timer.start()
+    
+    def mark_snapshot_dirty(self, *args):
+        """Schedule a snapshot write once the rows stop changing."""
+        self.snapshot_dirty = True
+        self.snapshot_timer.start()
+    
+    def on_model_data_changed(self, top_left, bottom_right, roles=()):
+        """Mark the snapshot dirty unless only cover art icons changed."""
+        if list(roles) != [Qt.DecorationRole]:
+            self.mark_snapshot_dirty()
+    
+    def save_snapshot(self):
+        """Write the current rows to the snapshot file if they changed."""
+        self.snapshot_timer.stop()
+        if not self.snapshot_dirty or not self.library_loaded:
+            return
+        try:
+            write_snapshot(self.model.to_snapshot(), self.snapshot_path)
+        except OSError as e:
+            print(f"Error writing library snapshot: {e}")
+            return
+        self.snapshot_dirty = False
     
     def update_library_view(self, files):
         """Update the tree view with new music files."""
+        known = []
+        stale = []
         for file_path in files:
-            metadata = MetadataReader.read_metadata(file_path)
-            
-            # Create items for the tree view
-            title_item = QStandardItem(metadata.get('title', 'Unknown Title'))
-            artist_item = QStandardItem(metadata.get('artist', 'Unknown Artist'))
-            album_item = QStandardItem(metadata.get('album', 'Unknown Album'))
-            duration = self.format_duration(metadata.get('length', 0))
-            duration_item = QStandardItem(duration)
-            
-            # Store the file path in the item's data
-            title_item.setData(file_path, Qt.UserRole)
-            
-            # Add the row to the model
-            self.model.appendRow([title_item, artist_item, album_item, duration_item])
-    
-    def create_playlist(self):
-        """Create a new playlist."""
-        name, ok = QInputDialog.getText(self, 'Create Playlist', 'Enter playlist name:')
-        if ok and name:
+            if self.library.needs_metadata(file_path):
+                # New or changed on disk since the stored row
+                stale.append(file_path)
+            else:
+                known.append(self.library.get_track_info(file_path))
+        
+        self.add_tracks_to_view(known)
+        if stale:
+            self.metadata_loader.load(stale)
+            self.update_scan_status()
+    
+    def add_tracks_to_view(self, tracks):
+        """Add rows for the given track dicts, refreshing rows already shown."""
+        # New rows go in with a single insert per batch
+        self.model.add_tracks(tracks)
+        self.search_index.add_many(tracks)
+        self.index_timer.start()
+        if self.filter_model.is_filtered():
+            # Let new matches show up once the current batch settles
+            self.search_timer.start()
+    
+    def on_metadata_batch(self, batch):
+        """Store and show a batch of metadata read by the worker pool."""
+        self.library.store_metadata(batch)
+        # Tracks removed from the library while they were being read are dropped
+        self.add_tracks_to_view([
+            self.library.tracks[metadata['path']] for metadata in batch
+            if metadata.get('path') in self.library.tracks
+        ])
+    
+    def on_metadata_progress(self, done, total):
+        """Update the scan progress bar."""
+        self.scan_progress.setMaximum(max(total, 1))
+        self.scan_progress.setValue(done)
+    
+    def on_metadata_finished(self, cancelled):
+        """Hide the scan progress once the worker pool is idle."""
+        if cancelled:
+            # Show the unread tracks by file name, they are re-read on the next scan
+            self.add_tracks_to_view([
+                info for path, info in self.library.tracks.items()
+                if not self.model.contains(path)
+            ])
+        self.update_scan_status()
+
+    def remove_tracks_from_view(self, paths):
+        """Remove the rows showing the given tracks."""
+        paths = list(paths)
+        self.model.remove_paths(paths)
+        for path in paths:
+            self.search_index.remove(path)
+    
+    def show_playlists(self, playlists):
+        """Show the playlists stored in the catalog, keeping ones created meanwhile."""
+        for name, paths in playlists.items():
             if name not in self.playlists:
-                self.playlists[name] = []
+                self.playlists[name] = Playlist(name, paths)
                 self.playlist_list.addItem(name)
-                return name
+
+    def create_playlist(self, name=None):
+        """Create a new playlist."""
+        if name is None:
+            name, ok = QInputDialog.getText(self, 'Create Playlist', 'Enter playlist name:')
+            if not ok:
+                return None
+        if name and name not in self.playlists and self.catalog.create_playlist(name):
+            self.playlists[name] = Playlist(name)
+            self.playlist_list.addItem(name)
+            return name
         return None
 
     def add_to_playlist(self, playlist_name):
         """Add selected tracks to playlist."""
         selected_track = self.get_selected_track()
-        if selected_track and playlist_name in self.playlists:
-            if selected_track not in self.playlists[playlist_name]:
-                self.playlists[playlist_name].append(selected_track)
+        playlist = self.playlists.get(playlist_name)
+        if selected_track and playlist is not None and playlist.add(selected_track):
+            self.catalog.add_playlist_tracks(playlist_name, [selected_track])
+            if playlist_name == self.current_playlist_name():
+                self.show_playlist_tracks()
+
+    def current_playlist_name(self):
+        """Return the name of the playlist selected in the list, or None."""
+        item = self.playlist_list.currentItem()
+        return item.text() if item is not None else None
+
+    def show_playlist_tracks(self):
+        """List the tracks of the selected playlist."""
+        self.playlist_tracks_list.clear()
+        playlist = self.playlists.get(self.current_playlist_name())
+        if playlist is None:
+            return
+        tracks = self.library.tracks
+        for path in playlist:
+            title, artist, _, _ = display_values(tracks.get(path) or {'filename': os.path.basename(path)})
+            item = QListWidgetItem(f"{artist} - {title}")
+            item.setData(Qt.UserRole, path)
+            self.playlist_tracks_list.addItem(item)
+
+    def show_playlist_track_menu(self, position):
+        """Show the context menu for a track of the selected playlist."""
+        item = self.playlist_tracks_list.itemAt(position)
+        name = self.current_playlist_name()
+        if item is None or name not in self.playlists:
+            return
+        path = item.data(Qt.UserRole)
+        row = self.playlist_tracks_list.row(item)
+        last = self.playlist_tracks_list.count() - 1
+        menu = QMenu()
+        moves = {}
+        for text, index in (("Move to Top", 0), ("Move Up", row - 1),
+                            ("Move Down", row + 1), ("Move to Bottom", last)):
+            action = menu.addAction(text)
+            action.setEnabled(0 <= index <= last and index != row)
+            moves[action] = index
+        menu.addSeparator()
+        remove_action = menu.addAction("Remove from Playlist")
+        action = menu.exec_(self.playlist_tracks_list.mapToGlobal(position))
+        if action == remove_action:
+            self.remove_from_playlist(name, [path])
+        elif action in moves:
+            self.move_playlist_track(name, path, moves[action])
+
+    def move_playlist_track(self, name, path, index):
+        """Move a track of a playlist to a new position."""
+        playlist = self.playlists.get(name)
+        if playlist is None or path not in playlist:
+            return
+        index = playlist.move(path, index)
+        self.catalog.move_playlist_track(name, path, index)
+        if name == self.current_playlist_name():
+            self.show_playlist_tracks()
+            self.playlist_tracks_list.setCurrentRow(index)
+
+    def remove_from_playlist(self, name, paths):
+        """Remove tracks from a playlist."""
+        playlist = self.playlists.get(name)
+        if playlist is None:
+            return
+        removed = [path for path in paths if playlist.remove(path)]
+        if removed:
+            self.catalog.remove_playlist_tracks(name, removed)
+            if name == self.current_playlist_name():
+                self.show_playlist_tracks()
 
     def show_playlist_menu(self, position):
         """Show context menu for playlists."""
         menu = QMenu()
         delete_action = QAction("Delete Playlist", self)
         play_action = QAction("Play Playlist", self)
+        export_action = QAction("Export as M3U...", self)
         
         menu.addAction(play_action)
+        menu.addAction(export_action)
         menu.addAction(delete_action)
         
         item = self.playlist_list.itemAt(position)
@@ -227,36 +707,161 @@ class LibraryView(QWidget):
                 self.delete_playlist(item.text())
             elif action == play_action:
                 self.play_playlist(item)
+            elif action == export_action:
+                self.export_playlist(item.text())
 
     def delete_playlist(self, name):
         """Delete a playlist."""
         if name in self.playlists:
             del self.playlists[name]
+            self.catalog.delete_playlist(name)
             items = self.playlist_list.findItems(name, Qt.MatchExactly)
             for item in items:
                 self.playlist_list.takeItem(self.playlist_list.row(item))
 
     def play_playlist(self, item):
         """Play the selected playlist."""
-        playlist_name = item.text()
-        if playlist_name in self.playlists and self.playlists[playlist_name]:
+        playlist = self.playlists.get(item.text())
+        if playlist:
             from .main_window import MainWindow
             main_window = self.window()
             if isinstance(main_window, MainWindow):
-                tracks = self.playlists[playlist_name]
-                main_window.playback_controls.set_playlist(tracks, 0)
+                main_window.playback_controls.set_playlist(playlist.paths(), 0)
+
+    def import_playlist(self, file_path=None):
+        """Create a playlist from an M3U/M3U8 file, keeping the entries found in the library."""
+        if file_path is None:
+            file_path, _ = QFileDialog.getOpenFileName(
+                self, "Import Playlist", "", "Playlists (*.m3u *.m3u8)"
+            )
+            if not file_path:
+                return None
+        base_name = os.path.splitext(os.path.basename(file_path))[0] or "Imported"
+        name = base_name
+        number = 2
+        while name in self.playlists:
+            name = f"{base_name} ({number})"
+            number += 1
+        if self.create_playlist(name) is None:
+            return None
+        
+        # Entries are resolved and stored as the file is read
+        playlist = self.playlists[name]
+        resolver = LibraryPathResolver(self.library.tracks)
+        base_dir = os.path.dirname(os.path.abspath(file_path))
+        missing = 0
+        
+        def resolved_entries():
+            nonlocal missing
+            for entry in iter_m3u(file_path):
+                path = resolver.resolve(entry, base_dir)
+                if path is None:
+                    missing += 1
+                elif playlist.add(path):
+                    yield path
+        
+        try:
+            self.catalog.add_playlist_tracks(name, resolved_entries())
+        except (OSError, UnicodeError) as e:
+            print(f"Error importing playlist {file_path}: {e}")
+            self.delete_playlist(name)
+            QMessageBox.warning(self, "Error", f"Error importing playlist: {e}")
+            return None
+        if missing:
+            QMessageBox.information(
+                self, "Import Playlist",
+                f"{missing} entries of {os.path.basename(file_path)} are not in the library"
+            )
+        return name
+
+    def export_playlist(self, name, file_path=None):
+        """Write a playlist as an extended M3U file."""
+        playlist = self.playlists.get(name)
+        if playlist is None:
+            return
+        if file_path is None:
+            file_path, _ = QFileDialog.getSaveFileName(
+                self, "Export Playlist", f"{name}.m3u8", "Playlists (*.m3u8 *.m3u)"
+            )
+            if not file_path:
+                return
+        tracks = self.library.tracks
+        
+        def entries():
+            for path in playlist:
+                title, artist, _, seconds = display_values(tracks.get(path) or {'filename': os.path.basename(path)})
+                yield path, seconds, f"{artist} - {title}"
+        
+        try:
+            write_m3u(file_path, entries())
+        except OSError as e:
+            print(f"Error exporting playlist {file_path}: {e}")
+            QMessageBox.warning(self, "Error", f"Error exporting playlist: {e}")
 
     def filter_library(self, search_text):
-        """Filter library based on search text."""
-        search_text = search_text.lower()
-        for row in range(self.model.rowCount()):
-            show_row = False
-            for col in range(self.model.columnCount()):
-                item = self.model.item(row, col)
-                if search_text in item.text().lower():
-                    show_row = True
-                    break
-            self.tree_view.setRowHidden(row, self.tree_view.rootIndex(), not show_row)
+        """Filter library based on search text, once typing pauses."""
+        self.search_text = search_text
+        self.search_timer.start()
+    
+    def set_fuzzy_search(self, enabled):
+        """Switch between substring and typo-tolerant search, refreshing the current results."""
+        self.fuzzy_search = enabled
+        if self.search_text:
+            self.apply_filter(self.search_text)
+    
+    def apply_filter(self, search_text):
+        """Show only the tracks matching every word of the search text, or the best fuzzy matches.
+        
+        Text with field:value words or -exclusions runs as a structured
+        query instead (see utils.query.parse_query).
+        """
+        self.search_timer.stop()
+        self.index_queued_tracks()
+        current = self.tree_view.currentIndex().data(Qt.UserRole)
+        query = parse_query(search_text)
+        ranked = self.fuzzy_search and query is None
+        with profiling.span('search.filter'):
+            if query is not None:
+                paths, plan = self.search_index.query(query)
+                if query.explain:
+                    self.queryExplained.emit(plan.explain())
+            elif ranked:
+                paths = self.search_index.search_fuzzy(search_text)
+            else:
+                paths = self.search_index.search(search_text)
+            if paths is None or (not ranked and len(paths) == self.model.rowCount()):
+                self.filter_model.set_source_rows(None)
+            else:
+                row_of = self.model.row_of
+                rows = [row_of(path) for path in paths]
+                if not ranked:
+                    # Keep library order; fuzzy matches stay in relevance order
+                    rows.sort()
+                self.filter_model.set_source_rows(rows, ranked=ranked)
+        
+        # Keep the current track selected if it is still shown
+        if current:
+            row = self.model.row_of(current)
+            index = self.filter_model.mapFromSource(self.model.index(row, 0)) if row is not None else None
+            if index is not None and index.isValid():
+                self.tree_view.setCurrentIndex(index)
+    
+    def build_search_index(self):
+        """Extend the search index in small steps while the GUI is idle."""
+        if self.index_queue:
+            self.index_queued_tracks(INDEX_BUILD_BATCH)
+        elif not self.search_index.build_pending(INDEX_BUILD_BATCH):
+            self.index_timer.stop()
+    
+    def index_queued_tracks(self, limit=None):
+        """Add up to limit queued tracks to the search index, with their current metadata."""
+        queue = self.index_queue
+        tracks = self.library.tracks
+        count = len(queue) if limit is None else min(limit, len(queue))
+        for _ in range(count):
+            track = tracks.get(queue.popleft())
+            if track is not None:
+                self.search_index.add(track)
 
     # Add context menu for library items
     def setup_tree_view_context_menu(self):
@@ -294,44 +899,35 @@ class LibraryView(QWidget):
         if indexes:
             # Get the first column (title) of the selected row
             title_index = indexes[0]
-            return self.model.itemFromIndex(title_index).data(Qt.UserRole)
+            return title_index.data(Qt.UserRole)
         return None
     
     def get_all_tracks(self):
         """Get a list of all tracks in the library."""
-        tracks = []
-        for row in range(self.model.rowCount()):
-            title_item = self.model.item(row, 0)
-            track_path = title_item.data(Qt.UserRole)
-            if track_path:
-                tracks.append(track_path)
-        return tracks
-    
-    @staticmethod
-    def format_duration(seconds: float) -> str:
-        """Format duration in seconds to MM:SS format."""
-        minutes = int(seconds) // 60
-        seconds = int(seconds) % 60
-        return f"{minutes}:{seconds:02d}"
+        return list(self.model.paths)
+    
+    def get_play_order(self):
+        """Get all tracks in library order as a tuple shared until the library changes."""
+        return self.model.path_snapshot()
+    
+    format_duration = staticmethod(format_duration)
     
     def highlight_playing_track(self, file_path: str):
         """Highlight the currently playing track in the tree view."""
-        for row in range(self.model.rowCount()):
-            item = self.model.item(row, 0)
-            if item.data(Qt.UserRole) == file_path:
-                self.tree_view.setCurrentIndex(item.index())
-                self.tree_view.scrollTo(item.index())
-                break
+        row = self.model.row_of(file_path)
+        if row is None:
+            return
+        index = self.filter_model.mapFromSource(self.model.index(row, 0))
+        if index.isValid():
+            # Not hidden by the current search
+            self.tree_view.setCurrentIndex(index)
+            self.tree_view.scrollTo(index)
     
     def get_track_at_index(self, index: int) -> str:
         """Get track path at specific index."""
-        if 0 <= index < self.model.rowCount():
-            return self.model.item(index, 0).data(Qt.UserRole)
-        return None
+        return self.model.path_at(index)
     
     def get_track_index(self, file_path: str) -> int:
         """Get the index of a track in the library."""
-        for row in range(self.model.rowCount()):
-            if self.model.item(row, 0).data(Qt.UserRole) == file_path:
-                return row
-        return -1
+        row = self.model.row_of(file_path)
+        return -1 if row is None else row
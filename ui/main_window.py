@@ -1,13 +1,20 @@
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QLabel, QLineEdit, QPushButton, QListWidget, QSlider,
-                             QApplication, QFrame)
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap, QFont
+                             QApplication, QFrame, QShortcut, QCheckBox, QToolTip)
+from PyQt5.QtCore import Qt, QEvent, QTimer, QPoint
+from PyQt5.QtGui import QPixmap, QFont, QKeySequence
+import html
 import os
 from .playback_controls import PlaybackControls
 from .library_view import LibraryView
 from audio.metadata import MetadataReader
+from audio.replaygain import ReplayGain
 from .themes import ThemeManager
+from utils.startup_timing import startup_timer
+from utils import profiling
+from utils.file_utils import get_app_data_dir
+
+NOW_PLAYING_ART_SIZE = 160  # Cover art edge in the Now Playing panel, in pixels
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -15,6 +22,8 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Music Player")
         self.setMinimumSize(1000, 700)
         self.is_dark_theme = False
+        self.deferred_loaded = False
+        self.now_playing_path = None
         
         # Create central widget and main layout
         central_widget = QWidget()
@@ -34,14 +43,10 @@ class MainWindow(QMainWindow):
         top_bar_layout = QHBoxLayout(top_bar)
         top_bar_layout.setContentsMargins(15, 10, 15, 10)
         
-        # Add logo
-        logo_label = QLabel()
-        logo_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets', 'logo.webp')
-        if os.path.exists(logo_path):
-            pixmap = QPixmap(logo_path)
-            scaled_pixmap = pixmap.scaled(32, 32, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            logo_label.setPixmap(scaled_pixmap)
-        top_bar_layout.addWidget(logo_label)
+        # Add logo, decoded once the window is on screen
+        self.logo_label = QLabel()
+        self.logo_label.setFixedSize(32, 32)
+        top_bar_layout.addWidget(self.logo_label)
         
         # Add app name
         app_name = QLabel("Music Player")
@@ -52,7 +57,7 @@ class MainWindow(QMainWindow):
         
         # Add search bar with styling
         self.search_bar = QLineEdit()
-        self.search_bar.setPlaceholderText("Search music...")
+        self.search_bar.setPlaceholderText("Search music... (artist:name year:1990..1999 -live)")
         self.search_bar.setMinimumWidth(300)
         self.search_bar.setStyleSheet("""
             QLineEdit {
@@ -67,6 +72,11 @@ class MainWindow(QMainWindow):
         """)
         top_bar_layout.addWidget(self.search_bar)
         
+        # Typo-tolerant search, ranked by relevance
+        self.fuzzy_checkbox = QCheckBox("Fuzzy")
+        self.fuzzy_checkbox.setToolTip("Find close matches ranked by relevance, e.g. \"beatels\"")
+        top_bar_layout.addWidget(self.fuzzy_checkbox)
+        
         # Add theme toggle button
         self.theme_button = QPushButton(" Dark Mode")
         self.theme_button.setStyleSheet("""
@@ -92,7 +102,7 @@ class MainWindow(QMainWindow):
         content_area.setContentsMargins(0, 0, 0, 0)
         
         # Left sidebar (library and playlists)
-        self.library_view = LibraryView()
+        self.library_view = LibraryView(defer_load=True)
         content_area.addWidget(self.library_view, stretch=2)
         
         # Add vertical separator
@@ -124,6 +134,12 @@ class MainWindow(QMainWindow):
         now_playing_header.setAlignment(Qt.AlignCenter)
         now_playing_layout.addWidget(now_playing_header)
         
+        self.art_label = QLabel()
+        self.art_label.setAlignment(Qt.AlignCenter)
+        self.art_label.setFixedHeight(NOW_PLAYING_ART_SIZE)
+        self.art_label.hide()
+        now_playing_layout.addWidget(self.art_label)
+        
         self.now_playing_label = QLabel("Not Playing")
         self.now_playing_label.setFont(QFont("Segoe UI", 14))
         self.now_playing_label.setAlignment(Qt.AlignCenter)
@@ -147,6 +163,9 @@ class MainWindow(QMainWindow):
         # Add playback controls
         self.playback_controls = PlaybackControls()
         right_area.addWidget(self.playback_controls)
+        self.replay_gain = ReplayGain(self.library_view.catalog)
+        self.playback_controls.player.replay_gain = self.replay_gain
+        self.playback_controls.waveforms.replay_gain = self.replay_gain
         
         # Volume control with styling
         volume_frame = QFrame()
@@ -209,10 +228,27 @@ class MainWindow(QMainWindow):
         
         # Connect search
         self.search_bar.textChanged.connect(self.search_library)
+        self.fuzzy_checkbox.toggled.connect(self.library_view.set_fuzzy_search)
+        self.library_view.queryExplained.connect(self.show_query_plan)
 
         # Connect playback control signals
         self.playback_controls.trackChanged.connect(self.on_track_changed)
         self.playback_controls.playbackStateChanged.connect(self.on_playback_state_changed)
+        self.library_view.artwork.artworkReady.connect(self.on_artwork_ready)
+        
+        # Waveforms and loudness of the whole library are analyzed at low priority
+        self.library_view.catalogLoaded.connect(lambda result: self.analyze_tracks(result[1]))
+        self.library_view.metadata_loader.batchReady.connect(self.analyze_tracks)
+        
+        # Hot path timings, see utils.profiling
+        self.diagnostics_panel = None
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self, activated=self.show_diagnostics)
+    
+    def analyze_tracks(self, tracks):
+        """Queue library tracks for waveform and ReplayGain analysis."""
+        # Albums are registered before the waveform pass can measure their tracks
+        self.replay_gain.analyze(tracks)
+        self.playback_controls.waveforms.queue(track['path'] for track in tracks)
     
     def toggle_theme(self):
         """Toggle between light and dark theme."""
@@ -226,11 +262,11 @@ class MainWindow(QMainWindow):
             self.theme_button.setText(" Dark Mode")
     
     def play_selected_track(self, index):
-        track_path = self.library_view.get_selected_track()
+        track_path = index.data(Qt.UserRole) if index.isValid() else self.library_view.get_selected_track()
         if track_path:
             # Get all tracks for playlist functionality
-            all_tracks = self.library_view.get_all_tracks()
-            current_index = all_tracks.index(track_path)
+            all_tracks = self.library_view.get_play_order()
+            current_index = self.library_view.get_track_index(track_path)
             
             # Set the playlist and start playing
             self.playback_controls.set_playlist(all_tracks, current_index)
@@ -265,10 +301,27 @@ class MainWindow(QMainWindow):
         album = metadata.get('album', 'Unknown Album')
         self.album_label.setText(album)
         
+        self.now_playing_path = track_path
+        self.show_artwork(track_path)
+        
         # Update window title
         if self.playback_controls.player.is_playing:
             self.setWindowTitle(f"▶ {title} - Music Player")
     
+    def show_artwork(self, track_path):
+        """Show the cover art of a track, or hide it until it has loaded."""
+        pixmap = self.library_view.artwork.pixmap(track_path, NOW_PLAYING_ART_SIZE)
+        if pixmap is None:
+            self.art_label.hide()
+        else:
+            self.art_label.setPixmap(pixmap)
+            self.art_label.show()
+    
+    def on_artwork_ready(self, track_path):
+        """Called when cover art finished loading in the background."""
+        if track_path == self.now_playing_path:
+            self.show_artwork(track_path)
+    
     def volume_changed(self, value):
         # Convert 0-100 range to 0-1 range
         volume = value / 100.0
@@ -277,3 +330,67 @@ class MainWindow(QMainWindow):
     def search_library(self, text):
         """Implement library search."""
         self.library_view.filter_library(text)
+
+    def show_query_plan(self, plan):
+        """Show the plan of an explained query under the search bar."""
+        QToolTip.showText(self.search_bar.mapToGlobal(QPoint(0, self.search_bar.height())),
+                          f"<pre>{html.escape(plan)}</pre>", self.search_bar)
+    
+    def showEvent(self, event):
+        """Load the stored library and the logo after the window first appears."""
+        super().showEvent(event)
+        if not self.deferred_loaded:
+            self.deferred_loaded = True
+            QTimer.singleShot(0, self.load_deferred)
+    
+    def load_deferred(self):
+        """Do the startup work that is not needed to show the window."""
+        self.load_logo()
+        startup_timer.mark("load logo")
+        self.library_view.open_library()
+        startup_timer.mark(f"open library snapshot ({self.library_view.model.rowCount()} tracks)")
+    
+    def load_logo(self):
+        """Decode and show the application logo."""
+        logo_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets', 'logo.webp')
+        if os.path.exists(logo_path):
+            pixmap = QPixmap(logo_path)
+            scaled_pixmap = pixmap.scaled(32, 32, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            self.logo_label.setPixmap(scaled_pixmap)
+    
+    def show_diagnostics(self):
+        """Open the diagnostics panel."""
+        if self.diagnostics_panel is None:
+            from .diagnostics_panel import DiagnosticsPanel
+            self.diagnostics_panel = DiagnosticsPanel(self)
+        self.diagnostics_panel.show()
+        self.diagnostics_panel.raise_()
+    
+    def export_diagnostics(self):
+        """Write recorded spans and any cProfile stats to the app data folder."""
+        if not profiling.is_enabled():
+            return
+        data_dir = get_app_data_dir()
+        try:
+            profiling.export(os.path.join(data_dir, 'diagnostics.json'))
+            profiling.dump_profile(os.path.join(data_dir, 'profile.pstats'))
+        except OSError as e:
+            print(f"Error exporting diagnostics: {e}")
+    
+    def changeEvent(self, event):
+        """Slow down playback position updates while minimized."""
+        if event.type() == QEvent.WindowStateChange:
+            self.playback_controls.set_minimized(self.isMinimized())
+        super().changeEvent(event)
+
+    def closeEvent(self, event):
+        """Stop background work and close the library catalog."""
+        self.library_view.cancel_scan()
+        self.library_view.save_snapshot()
+        self.export_diagnostics()
+        self.library_view.artwork.shutdown()
+        self.playback_controls.waveforms.shutdown()
+        self.replay_gain.shutdown()
+        MetadataReader.cache.set_store(None)
+        self.library_view.catalog.close()
+        super().closeEvent(event)
@@ -0,0 +1,163 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError
+from typing import Iterable, Optional
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from audio.metadata import MetadataReader
+
+
+def default_worker_count() -> int:
+    """Return the metadata worker count, overridable with MUSIC_APP_METADATA_WORKERS."""
+    configured = os.environ.get('MUSIC_APP_METADATA_WORKERS')
+    if configured and configured.isdigit() and int(configured) > 0:
+        return int(configured)
+    # Reads are mostly waiting on the disk, so use more threads than cores
+    return min(32, (os.cpu_count() or 1) * 2)
+
+
+def default_use_processes() -> bool:
+    """Return True if tags should be parsed in worker processes instead of threads."""
+    return os.environ.get('MUSIC_APP_METADATA_PROCESSES', '') in ('1', 'true', 'yes')
+
+
+def init_metadata_process():
+    """Worker process initializer: read tags without the library catalog.
+
+    The catalog's SQLite connection belongs to the GUI process, so workers
+    only keep their own in-memory cache.
+    """
+    MetadataReader.cache.set_store(None)
+
+
+class MetadataLoader(QObject):
+    """Reads metadata on a worker pool and streams the results back in batches.
+
+    Signals are emitted from a coordinator thread, so receivers living in the
+    GUI thread get them through queued connections.
+    """
+    batchReady = pyqtSignal(list)  # List of metadata dicts, in request order
+    progressChanged = pyqtSignal(int, int)  # Files done, files requested
+    finished = pyqtSignal(bool)  # True if the run was cancelled
+
+    def __init__(self, workers: Optional[int] = None, use_processes: Optional[bool] = None,
+                 batch_size: int = 250, batch_interval: float = 0.1, parent=None):
+        super().__init__(parent)
+        self.workers = workers or default_worker_count()
+        self.use_processes = default_use_processes() if use_processes is None else use_processes
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval  # Seconds before a partial batch is flushed
+
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._generation = 0  # Bumped by cancel(); work submitted under an older value is dropped
+        self._thread: Optional[threading.Thread] = None
+        self._done = 0
+        self._total = 0
+
+    def load(self, paths: Iterable[str]):
+        """Queue files for metadata extraction, starting the pool if idle."""
+        with self._lock:
+            before = len(self._pending)
+            self._pending.extend(paths)
+            self._total += len(self._pending) - before
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def cancel(self):
+        """Drop all queued files and the results of reads already running.
+
+        Files passed to load() afterwards are read as usual, even while the
+        cancelled reads are still finishing.
+        """
+        with self._lock:
+            self._total -= len(self._pending)
+            self._pending.clear()
+            if self._thread is not None:
+                self._generation += 1
+
+    def is_running(self) -> bool:
+        """Return True while files are being processed."""
+        with self._lock:
+            return self._thread is not None
+
+    def _make_executor(self):
+        if self.use_processes:
+            # Spawned rather than forked, the GUI process has Qt, SDL and SQLite state in use
+            return ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_metadata_process
+            )
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='metadata')
+
+    def _run(self):
+        """Coordinator loop: keep the pool busy and emit results in order."""
+        executor = self._make_executor()
+        in_flight = deque()  # Futures in submission order
+        batch = []
+        last_flush = time.monotonic()
+        cancelled = False
+        with self._lock:
+            generation = self._generation
+
+        try:
+            while True:
+                with self._lock:
+                    if self._generation != generation:
+                        # Drop work submitted before cancel(); files loaded since are still pending
+                        generation = self._generation
+                        cancelled = True
+                        for future in in_flight:
+                            future.cancel()
+                        self._total -= len(in_flight)
+                        in_flight.clear()
+                        batch = []
+                    # Keep a bounded window of work in the pool
+                    while self._pending and len(in_flight) < self.workers * 4:
+                        path = self._pending.popleft()
+                        in_flight.append(executor.submit(MetadataReader.read_metadata, path))
+                    if not in_flight:
+                        if batch:
+                            self.batchReady.emit(batch)
+                        done, total = self._done, self._total
+                        self._done = self._total = 0
+                        self._thread = None
+                        break
+
+                read = True
+                metadata = None
+                try:
+                    metadata = in_flight[0].result(timeout=self.batch_interval)
+                except TimeoutError:
+                    read = False
+                except Exception as e:
+                    print(f"Error in metadata worker: {e}")
+
+                with self._lock:
+                    if self._generation != generation:
+                        continue  # Cancelled while waiting, handled at the top of the loop
+                    if read:
+                        in_flight.popleft()
+                        self._done += 1
+                        if metadata:
+                            batch.append(metadata)
+
+                now = time.monotonic()
+                if batch and (len(batch) >= self.batch_size or now - last_flush >= self.batch_interval):
+                    self._flush(batch)
+                    batch = []
+                    last_flush = now
+        finally:
+            executor.shutdown(wait=False)
+
+        self.progressChanged.emit(done, total)
+        self.finished.emit(cancelled)
+
+    def _flush(self, batch):
+        self.batchReady.emit(batch)
+        self.progressChanged.emit(self._done, self._total)
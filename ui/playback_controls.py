@@ -1,14 +1,23 @@
-from PyQt5.QtWidgets import (QWidget, QHBoxLayout, QPushButton, QSlider,
+from PyQt5.QtWidgets import (QWidget, QHBoxLayout, QPushButton,
                              QStyle, QVBoxLayout, QLabel)
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtGui import QFont
 from audio.player import AudioPlayer
-import random
+from audio.shuffle import ShuffleEngine
+from utils import profiling
+from .waveform_cache import WaveformCache
+from .waveform_slider import WaveformSlider
+import time
+
+POSITION_UPDATE_MS = 200  # Position refresh rate while the window is shown
+BACKGROUND_UPDATE_MS = 1000  # Position refresh rate while minimized
+SEEK_COALESCE_MS = 40  # Slider moves within this window collapse into one seek
 
 class PlaybackControls(QWidget):
     # Add these signals at the start of the class
     trackChanged = pyqtSignal(str)  # Emitted when track changes
     playbackStateChanged = pyqtSignal(bool)  # Emitted when play/pause state changes
+    positionChanged = pyqtSignal(int)  # Emitted with the position in milliseconds
 
     def __init__(self):
         super().__init__()
@@ -17,13 +26,32 @@ class PlaybackControls(QWidget):
         self.current_index = -1
         self.is_shuffle = False
         self.is_repeat = False
-        self.shuffle_history = []  # Track shuffle history
-        self.shuffle_index = -1
+        self.shuffle = ShuffleEngine()  # Shuffled order over playlist indices
         
-        # Setup timer for progress updates
-        self.update_timer = QTimer()
-        self.update_timer.setInterval(1000)  # Update every second
+        # Single playback clock: the player is polled from this GUI timer, so
+        # its callbacks always run on the GUI thread. It stops while paused.
+        self.update_interval = POSITION_UPDATE_MS
+        self.is_minimized = False
+        self.update_timer = QTimer(self)
+        self.update_timer.setInterval(self.update_interval)
         self.update_timer.timeout.connect(self.update_progress)
+        self.player.on_track_finished = self.on_track_finished
+        self.player.on_position_changed = self.on_position_changed
+        self.player.on_track_started = self.on_queued_track_started
+        self.queued_index = None  # Playlist index handed to the player's queue
+        
+        # Scrubbing only applies the latest slider target, at most once per window
+        self.pending_seek = None
+        self.seek_requested_at = 0.0
+        self.last_seek_latency_ms = 0.0  # From slider move to the stream being repositioned
+        self.seek_timer = QTimer(self)
+        self.seek_timer.setSingleShot(True)
+        self.seek_timer.setInterval(SEEK_COALESCE_MS)
+        self.seek_timer.timeout.connect(self.apply_pending_seek)
+        
+        # Envelopes for the waveform seek bar, precomputed in the background
+        self.waveforms = WaveformCache(parent=self)
+        self.waveforms.waveformReady.connect(self.on_waveform_ready)
         
         self.init_ui()
     
@@ -38,7 +66,7 @@ class PlaybackControls(QWidget):
         self.time_label.setStyleSheet("color: #666;")
         progress_layout.addWidget(self.time_label)
         
-        self.progress_bar = QSlider(Qt.Horizontal)
+        self.progress_bar = WaveformSlider(Qt.Horizontal)
         self.progress_bar.setMinimum(0)
         self.progress_bar.setMaximum(1000)
         self.progress_bar.setStyleSheet("""
@@ -144,16 +172,71 @@ class PlaybackControls(QWidget):
     def load_track(self, track_path: str):
         """Load a new track for playback."""
         if self.player.load_track(track_path):
-            self.progress_bar.setMaximum(self.player.get_duration())
-            self.duration_label.setText(self.format_time(self.player.get_duration()))
-            self.trackChanged.emit(track_path)
+            self.show_track(track_path)
             self.play()
+            # Open the following track while this one plays
+            self.prepare_next_track()
+    
+    def show_track(self, track_path: str):
+        """Update the duration display for a newly started track."""
+        self.progress_bar.setMaximum(self.player.get_duration())
+        self.duration_label.setText(self.format_time(self.player.get_duration()))
+        self.progress_bar.set_waveform(self.waveforms.waveform(track_path))
+        self.trackChanged.emit(track_path)
+    
+    def on_waveform_ready(self, track_path: str):
+        """Draw an envelope that finished computing while its track plays."""
+        if track_path == self.player.current_track:
+            self.progress_bar.set_waveform(self.waveforms.waveform(track_path))
+    
+    def upcoming_index(self):
+        """Return the playlist index that plays when the current track ends, or None."""
+        if not self.current_playlist:
+            return None
+        if self.is_repeat:
+            return self.current_index
+        if self.is_shuffle:
+            if len(self.current_playlist) != self.shuffle.size:
+                self.shuffle.resize(len(self.current_playlist))
+            return self.shuffle.peek()
+        if self.current_index < len(self.current_playlist) - 1:
+            return self.current_index + 1
+        return None
+    
+    def prepare_next_track(self):
+        """Queue the upcoming track in the player so the switch is gapless."""
+        if not self.player.current_track:
+            return
+        index = self.upcoming_index()
+        path = self.current_playlist[index] if index is not None else None
+        self.queued_index = index if self.player.queue_next(path) and path else None
+    
+    def on_queued_track_started(self, track_path: str):
+        """The player switched to the queued track without a reload."""
+        index = self.queued_index
+        self.queued_index = None
+        if index is not None and not self.is_repeat:
+            if self.is_shuffle:
+                # The queued index was peeked, this makes it current
+                self.shuffle.next()
+            else:
+                self.shuffle.mark_played(index)
+            self.current_index = index
+        self.show_track(track_path)
+        self.prepare_next_track()
     
     def set_playlist(self, tracks: list, current_index: int = 0):
         """Set the current playlist and start playing from the specified index."""
+        if tracks is not self.current_playlist:
+            # The library hands out the same play order until it changes
+            self.shuffle.reset(len(tracks))
+        elif len(tracks) != self.shuffle.size:
+            # Same playlist edited in place
+            self.shuffle.resize(len(tracks))
         self.current_playlist = tracks
         self.current_index = current_index
         if tracks and 0 <= current_index < len(tracks):
+            self.shuffle.mark_played(current_index)
             self.load_track(tracks[current_index])
     
     def toggle_play(self):
@@ -168,6 +251,7 @@ class PlaybackControls(QWidget):
     def play(self):
         self.player.play()
         self.play_button.setIcon(self.style().standardIcon(QStyle.SP_MediaPause))
+        self.schedule_update()
         self.update_timer.start()
         self.playbackStateChanged.emit(True)
     
@@ -182,12 +266,13 @@ class PlaybackControls(QWidget):
             return
             
         if self.is_shuffle:
-            if self.shuffle_history and self.shuffle_index > 0:
-                self.shuffle_index -= 1
-                track = self.shuffle_history[self.shuffle_index]
-                self.load_track(track)
+            index = self.shuffle.previous()
+            if index is not None:
+                self.current_index = index
+                self.load_track(self.current_playlist[index])
         else:
             self.current_index = (self.current_index - 1) % len(self.current_playlist)
+            self.shuffle.mark_played(self.current_index)
             self.load_track(self.current_playlist[self.current_index])
     
     def next_track(self):
@@ -195,24 +280,18 @@ class PlaybackControls(QWidget):
             return
             
         if self.is_shuffle:
-            if self.shuffle_index < len(self.shuffle_history) - 1:
-                self.shuffle_index += 1
-                track = self.shuffle_history[self.shuffle_index]
-            else:
-                available_tracks = [t for t in self.current_playlist 
-                                  if t not in self.shuffle_history[-5:]]  # Avoid recent tracks
-                if not available_tracks:
-                    available_tracks = self.current_playlist
-                track = random.choice(available_tracks)
-                self.shuffle_history.append(track)
-                self.shuffle_index = len(self.shuffle_history) - 1
-            self.load_track(track)
+            if len(self.current_playlist) != self.shuffle.size:
+                self.shuffle.resize(len(self.current_playlist))
+            self.current_index = self.shuffle.next()
+            self.load_track(self.current_playlist[self.current_index])
         else:
             self.current_index = (self.current_index + 1) % len(self.current_playlist)
+            self.shuffle.mark_played(self.current_index)
             self.load_track(self.current_playlist[self.current_index])
     
     def toggle_shuffle(self):
         self.is_shuffle = not self.is_shuffle
+        self.prepare_next_track()
         self.shuffle_button.setStyleSheet(
             self.shuffle_button.styleSheet() +
             f"background-color: {'#1565C0' if self.is_shuffle else '#2196F3'};"
@@ -220,6 +299,7 @@ class PlaybackControls(QWidget):
     
     def toggle_repeat(self):
         self.is_repeat = not self.is_repeat
+        self.prepare_next_track()
         self.repeat_button.setStyleSheet(
             self.repeat_button.styleSheet() +
             f"background-color: {'#1565C0' if self.is_repeat else '#2196F3'};"
@@ -228,8 +308,23 @@ class PlaybackControls(QWidget):
     def seek_position(self, value):
         """Seek to position when user moves the slider."""
         if self.player.current_track:
-            self.player.seek(value)
+            if self.pending_seek is None:
+                self.seek_requested_at = time.perf_counter()
+            self.pending_seek = value
             self.time_label.setText(self.format_time(value))
+            if not self.seek_timer.isActive():
+                self.seek_timer.start()
+    
+    def apply_pending_seek(self):
+        """Seek to the latest slider target."""
+        self.seek_timer.stop()
+        if self.pending_seek is None:
+            return
+        target = self.pending_seek
+        self.pending_seek = None
+        self.player.seek(target)
+        self.last_seek_latency_ms = (time.perf_counter() - self.seek_requested_at) * 1000
+        self.schedule_update()
     
     def on_slider_pressed(self):
         """Called when user starts dragging the progress slider."""
@@ -237,15 +332,53 @@ class PlaybackControls(QWidget):
     
     def on_slider_released(self):
         """Called when user releases the progress slider."""
+        self.apply_pending_seek()
         if self.player.is_playing:
             self.update_timer.start()
     
     def update_progress(self):
+        """Poll the player for position and end-of-track updates."""
+        with profiling.span('playback.position_update'):
+            self.player.poll()
+        self.schedule_update()
+    
+    def schedule_update(self):
+        """Pick the next poll interval from the refresh rate and the time left."""
+        interval = BACKGROUND_UPDATE_MS if self.is_minimized else self.update_interval
+        # Wake up in time for the end of the track even at a low refresh rate
+        remaining = self.player.get_duration() - self.player.get_position()
+        if remaining > 0:
+            interval = min(interval, remaining + 20)
+        self.update_timer.setInterval(max(interval, 10))
+    
+    def set_update_interval(self, interval_ms: int):
+        """Set how often the position is refreshed while the window is shown."""
+        self.update_interval = max(10, interval_ms)
+        self.schedule_update()
+    
+    def set_minimized(self, minimized: bool):
+        """Lower the refresh rate while the window is minimized."""
+        self.is_minimized = minimized
+        self.schedule_update()
+    
+    def on_position_changed(self, position):
         """Update progress bar position and time label."""
-        if self.player.is_playing:
-            position = self.player.get_position()
+        if not self.progress_bar.isSliderDown():
             self.progress_bar.setValue(position)
             self.time_label.setText(self.format_time(position))
+        self.positionChanged.emit(position)
+    
+    def on_track_finished(self):
+        """Move on when the current track ends."""
+        if self.is_repeat and self.player.current_track:
+            self.load_track(self.player.current_track)
+        elif self.is_shuffle or self.current_index < len(self.current_playlist) - 1:
+            self.next_track()
+        else:
+            # End of the playlist
+            self.play_button.setIcon(self.style().standardIcon(QStyle.SP_MediaPlay))
+            self.update_timer.stop()
+            self.playbackStateChanged.emit(False)
     
     def set_volume(self, volume: float):
         """Set the playback volume."""
@@ -0,0 +1,168 @@
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Optional, Tuple
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from audio.waveform import Waveform, analyze_track, init_decoder_process
+from database.waveforms import WaveformStore
+from utils import profiling
+
+MEMORY_ENTRIES = 32  # Envelopes kept in memory; only the playing track is drawn
+
+
+class WaveformCache(QObject):
+    """Track envelopes, computed by a low-priority worker process and stored on disk.
+
+    waveform() never blocks: on a miss the track jumps the queue and
+    waveformReady is emitted once its envelope can be drawn. queue() adds
+    tracks to a background pass that fills the store one track at a time,
+    so envelopes are usually ready before a track is first played. With
+    replay_gain set, the same decode also measures the loudness of tracks
+    that have no ReplayGain yet.
+    """
+    waveformReady = pyqtSignal(str)  # Track path
+
+    def __init__(self, store: Optional[WaveformStore] = None, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.replay_gain = None  # Optional audio.replaygain.ReplayGain, measured in the same pass
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._urgent = deque()  # Tracks waiting to be shown
+        self._background = deque()  # Library tracks to precompute
+        self._queued = set()  # Paths in either queue
+        self._memory: "OrderedDict[str, Optional[Waveform]]" = OrderedDict()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def waveform(self, track_path: str) -> Optional[Waveform]:
+        """Return a track's envelope, or None if it is unavailable or still being computed."""
+        with self._lock:
+            if track_path in self._memory:
+                self._memory.move_to_end(track_path)
+                return self._memory[track_path]
+        self._enqueue([track_path], urgent=True)
+        return None
+
+    def queue(self, paths: Iterable[str]):
+        """Precompute envelopes for tracks in the background."""
+        self._enqueue(paths, urgent=False)
+
+    def shutdown(self):
+        """Drop queued work and stop the worker process."""
+        with self._lock:
+            self._stopped = True
+            self._urgent.clear()
+            self._background.clear()
+            self._queued.clear()
+            self._wake.notify()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            try:
+                executor.shutdown(wait=False, cancel_futures=True)
+            except TypeError:
+                # cancel_futures needs Python 3.9
+                executor.shutdown(wait=False)
+
+    def _enqueue(self, paths: Iterable[str], urgent: bool):
+        with self._lock:
+            if self._stopped:
+                return
+            for path in paths:
+                if urgent:
+                    # Promote a track already waiting in the background pass
+                    self._urgent.append(path)
+                elif path not in self._queued:
+                    self._background.append(path)
+                self._queued.add(path)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def _next(self):
+        """Wait for the next queued track; returns (path, urgent) or None once shut down."""
+        with self._lock:
+            while not self._stopped:
+                if self._urgent:
+                    return self._urgent.popleft(), True
+                while self._background:
+                    path = self._background.popleft()
+                    if path in self._queued:
+                        return path, False
+                self._wake.wait()
+            return None
+
+    def _run(self):
+        """Coordinator loop: serve tracks from the store, otherwise analyze them one at a time."""
+        if self.store is None:
+            self.store = WaveformStore()
+        while True:
+            item = self._next()
+            if item is None:
+                break
+            path, urgent = item
+            with self._lock:
+                if path not in self._queued:
+                    continue  # Already served as an urgent request
+                self._queued.discard(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            waveform = self.store.get(path, stat.st_size, stat.st_mtime)
+            measure = self.replay_gain is not None and self.replay_gain.prepare(path, stat)
+            if waveform is None or measure:
+                try:
+                    analyzed, loudness = self._analyze(path, measure)
+                except Exception as e:
+                    # Not stored, the track is analyzed again next session
+                    if not self._stopped:
+                        print(f"Error in waveform worker: {e}")
+                else:
+                    if waveform is None:
+                        waveform = analyzed
+                        self.store.put(path, stat.st_size, stat.st_mtime, waveform)
+                        profiling.count('waveform.analyzed')
+                    if measure:
+                        self.replay_gain.store_analysis(path, stat, loudness)
+                if self._stopped:
+                    break
+            if urgent:
+                self._remember(path, waveform if waveform and waveform.peaks else None)
+                self.waveformReady.emit(path)
+
+    def _analyze(self, path: str, loudness: bool) -> Tuple[Optional[Waveform], Optional[tuple]]:
+        """Decode a track in the worker process for its envelope and, if asked, its loudness."""
+        with self._lock:
+            if self._executor is None and not self._stopped:
+                # Spawned rather than forked, the GUI process has Qt and SDL threads running
+                self._executor = ProcessPoolExecutor(
+                    max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=init_decoder_process
+                )
+            executor = self._executor
+        if executor is None:
+            raise RuntimeError("waveform cache is shut down")
+        try:
+            with profiling.span('waveform.analyze'):
+                return executor.submit(analyze_track, path, loudness).result()
+        except BrokenProcessPool:
+            # A track crashed the decoder; start a fresh worker for the next one
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+
+    def _remember(self, path: str, waveform: Optional[Waveform]):
+        with self._lock:
+            self._memory[path] = waveform
+            self._memory.move_to_end(path)
+            while len(self._memory) > MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
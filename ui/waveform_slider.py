@@ -0,0 +1,119 @@
+from typing import Optional
+
+from PyQt5.QtWidgets import QSlider, QStyle
+from PyQt5.QtCore import Qt, QRect
+from PyQt5.QtGui import QColor, QPainter, QPixmap
+
+from audio.waveform import Waveform
+
+WAVEFORM_HEIGHT = 36
+PEAK_COLOR = QColor('#90CAF9')
+RMS_COLOR = QColor('#42A5F5')
+PLAYED_PEAK_COLOR = QColor('#1976D2')
+PLAYED_RMS_COLOR = QColor('#0D47A1')
+CURSOR_COLOR = QColor('#F44336')
+
+
+class WaveformSlider(QSlider):
+    """Progress slider that draws the track's peak and RMS envelope once one is set.
+
+    The envelope is rendered to two pixmaps (unplayed and played colours) when
+    the track or the widget size changes; a repaint just blits them, split at
+    the current position. Without an envelope it is a plain styled slider.
+    """
+
+    def __init__(self, orientation=Qt.Horizontal, parent=None):
+        super().__init__(orientation, parent)
+        self.setMinimumHeight(WAVEFORM_HEIGHT)
+        self.waveform: Optional[Waveform] = None
+        self._pixmaps = None  # (unplayed, played), rendered for the current size
+
+    def set_waveform(self, waveform: Optional[Waveform]):
+        """Show a track's envelope, or the plain slider with None."""
+        self.waveform = waveform if waveform and waveform.peaks else None
+        self._pixmaps = None
+        self.update()
+
+    def resizeEvent(self, event):
+        self._pixmaps = None
+        super().resizeEvent(event)
+
+    def _render(self, width: int, height: int):
+        """Draw the envelope as one column per pixel, louder parts taller."""
+        import numpy as np
+        peaks = np.frombuffer(self.waveform.peaks, dtype=np.uint8)
+        rms = np.frombuffer(self.waveform.rms, dtype=np.uint8)
+        # Largest value of the bins falling into each pixel column
+        edges = np.minimum((np.arange(width) * len(peaks)) // width, len(peaks) - 1)
+        column_peaks = np.maximum.reduceat(peaks, edges) if width <= len(peaks) else peaks[edges]
+        column_rms = np.maximum.reduceat(rms, edges) if width <= len(rms) else rms[edges]
+        # Scaled to the loudest point, so quiet tracks still show their shape
+        scale = (height / 2 - 1) / max(int(column_peaks.max()), 1)
+        peak_heights = np.maximum(np.round(column_peaks * scale), 1).astype(int)
+        rms_heights = np.round(column_rms * scale).astype(int)
+
+        middle = height // 2
+        pixmaps = []
+        for peak_color, rms_color in ((PEAK_COLOR, RMS_COLOR), (PLAYED_PEAK_COLOR, PLAYED_RMS_COLOR)):
+            pixmap = QPixmap(width, height)
+            pixmap.fill(Qt.transparent)
+            painter = QPainter(pixmap)
+            for color, heights in ((peak_color, peak_heights), (rms_color, rms_heights)):
+                painter.setPen(color)
+                for x, h in enumerate(heights.tolist()):
+                    if h:
+                        painter.drawLine(x, middle - h, x, middle + h)
+            painter.end()
+            pixmaps.append(pixmap)
+        self._pixmaps = tuple(pixmaps)
+
+    def position_x(self) -> int:
+        """Return the x coordinate of the current slider position."""
+        return QStyle.sliderPositionFromValue(
+            self.minimum(), self.maximum(), self.sliderPosition(), max(self.width() - 1, 0)
+        )
+
+    def paintEvent(self, event):
+        if self.waveform is None:
+            super().paintEvent(event)
+            return
+        width, height = self.width(), self.height()
+        if self._pixmaps is None or self._pixmaps[0].width() != width:
+            self._render(width, height)
+        unplayed, played = self._pixmaps
+        x = self.position_x()
+        painter = QPainter(self)
+        painter.drawPixmap(QRect(x, 0, width - x, height), unplayed, QRect(x, 0, width - x, height))
+        painter.drawPixmap(QRect(0, 0, x, height), played, QRect(0, 0, x, height))
+        painter.setPen(CURSOR_COLOR)
+        painter.drawLine(x, 0, x, height)
+        painter.end()
+
+    def _value_at(self, x: int) -> int:
+        return QStyle.sliderValueFromPosition(
+            self.minimum(), self.maximum(), min(max(x, 0), self.width() - 1), max(self.width() - 1, 1)
+        )
+
+    # The waveform has no handle to grab: pressing anywhere jumps there and starts a drag
+
+    def mousePressEvent(self, event):
+        if self.waveform is None or event.button() != Qt.LeftButton:
+            super().mousePressEvent(event)
+            return
+        self.setSliderDown(True)
+        self.setSliderPosition(self._value_at(event.pos().x()))
+        event.accept()
+
+    def mouseMoveEvent(self, event):
+        if self.waveform is None or not self.isSliderDown():
+            super().mouseMoveEvent(event)
+            return
+        self.setSliderPosition(self._value_at(event.pos().x()))
+        event.accept()
+
+    def mouseReleaseEvent(self, event):
+        if self.waveform is None or not self.isSliderDown():
+            super().mouseReleaseEvent(event)
+            return
+        self.setSliderDown(False)
+        event.accept()
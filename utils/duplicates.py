@@ -0,0 +1,226 @@
+import hashlib
+import os
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CHUNK_SIZE = 1024 * 1024  # Bytes read and hashed at a time
+HEAD_BYTES = 256 * 1024  # Payload prefix compared before whole files are hashed
+PROGRESS_INTERVAL = 100  # Files between progress callbacks
+
+
+def default_worker_count() -> int:
+    """Return the number of hashing threads; hashlib releases the GIL while hashing."""
+    return min(8, (os.cpu_count() or 1) * 2)
+
+
+def _syncsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _chunk_range(f, size: int, byte_order: str, wanted: bytes) -> List[Tuple[int, int]]:
+    """Find the audio chunk of a RIFF (WAV) or IFF (AIFF) file."""
+    position = 12
+    while position + 8 <= size:
+        f.seek(position)
+        header = f.read(8)
+        length = int.from_bytes(header[4:8], byte_order)
+        if header[:4] == wanted:
+            return [(position + 8, min(position + 8 + length, size))]
+        # Chunks are padded to an even length
+        position += 8 + length + (length & 1)
+    return [(0, size)]
+
+
+def _mp4_ranges(f, size: int) -> List[Tuple[int, int]]:
+    """Find the mdat atoms of an MP4 file; tags live in moov, which retagging rewrites."""
+    ranges = []
+    position = 0
+    while position + 8 <= size:
+        f.seek(position)
+        header = f.read(8)
+        length = int.from_bytes(header[:4], 'big')
+        header_size = 8
+        if length == 1:
+            length = int.from_bytes(f.read(8), 'big')
+            header_size = 16
+        elif length == 0:
+            length = size - position
+        if length < header_size:
+            break
+        if header[4:8] == b'mdat':
+            ranges.append((position + header_size, min(position + length, size)))
+        position += length
+    return ranges or [(0, size)]
+
+
+def _strip_tail_tags(f, start: int, end: int) -> int:
+    """Return the end of the audio before ID3v1 and APEv2 tags."""
+    if end - start >= 128:
+        f.seek(end - 128)
+        if f.read(3) == b'TAG':
+            end -= 128
+            if end - start >= 227:
+                f.seek(end - 227)
+                if f.read(4) == b'TAG+':
+                    # Enhanced ID3v1 block in front of the plain one
+                    end -= 227
+    if end - start >= 32:
+        f.seek(end - 32)
+        footer = f.read(32)
+        if footer[:8] == b'APETAGEX':
+            tag_size = int.from_bytes(footer[12:16], 'little')
+            flags = int.from_bytes(footer[20:24], 'little')
+            end -= tag_size + (32 if flags & 0x80000000 else 0)
+    return max(end, start)
+
+
+def payload_ranges(f, size: int) -> Optional[List[Tuple[int, int]]]:
+    """Return the byte ranges of an open file that hold audio rather than tags.
+
+    Skips ID3v2, ID3v1 and APEv2 tags and FLAC metadata blocks, and picks the
+    audio chunks of WAV, AIFF and MP4 files. Returns None for Ogg streams,
+    whose comment packets shift every page header after them.
+    """
+    f.seek(0)
+    head = f.read(12)
+    if head[:4] == b'OggS':
+        return None
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return _chunk_range(f, size, 'little', b'data')
+    if head[:4] == b'FORM' and head[8:12] in (b'AIFF', b'AIFC'):
+        return _chunk_range(f, size, 'big', b'SSND')
+    if head[4:8] == b'ftyp':
+        return _mp4_ranges(f, size)
+
+    start = 0
+    while True:
+        f.seek(start)
+        header = f.read(10)
+        if len(header) < 10 or header[:3] != b'ID3':
+            break
+        # A footer flag adds a 10 byte footer
+        start += 10 + _syncsafe(header[6:10]) + (10 if header[5] & 0x10 else 0)
+    if header[:4] == b'fLaC':
+        position = start + 4
+        last = False
+        while not last and position + 4 <= size:
+            f.seek(position)
+            block = f.read(4)
+            last = bool(block[0] & 0x80)
+            position += 4 + int.from_bytes(block[1:4], 'big')
+        start = min(position, size)
+    end = _strip_tail_tags(f, start, size)
+    return [(start, end)] if end > start else []
+
+
+def _hash_ogg(f, digest, limit: Optional[int]) -> int:
+    """Hash the packet data of the audio pages of an Ogg stream, skipping headers and comments."""
+    f.seek(0)
+    hashed = 0
+    while limit is None or hashed < limit:
+        header = f.read(27)
+        if len(header) < 27 or header[:4] != b'OggS':
+            break
+        length = sum(f.read(header[26]))
+        if int.from_bytes(header[6:14], 'little') == 0:
+            # Identification, comment and setup headers all have granule position 0
+            f.seek(length, 1)
+            continue
+        data = f.read(length)
+        digest.update(data)
+        hashed += len(data)
+    return hashed
+
+
+def hash_payload(path: str, limit: Optional[int] = None) -> Optional[Tuple[Optional[int], str]]:
+    """Return (audio payload length, digest) of a file, hashing at most limit payload bytes.
+
+    Files are read in CHUNK_SIZE pieces, never whole. The length is None for
+    Ogg streams. Returns None if the file cannot be read.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            ranges = payload_ranges(f, size)
+            if ranges is None:
+                _hash_ogg(f, digest, limit)
+                return None, digest.hexdigest()
+            total = sum(end - start for start, end in ranges)
+            remaining = total if limit is None else min(limit, total)
+            for start, end in ranges:
+                f.seek(start)
+                left = min(end - start, remaining)
+                remaining -= left
+                while left > 0:
+                    data = f.read(min(CHUNK_SIZE, left))
+                    if not data:
+                        break
+                    digest.update(data)
+                    left -= len(data)
+                if remaining <= 0:
+                    break
+            return total, digest.hexdigest()
+    except OSError as e:
+        print(f"Error hashing {path}: {e}")
+        return None
+
+
+def _refine(groups: List[List[str]], key: Callable[[str], object], executor, workers: int,
+            progress: Optional[Callable[[int, int], None]],
+            cancel: Optional[threading.Event]) -> List[List[str]]:
+    """Split each group by key(path), computed on the pool; drop groups left with one track."""
+    items = [(index, path) for index, group in enumerate(groups) for path in group]
+    buckets = defaultdict(list)
+    in_flight = deque()
+    position = 0
+    done = 0
+    while position < len(items) or in_flight:
+        # A bounded window keeps cancelling quick
+        while position < len(items) and len(in_flight) < workers * 4:
+            index, path = items[position]
+            in_flight.append((index, path, executor.submit(key, path)))
+            position += 1
+        index, path, future = in_flight.popleft()
+        value = future.result()
+        if value is not None:
+            buckets[(index, value)].append(path)
+        done += 1
+        if cancel is not None and cancel.is_set():
+            for _, _, future in in_flight:
+                future.cancel()
+            return []
+        if progress is not None and (done % PROGRESS_INTERVAL == 0 or done == len(items)):
+            progress(done, len(items))
+    return [bucket for bucket in buckets.values() if len(bucket) > 1]
+
+
+def find_duplicates(tracks: Iterable[Dict], workers: Optional[int] = None,
+                    progress: Optional[Callable[[int, int], None]] = None,
+                    cancel: Optional[threading.Event] = None) -> List[List[str]]:
+    """Return groups of track paths whose audio is identical, ignoring tags.
+
+    Candidates are grouped by format and duration from the stored metadata,
+    then narrowed by payload length and a hash of the first HEAD_BYTES, and
+    only the remaining ones are hashed in full. progress(done, total) is
+    called during each hashing pass.
+    """
+    candidates = defaultdict(list)
+    for track in tracks:
+        path = track['path']
+        extension = track.get('extension') or os.path.splitext(path)[1].lower()
+        length = track.get('length')
+        candidates[(extension, round(length) if length else None)].append(path)
+    groups = [sorted(group) for group in candidates.values() if len(group) > 1]
+
+    workers = workers or default_worker_count()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='duplicates') as executor:
+        groups = _refine(groups, lambda path: hash_payload(path, HEAD_BYTES), executor, workers,
+                         progress, cancel)
+        groups = _refine(groups, hash_payload, executor, workers, progress, cancel)
+    if cancel is not None and cancel.is_set():
+        return []
+    groups.sort(key=lambda group: group[0])
+    return groups
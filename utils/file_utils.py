@@ -1,48 +1,296 @@
 import os
-from typing import List, Dict
-from pathlib import Path
+import threading
+from typing import List, Dict, Set, Iterable, Iterator, Optional, Tuple
 
 SUPPORTED_FORMATS = {'.mp3', '.wav', '.flac', '.m4a', '.ogg'}
 
+
+def get_app_data_dir() -> str:
+    """Return the folder used for the library database and caches."""
+    data_dir = os.environ.get('MUSIC_APP_DATA_DIR') or os.path.join(
+        os.path.expanduser('~'), '.music_app'
+    )
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
+
+def scan_music_files(folder_path: str, cancel_event: Optional[threading.Event] = None,
+                     follow_symlinks: bool = True) -> Iterator[Tuple[str, str, str, os.stat_result]]:
+    """Yield (path, filename, folder, stat) for every supported file below a folder.
+    
+    Directories are read with os.scandir and files are yielded as soon as their
+    directory is read. Symlinked directories are followed once; a directory
+    already visited through another link is skipped so link loops terminate.
+    """
+    try:
+        root_stat = os.stat(folder_path)
+    except OSError:
+        return
+    visited = {(root_stat.st_dev, root_stat.st_ino)}
+    pending = [folder_path]
+    
+    while pending:
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        folder = pending.pop()
+        subfolders = []
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=follow_symlinks):
+                            if entry.is_symlink():
+                                target = entry.stat(follow_symlinks=True)
+                                key = (target.st_dev, target.st_ino)
+                            else:
+                                key = (entry.stat(follow_symlinks=False).st_dev, entry.inode())
+                            if key not in visited:
+                                visited.add(key)
+                                subfolders.append(entry.path)
+                            continue
+                        name = entry.name
+                        dot = name.rfind('.')
+                        if dot <= 0 or name[dot:].lower() not in SUPPORTED_FORMATS:
+                            continue
+                        if not entry.is_file(follow_symlinks=follow_symlinks):
+                            continue
+                        stat = entry.stat(follow_symlinks=follow_symlinks)
+                    except OSError:
+                        # Broken link or entry removed while scanning
+                        continue
+                    yield entry.path, name, folder, stat
+        except OSError as e:
+            print(f"Error scanning {folder}: {e}")
+            continue
+        # Depth first, visiting subfolders in listing order
+        pending.extend(reversed(subfolders))
+
+
+def _path_key(path: str) -> str:
+    """Return the form of a path used to compare it: normalised, and casefolded where the OS is."""
+    return os.path.normcase(os.path.normpath(path))
+
+
+def _is_within(path: str, folder: str) -> bool:
+    """Return True if path is folder itself or lies below it, by whole path components."""
+    path = _path_key(path)
+    folder = _path_key(folder)
+    return path == folder or path.startswith(folder.rstrip(os.sep) + os.sep)
+
+
 class MusicLibrary:
-    def __init__(self):
+    def __init__(self, catalog=None, load: bool = True):
         self.music_folders: List[str] = []
         self.tracks: Dict[str, Dict] = {}  # path -> track info
+        self.catalog = catalog  # Optional database.catalog.LibraryCatalog
+        self._stale: Set[str] = set()  # Tracks whose metadata must be re-read
+        # Folder hierarchy index: directory -> its tracks, directory -> subdirectories holding tracks
+        self._folder_tracks: Dict[str, Set[str]] = {}
+        self._subfolders: Dict[str, Set[str]] = {}
+        if self.catalog is not None and load:
+            self.load_from_catalog()
+    
+    def load_from_catalog(self):
+        """Load folders and tracks stored by a previous session."""
+        self.music_folders = self.catalog.get_folders()
+        self.tracks = {}
+        self._folder_tracks.clear()
+        self._subfolders.clear()
+        self._stale.clear()
+        self.merge_tracks(self.catalog.get_all_tracks())
+    
+    def merge_tracks(self, tracks: Iterable[Dict]):
+        """Add stored tracks the library does not know yet, keeping the ones it has."""
+        for track in tracks:
+            path = track['path']
+            if path not in self.tracks:
+                self.tracks[path] = track
+                self._index_track(path, track.get('folder'))
     
     def add_folder(self, folder_path: str) -> List[str]:
         """Add a folder to the music library and scan for music files."""
+        return self.scan_folder(self.register_folder(folder_path))
+    
+    def register_folder(self, folder_path: str) -> str:
+        """Add a folder to the music library without scanning it.
+        
+        Returns the folder as the library stores it; spellings of an
+        already registered folder return that folder.
+        """
         if not os.path.exists(folder_path):
             raise ValueError(f"Folder does not exist: {folder_path}")
         
+        known = self._find_folder(folder_path)
+        if known is not None:
+            return known
+        folder_path = os.path.normpath(folder_path)
         self.music_folders.append(folder_path)
-        return self.scan_folder(folder_path)
+        if self.catalog is not None:
+            self.catalog.add_folder(folder_path)
+        return folder_path
     
     def scan_folder(self, folder_path: str) -> List[str]:
         """Scan a folder for music files and return list of found files."""
-        music_files = []
+        return list(self.iter_folder(folder_path))
+    
+    def iter_folder(self, folder_path: str,
+                    cancel_event: Optional[threading.Event] = None) -> Iterator[str]:
+        """Scan a folder, yielding the path of each music file as it is found."""
+        for entry in scan_music_files(os.path.normpath(folder_path), cancel_event):
+            yield self.add_scanned_file(*entry)
+    
+    def add_scanned_file(self, full_path: str, filename: str, folder: str,
+                         stat: os.stat_result) -> str:
+        """Record a file found by scan_music_files and return its path.
+        
+        A file that is new or changed since its stored row is marked as
+        needing its metadata read.
+        """
+        full_path = os.path.normpath(full_path)
+        folder = os.path.normpath(folder)
+        known = self.tracks.get(full_path)
+        if (known and full_path not in self._stale
+                and known.get('size') == stat.st_size
+                and known.get('modified') == stat.st_mtime):
+            # Unchanged since the stored row, keep its metadata
+            return full_path
+        if known is None:
+            self._index_track(full_path, folder)
+        self.tracks[full_path] = {
+            'path': full_path,
+            'filename': filename,
+            'folder': folder,
+            'size': stat.st_size,
+            'modified': stat.st_mtime
+        }
+        self._stale.add(full_path)
+        return full_path
+    
+    def prune_missing(self, folder_path: str, found: List[str]) -> List[str]:
+        """Drop known tracks under a folder that were not found by a scan."""
+        found_set = set(found)
+        missing = [path for path in self.tracks_under(folder_path) if path not in found_set]
+        self._drop_tracks(missing)
+        if missing and self.catalog is not None:
+            self.catalog.remove_tracks(missing)
+        return missing
+    
+    def needs_metadata(self, track_path: str) -> bool:
+        """Return True if a track is new or changed since its metadata was read."""
+        return track_path in self._stale
+    
+    def store_metadata(self, entries: List[Dict]):
+        """Merge freshly read metadata into the library and persist it."""
+        stored = []
+        for metadata in entries:
+            path = metadata.get('path')
+            if path not in self.tracks:
+                continue
+            track = self.tracks[path]
+            # None marks a tag the file no longer has, so it clears the stored value
+            track.update(metadata)
+            self._stale.discard(path)
+            stored.append(track)
+        if stored and self.catalog is not None:
+            self.catalog.upsert_tracks(stored)
+    
+    def remove_folder(self, folder_path: str) -> List[str]:
+        """Remove a folder and its tracks from the library, returning the removed paths.
         
-        for root, _, files in os.walk(folder_path):
-            for file in files:
-                if Path(file).suffix.lower() in SUPPORTED_FORMATS:
-                    full_path = os.path.join(root, file)
-                    self.tracks[full_path] = {
-                        'path': full_path,
-                        'filename': file,
-                        'folder': root
-                    }
-                    music_files.append(full_path)
+        Tracks also inside another registered folder stay in the library.
+        """
+        folder_path = self._find_folder(folder_path)
+        if folder_path is None:
+            return []
+        self.music_folders.remove(folder_path)
+        removed = []
+        if not any(_is_within(folder_path, other) for other in self.music_folders):
+            removed = self.tracks_under(folder_path)
+            nested = [other for other in self.music_folders if _is_within(other, folder_path)]
+            if nested:
+                kept = set()
+                for other in nested:
+                    kept.update(self.tracks_under(other))
+                removed = [path for path in removed if path not in kept]
+        self._drop_tracks(removed)
+        if self.catalog is not None:
+            self.catalog.remove_folder(folder_path, remove_tracks=False)
+            self.catalog.remove_tracks(removed)
+        return removed
+    
+    def remove_tracks(self, paths: Iterable[str]) -> List[str]:
+        """Remove tracks from the library, returning the ones that were in it."""
+        removed = [path for path in paths if path in self.tracks]
+        self._drop_tracks(removed)
+        if removed and self.catalog is not None:
+            self.catalog.remove_tracks(removed)
+        return removed
+    
+    def tracks_under(self, folder_path: str) -> List[str]:
+        """Return the tracks inside a folder or any of its subfolders.
         
-        return music_files
-    
-    def remove_folder(self, folder_path: str):
-        """Remove a folder and its tracks from the library."""
-        if folder_path in self.music_folders:
-            self.music_folders.remove(folder_path)
-            # Remove tracks from this folder
-            self.tracks = {
-                path: info for path, info in self.tracks.items()
-                if not path.startswith(folder_path)
-            }
+        Only the directories below the folder are visited, so the cost
+        follows the number of affected tracks, not the library size.
+        """
+        paths = []
+        pending = [_path_key(folder_path)]
+        while pending:
+            folder = pending.pop()
+            paths.extend(self._folder_tracks.get(folder, ()))
+            pending.extend(self._subfolders.get(folder, ()))
+        return paths
+    
+    def _index_track(self, path: str, folder: Optional[str]):
+        """Add a track to the folder index."""
+        folder = _path_key(folder or os.path.dirname(path))
+        tracks = self._folder_tracks.get(folder)
+        if tracks is None:
+            tracks = self._folder_tracks[folder] = set()
+        tracks.add(path)
+        # Link the folder into its ancestors, stopping at the first known link
+        while True:
+            parent = os.path.dirname(folder)
+            if parent == folder:
+                break
+            children = self._subfolders.get(parent)
+            if children is None:
+                children = self._subfolders[parent] = set()
+            elif folder in children:
+                break
+            children.add(folder)
+            folder = parent
+    
+    def _unindex_track(self, path: str, folder: Optional[str]):
+        """Remove a track from the folder index, pruning folders left empty."""
+        folder = _path_key(folder or os.path.dirname(path))
+        tracks = self._folder_tracks.get(folder)
+        if tracks is None:
+            return
+        tracks.discard(path)
+        while not self._folder_tracks.get(folder) and not self._subfolders.get(folder):
+            self._folder_tracks.pop(folder, None)
+            self._subfolders.pop(folder, None)
+            parent = os.path.dirname(folder)
+            if parent == folder or parent not in self._subfolders:
+                break
+            self._subfolders[parent].discard(folder)
+            folder = parent
+    
+    def _find_folder(self, folder_path: str) -> Optional[str]:
+        """Return the registered folder naming the same directory, or None."""
+        key = _path_key(folder_path)
+        for folder in self.music_folders:
+            if _path_key(folder) == key:
+                return folder
+        return None
+    
+    def _drop_tracks(self, paths: Iterable[str]):
+        """Forget tracks in memory and in the folder index."""
+        for path in paths:
+            track = self.tracks.pop(path, None)
+            if track is not None:
+                self._unindex_track(path, track.get('folder'))
+            self._stale.discard(path)
     
     def get_all_tracks(self) -> List[Dict]:
         """Return all tracks in the library."""
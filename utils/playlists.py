@@ -0,0 +1,175 @@
+import os
+from collections import OrderedDict
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class Playlist:
+    """Ordered, duplicate-free list of track paths.
+
+    Backed by an insertion-ordered dict, so membership tests, adds,
+    removals and moves to either end are O(1); a move elsewhere costs the
+    tracks that follow the new position.
+    """
+
+    def __init__(self, name: str, paths: Iterable[str] = ()):
+        self.name = name
+        self.tracks: "OrderedDict[str, None]" = OrderedDict.fromkeys(paths)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.tracks
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __iter__(self):
+        return iter(self.tracks)
+
+    def add(self, path: str) -> bool:
+        """Append a track, returning False if it is already in the playlist."""
+        if path in self.tracks:
+            return False
+        self.tracks[path] = None
+        return True
+
+    def remove(self, path: str) -> bool:
+        """Remove a track, returning False if it was not in the playlist."""
+        return self.tracks.pop(path, False) is None
+
+    def move_to_end(self, path: str, last: bool = True):
+        """Move a track to the end, or to the start with last=False."""
+        self.tracks.move_to_end(path, last)
+
+    def move(self, path: str, index: int) -> int:
+        """Move a track to a position, clamped to the playlist; returns the position used."""
+        index = max(0, min(index, len(self.tracks) - 1))
+        if index == 0:
+            self.tracks.move_to_end(path, last=False)
+            return index
+        self.tracks.move_to_end(path)
+        # Send the tracks that belong after it to the end too
+        for other in list(islice(self.tracks, index, len(self.tracks) - 1)):
+            self.tracks.move_to_end(other)
+        return index
+
+    def index(self, path: str) -> int:
+        """Return the position of a track."""
+        for index, other in enumerate(self.tracks):
+            if other == path:
+                return index
+        raise ValueError(f"{path} is not in playlist {self.name}")
+
+    def paths(self) -> List[str]:
+        """Return the tracks in playlist order."""
+        return list(self.tracks)
+
+
+class LibraryPathResolver:
+    """Maps playlist entries to library tracks.
+
+    Entries are tried as written (relative ones against the playlist's
+    folder) and otherwise matched by file name, preferring the library
+    track whose path ends with the entry's folders. This finds tracks in
+    playlists written on another machine or for a moved library.
+    """
+
+    def __init__(self, library_paths: Iterable[str]):
+        self.library_paths = library_paths
+        self._known: Optional[set] = None
+        self._by_name: Optional[Dict[str, List[str]]] = None
+
+    def _build(self):
+        self._known = set(self.library_paths)
+        self._by_name = {}
+        for path in self._known:
+            self._by_name.setdefault(os.path.basename(path).casefold(), []).append(path)
+
+    def resolve(self, entry: str, base_dir: str) -> Optional[str]:
+        """Return the library path for a playlist entry, or None if it is not in the library."""
+        if self._known is None:
+            self._build()
+        if entry.startswith('file://'):
+            from urllib.parse import unquote, urlparse
+            entry = unquote(urlparse(entry).path)
+            if os.name == 'nt' and entry.startswith('/'):
+                entry = entry[1:]
+        elif '://' in entry:
+            return None
+
+        # Playlists from other systems may use the other separator
+        entry = entry.replace('\\', os.sep).replace('/', os.sep)
+        path = os.path.normpath(entry if os.path.isabs(entry) else os.path.join(base_dir, entry))
+        if path in self._known:
+            return path
+
+        candidates = self._by_name.get(os.path.basename(entry).casefold())
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        # Prefer the candidate sharing the most trailing path components
+        parts = entry.casefold().split(os.sep)
+        return max(candidates, key=lambda candidate: _shared_suffix(candidate.casefold().split(os.sep), parts))
+
+
+def _shared_suffix(a: List[str], b: List[str]) -> int:
+    shared = 0
+    while shared < min(len(a), len(b)) and a[-1 - shared] == b[-1 - shared]:
+        shared += 1
+    return shared
+
+
+def _decode_m3u_line(line: bytes) -> str:
+    """Decode a plain M3U line: UTF-8 if it is valid, else the Windows Latin code page."""
+    try:
+        return line.decode('utf-8')
+    except UnicodeDecodeError:
+        pass
+    try:
+        return line.decode('cp1252')
+    except UnicodeDecodeError:
+        # Bytes cp1252 leaves undefined
+        return line.decode('latin-1')
+
+
+def iter_m3u(file_path: str) -> Iterator[str]:
+    """Yield the track entries of an M3U/M3U8 file one line at a time."""
+    with open(file_path, 'rb') as f:
+        if file_path.lower().endswith('.m3u8'):
+            # M3U8 is UTF-8 by definition; other bytes pass through as-is
+            lines = (line.decode('utf-8', 'surrogateescape') for line in f)
+        else:
+            # Plain M3U has no declared encoding, Windows players write the ANSI code page
+            lines = (_decode_m3u_line(line) for line in f)
+        for line in lines:
+            line = line.strip().lstrip('\ufeff')
+            if line and not line.startswith('#'):
+                yield line
+
+
+def write_m3u(file_path: str, entries: Iterable[Tuple[str, Optional[float], str]],
+              relative: bool = True) -> int:
+    """Write (path, seconds, display name) entries as an extended M3U file, one line at a time.
+
+    Paths below the playlist's folder are written relative to it when
+    relative is True. Returns the number of entries written.
+    """
+    base_dir = os.path.dirname(os.path.abspath(file_path))
+    written = 0
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8', errors='surrogateescape', newline='\n') as f:
+        f.write('#EXTM3U\n')
+        for path, seconds, display in entries:
+            location = path
+            if relative:
+                try:
+                    candidate = os.path.relpath(path, base_dir)
+                except ValueError:
+                    candidate = None  # Another drive on Windows
+                if candidate and not candidate.startswith(os.pardir):
+                    location = candidate
+            length = int(seconds) if seconds else -1
+            f.write(f'#EXTINF:{length},{display}\n{location}\n')
+            written += 1
+    os.replace(temp_path, file_path)
+    return written
@@ -0,0 +1,178 @@
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Set
+
+PROFILING_ENV = 'MUSIC_APP_PROFILE'  # 1 to record spans and counters from startup
+CPROFILE_ENV = 'MUSIC_APP_CPROFILE'  # Comma separated span names to run under cProfile, or "all"
+RECENT_SAMPLES = 256  # Durations kept per span for percentiles
+
+_lock = threading.Lock()
+_enabled = os.environ.get(PROFILING_ENV, '') in ('1', 'true', 'yes')
+_spans: Dict[str, 'SpanStats'] = {}
+_counters: Dict[str, int] = {}
+_profiled: Set[str] = {name for name in os.environ.get(CPROFILE_ENV, '').split(',') if name}
+_profiler: Optional[cProfile.Profile] = None
+_profile_depth = 0
+_profile_thread: Optional[int] = None
+
+
+class SpanStats:
+    """Timing totals of one named span."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.recent.append(seconds)
+
+    def as_dict(self) -> Dict:
+        recent = sorted(self.recent)
+        return {
+            'count': self.count,
+            'total_ms': self.total * 1000,
+            'mean_ms': self.total * 1000 / self.count if self.count else 0.0,
+            'p95_ms': recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000 if recent else 0.0,
+            'max_ms': self.max * 1000,
+        }
+
+
+class _NullSpan:
+    """Span used while disabled; entering and leaving it does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'started', 'profiled')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.profiled = False
+
+    def __enter__(self):
+        if _profiled and (self.name in _profiled or 'all' in _profiled):
+            self.profiled = _start_profile()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        if self.profiled:
+            _stop_profile()
+        with _lock:
+            stats = _spans.get(self.name)
+            if stats is None:
+                stats = _spans[self.name] = SpanStats()
+            stats.add(elapsed)
+        return False
+
+
+def span(name: str):
+    """Time a block: `with span('player.load'): ...`. Costs one check while disabled."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def count(name: str, amount: int = 1):
+    """Add to a named counter."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def is_enabled() -> bool:
+    """Return True while spans and counters are recorded."""
+    return _enabled
+
+
+def set_enabled(enabled: bool):
+    """Start or stop recording spans and counters."""
+    global _enabled
+    _enabled = enabled
+
+
+def set_profiled_spans(names: Set[str]):
+    """Run the named spans ("all" for every span) under cProfile from now on."""
+    global _profiled
+    _profiled = set(names)
+
+
+def _start_profile() -> bool:
+    """Enable the shared profiler, returning False if another thread holds it."""
+    global _profiler, _profile_depth, _profile_thread
+    with _lock:
+        thread = threading.get_ident()
+        if _profile_depth and _profile_thread != thread:
+            # cProfile follows one thread at a time
+            return False
+        if _profiler is None:
+            _profiler = cProfile.Profile()
+        if _profile_depth == 0:
+            _profile_thread = thread
+            _profiler.enable()
+        _profile_depth += 1
+        return True
+
+
+def _stop_profile():
+    global _profile_depth
+    with _lock:
+        _profile_depth -= 1
+        if _profile_depth == 0:
+            _profiler.disable()
+
+
+def snapshot() -> Dict:
+    """Return the recorded spans and counters."""
+    with _lock:
+        return {
+            'spans': {name: stats.as_dict() for name, stats in sorted(_spans.items())},
+            'counters': dict(sorted(_counters.items())),
+        }
+
+
+def reset():
+    """Clear spans, counters and collected profile data."""
+    global _profiler
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        if _profile_depth == 0:
+            _profiler = None
+
+
+def export(path: str):
+    """Write the recorded spans and counters to a JSON file."""
+    report = snapshot()
+    report['timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def dump_profile(path: str) -> bool:
+    """Write collected cProfile stats for pstats, returning False if nothing was profiled."""
+    with _lock:
+        if _profiler is None or _profile_depth:
+            return False
+        _profiler.dump_stats(path)
+    return True
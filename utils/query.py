@@ -0,0 +1,370 @@
+import math
+import re
+import time
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+TEXT_FIELDS = ('title', 'artist', 'album', 'genre', 'extension')
+NUMERIC_FIELDS = ('date', 'track_number', 'size', 'modified')
+QUERY_FIELDS = TEXT_FIELDS + NUMERIC_FIELDS
+FIELD_ALIASES = {'year': 'date', 'track': 'track_number', 'ext': 'extension', 'format': 'extension'}
+EXPLAIN_PREFIX = '?'  # A query starting with this also reports its plan and timings
+# A term is looked up and intersected while its estimated rows are at most this
+# many times the current candidates; beyond that each candidate is checked instead
+INTERSECT_RATIO = 4
+TOKEN_PATTERN = re.compile(r'(-?)(?:(\w+):)?("[^"]*"?|\S+)')
+SIZE_PATTERN = re.compile(r'(\d+(?:\.\d+)?)([kmg]?)b?')
+DATE_PATTERN = re.compile(r'(\d{4})(?:-(\d{1,2}))?(?:-(\d{1,2}))?')
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+class Term(NamedTuple):
+    """One word of a query: free text, a field value, or a field range [low, high)."""
+    label: str  # As typed, for explain output
+    field: Optional[str]  # None for free text matched against title, artist and album
+    text: str  # Casefolded value
+    low: float = -math.inf
+    high: float = math.inf
+    negated: bool = False
+
+
+class Query(NamedTuple):
+    terms: List[Term]
+    explain: bool = False
+
+
+def numeric_value(field: str, value) -> float:
+    """Return the value a numeric field is indexed by: the year, the track number, or the number itself."""
+    if value is None or value == '':
+        return math.nan
+    if field in ('date', 'track_number'):
+        match = re.search(r'\d{4}' if field == 'date' else r'\d+', str(value))
+        return float(match.group()) if match else math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def parse_bound(field: str, text: str) -> Optional[Tuple[float, float]]:
+    """Return the [low, high) range one query value stands for, e.g. a whole year or megabyte."""
+    if field == 'size':
+        match = SIZE_PATTERN.fullmatch(text)
+        if not match:
+            return None
+        unit = SIZE_UNITS[match.group(2)]
+        low = float(match.group(1)) * unit
+        return low, low + unit
+    if field == 'modified':
+        match = DATE_PATTERN.fullmatch(text)
+        if not match:
+            return None
+        year, month, day = (int(part) if part else None for part in match.groups())
+        try:
+            if month is None:
+                start, end = (year, 1, 1), (year + 1, 1, 1)
+            elif day is None:
+                start, end = (year, month, 1), (year + month // 12, month % 12 + 1, 1)
+            else:
+                start, end = (year, month, day), (year, month, day + 1)
+            # mktime normalizes a day past the end of a month
+            return (time.mktime(start + (0, 0, 0, 0, 0, -1)),
+                    time.mktime(end + (0, 0, 0, 0, 0, -1)))
+        except (OverflowError, ValueError):
+            return None
+    if not text.isdigit():
+        return None
+    return float(text), float(text) + 1
+
+
+def parse_range(field: str, text: str) -> Optional[Tuple[float, float]]:
+    """Parse a value or an inclusive range such as 1995..2000, 1995.. or ..10mb."""
+    if '..' not in text:
+        return parse_bound(field, text)
+    first, last = text.split('..', 1)
+    low, high = -math.inf, math.inf
+    if first:
+        bound = parse_bound(field, first)
+        if bound is None:
+            return None
+        low = bound[0]
+    if last:
+        bound = parse_bound(field, last)
+        if bound is None:
+            return None
+        high = bound[1]
+    return low, high
+
+
+def parse_query(text: str) -> Optional[Query]:
+    """Parse a structured query, or return None for plain words the substring search handles.
+
+    Words are ANDed. field:value matches a field (year, track and ext are
+    aliases), numeric fields take ranges like year:1995..2000, a leading
+    - excludes matches, and quotes keep spaces in a value. Words with an
+    unknown field, or a value that does not parse, are plain text.
+    """
+    text = text.strip()
+    explain = text.startswith(EXPLAIN_PREFIX)
+    if explain:
+        text = text[len(EXPLAIN_PREFIX):]
+    terms = []
+    structured = explain
+    for match in TOKEN_PATTERN.finditer(text):
+        sign, field, value = match.groups()
+        label = match.group(0)
+        negated = bool(sign)
+        value = value.strip('"').casefold()
+        if field is not None:
+            field = field.casefold()
+            field = FIELD_ALIASES.get(field, field)
+        if field in NUMERIC_FIELDS:
+            bounds = parse_range(field, value)
+            if bounds is not None:
+                terms.append(Term(label, field, value, bounds[0], bounds[1], negated))
+                structured = True
+                continue
+        if field is not None and field not in TEXT_FIELDS:
+            field = None
+            value = label[len(sign):].strip('"').casefold()
+        if field == 'extension':
+            value = '.' + value.lstrip('.')
+        if value:
+            terms.append(Term(label, field, value, negated=negated))
+            structured = structured or field is not None or negated
+    if not structured or not terms:
+        return None
+    return Query(terms, explain)
+
+
+class ValueIndex:
+    """Docs grouped by the casefolded value of a field with few distinct values.
+
+    Each value keeps the docs holding it in ascending order. A term is
+    answered by scanning the distinct values, not the docs.
+    """
+
+    def __init__(self):
+        self.values: List[str] = ['']
+        self.ids: Dict[str, int] = {'': 0}
+        self.docs: List[array] = [array('I')]
+        self.value_of = array('I')  # doc -> value id, 0 when missing
+
+    def add(self, doc: int, value):
+        value = str(value or '').casefold()
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = self.ids[value] = len(self.values)
+            self.values.append(value)
+            self.docs.append(array('I'))
+        self.docs[value_id].append(doc)
+        if len(self.value_of) < doc:
+            self.value_of.extend([0] * (doc - len(self.value_of)))
+        self.value_of.append(value_id)
+
+    def value(self, doc: int) -> str:
+        return self.values[self.value_of[doc]]
+
+    def matching(self, text: str, exact: bool = False) -> Set[int]:
+        """Return the ids of the values containing text, or equal to it."""
+        if exact:
+            value_id = self.ids.get(text)
+            return set() if value_id is None else {value_id}
+        return {value_id for value_id, value in enumerate(self.values) if value_id and text in value}
+
+
+class TextColumn:
+    """The casefolded value of a field that is different for nearly every doc, such as the title."""
+
+    def __init__(self):
+        self.values: List[str] = []
+
+    def add(self, doc: int, value):
+        if len(self.values) < doc:
+            self.values.extend([''] * (doc - len(self.values)))
+        self.values.append(str(value or '').casefold())
+
+    def value(self, doc: int) -> str:
+        return self.values[doc]
+
+
+class RangeIndex:
+    """Numeric values of a field, with the docs sorted by value for range lookups.
+
+    The sorted order is rebuilt on the first lookup after docs were added.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.values = array('d')  # doc -> value, NaN when missing
+        self._sorted_values: List[float] = []
+        self._sorted_docs = array('I')
+        self._dirty = False
+
+    def add(self, doc: int, value):
+        if len(self.values) < doc:
+            self.values.extend([math.nan] * (doc - len(self.values)))
+        self.values.append(numeric_value(self.field, value))
+        self._dirty = True
+
+    def value(self, doc: int) -> float:
+        """Return the indexed value, which numeric_value() maps to itself."""
+        return self.values[doc]
+
+    def span(self, low: float, high: float) -> Tuple[int, int]:
+        """Return the positions in the sorted docs of the values in [low, high)."""
+        if self._dirty:
+            values = self.values
+            # NaN never equals itself, which drops missing values
+            docs = sorted((doc for doc, value in enumerate(values) if value == value),
+                          key=values.__getitem__)
+            self._sorted_docs = array('I', docs)
+            self._sorted_values = [values[doc] for doc in docs]
+            self._dirty = False
+        return bisect_left(self._sorted_values, low), bisect_left(self._sorted_values, high)
+
+    def docs(self, start: int, end: int) -> Set[int]:
+        return set(self._sorted_docs[start:end])
+
+
+class CompiledTerm(NamedTuple):
+    """A term bound to an index: its estimated rows, a set lookup and a per-doc check."""
+    term: Term
+    estimate: int
+    lookup: Callable[[], Set[int]]
+    check: Callable[[int], bool]
+
+
+class Step(NamedTuple):
+    label: str
+    strategy: str
+    estimate: int
+    rows: int
+    seconds: float
+
+
+class QueryPlan:
+    """Compiled query: terms ordered by estimated rows, run as set lookups and per-doc checks.
+
+    The term with the fewest estimated rows is looked up first. Each
+    following term is looked up and intersected while its rows are
+    within INTERSECT_RATIO of the remaining candidates, and otherwise
+    checked against each candidate. Exclusions run last the same way.
+    """
+
+    def __init__(self, query: Query, terms: List[CompiledTerm], all_docs: Callable[[], Set[int]],
+                 live: Callable[[Set[int]], Set[int]], compile_seconds: float):
+        self.query = query
+        self.include = sorted((term for term in terms if not term.term.negated), key=lambda term: term.estimate)
+        self.exclude = sorted((term for term in terms if term.term.negated), key=lambda term: term.estimate)
+        self.all_docs = all_docs
+        self.live = live
+        self.compile_seconds = compile_seconds
+        self.steps: List[Step] = []
+
+    def execute(self) -> Set[int]:
+        """Return the matching docs, recording a Step for each term."""
+        self.steps = []
+        candidates = None
+        for compiled in self.include:
+            started = time.perf_counter()
+            if candidates is None:
+                candidates = compiled.lookup()
+                strategy = 'lookup'
+            elif compiled.estimate <= INTERSECT_RATIO * len(candidates):
+                candidates &= compiled.lookup()
+                strategy = 'intersect'
+            else:
+                check = compiled.check
+                candidates = {doc for doc in candidates if check(doc)}
+                strategy = 'check'
+            self._record(compiled, strategy, candidates, started)
+            if not candidates:
+                return candidates
+
+        if candidates is None:
+            started = time.perf_counter()
+            candidates = self.all_docs()
+            self.steps.append(Step('all tracks', 'lookup', len(candidates), len(candidates),
+                                   time.perf_counter() - started))
+        for compiled in self.exclude:
+            started = time.perf_counter()
+            if compiled.estimate <= INTERSECT_RATIO * len(candidates):
+                candidates -= compiled.lookup()
+                strategy = 'subtract'
+            else:
+                check = compiled.check
+                candidates = {doc for doc in candidates if not check(doc)}
+                strategy = 'check'
+            self._record(compiled, strategy, candidates, started)
+
+        started = time.perf_counter()
+        candidates = self.live(candidates)
+        self.steps.append(Step('removed tracks', 'check', len(candidates), len(candidates),
+                               time.perf_counter() - started))
+        return candidates
+
+    def explain(self) -> str:
+        """Describe the plan and the rows and time of each step of the last execute()."""
+        total = self.compile_seconds + sum(step.seconds for step in self.steps)
+        rows = self.steps[-1].rows if self.steps else 0
+        lines = [f"{rows} tracks in {total * 1000:.2f} ms (planning {self.compile_seconds * 1000:.2f} ms)"]
+        for number, step in enumerate(self.steps, 1):
+            lines.append(f"{number}. {step.strategy:<9} {step.label:<24} est. {step.estimate:>7} "
+                         f"rows {step.rows:>7}  {step.seconds * 1000:.2f} ms")
+        return '\n'.join(lines)
+
+    def _record(self, compiled: CompiledTerm, strategy: str, candidates: Set[int], started: float):
+        self.steps.append(Step(compiled.term.label, strategy, compiled.estimate, len(candidates),
+                               time.perf_counter() - started))
+
+
+def compile_query(query: Query, index) -> QueryPlan:
+    """Bind each term of a query to the field indexes of a utils.search_index.SearchIndex."""
+    started = time.perf_counter()
+    index.build_pending()
+    compiled = [_compile_term(term, index) for term in query.terms]
+    texts = index.texts
+
+    def all_docs() -> Set[int]:
+        return set(index.doc_of.values())
+
+    def live(docs: Set[int]) -> Set[int]:
+        if len(index.doc_of) == len(texts):
+            return docs
+        return {doc for doc in docs if texts[doc] is not None}
+
+    return QueryPlan(query, compiled, all_docs, live, time.perf_counter() - started)
+
+
+def _compile_term(term: Term, index) -> CompiledTerm:
+    if term.field in NUMERIC_FIELDS:
+        field_index = index.fields[term.field]
+        start, end = field_index.span(term.low, term.high)
+        values = field_index.values
+        low, high = term.low, term.high
+        return CompiledTerm(term, end - start, lambda: field_index.docs(start, end),
+                            lambda doc: low <= values[doc] < high)
+
+    text = term.text
+    field_index = index.fields.get(term.field)
+    if isinstance(field_index, ValueIndex):
+        ids = field_index.matching(text, exact=term.field == 'extension')
+        docs = field_index.docs
+        value_of = field_index.value_of
+        return CompiledTerm(term, sum(len(docs[value_id]) for value_id in ids),
+                            lambda: set().union(*(docs[value_id] for value_id in ids)),
+                            lambda doc: value_of[doc] in ids)
+
+    # Free text and titles: candidates from the trigram postings of the whole text
+    if term.field is None:
+        values = index.texts
+    else:
+        values = field_index.values
+    candidates = index.candidates([text])
+    if candidates is None:
+        candidates = index.doc_of.values()
+    return CompiledTerm(term, len(candidates),
+                        lambda: {doc for doc in candidates if values[doc] and text in values[doc]},
+                        lambda doc: bool(values[doc]) and text in values[doc])
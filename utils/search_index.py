@@ -0,0 +1,341 @@
+import heapq
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.query import (QUERY_FIELDS, NUMERIC_FIELDS, Query, QueryPlan, RangeIndex, TextColumn,
+                         ValueIndex, compile_query)
+
+# Separates fields in a document so a query never matches across two fields
+FIELD_SEPARATOR = '\x00'
+SEARCH_FIELDS = ('title', 'artist', 'album')
+WORD_PATTERN = re.compile(r'\w+')
+FUZZY_RESULT_LIMIT = 200  # Best matches returned by a fuzzy search
+FUZZY_WORD_CANDIDATES = 100  # Library words per query word checked with edit_distance()
+PREFIX_MATCHES = 200  # Library words completing the last query word
+MIN_PREFIX_LENGTH = 2
+COMPACT_MIN_REMOVED = 64  # Removed docs tolerated before compaction is considered
+COMPACT_REMOVED_FRACTION = 0.25  # Share of removed docs that triggers a compaction
+WORD_SCORE_CACHE = 64  # Query words whose per-doc scores are kept between keystrokes
+
+
+def trigrams(text: str) -> Set[str]:
+    """Return the distinct three-character substrings of a string."""
+    return {
+        text[i:i + 3] for i in range(len(text) - 2)
+        if FIELD_SEPARATOR not in text[i:i + 3]
+    }
+
+
+def word_trigrams(word: str) -> Set[str]:
+    """Return the trigrams of a word padded with spaces, so its first and last letters count."""
+    return trigrams(f' {word} ')
+
+
+def max_edits(word: str) -> int:
+    """Return the number of typos tolerated in a query word of this length."""
+    if len(word) < 3:
+        return 0
+    return 1 if len(word) <= 5 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Return the edit distance between two words, counting a swap of neighbours as one edit.
+
+    Gives up early and returns limit + 1 once the distance must exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before = None
+    previous = list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, other in enumerate(b, 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other))
+            if i > 1 and j > 1 and char == b[j - 2] and a[i - 2] == other:
+                value = min(value, before[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class SearchIndex:
+    """Trigram index over the casefolded title, artist and album of each track.
+
+    Every query word must appear as a substring of the track text. Words of
+    three or more characters are answered from the posting list of their
+    rarest trigram, so only a few candidates are verified per query. Posting
+    lists are built lazily in build_pending() so adding tracks stays cheap.
+    Re-adding an unchanged track is a no-op; removed docs stay in the
+    posting lists until they make up COMPACT_REMOVED_FRACTION of the
+    index, which is then rebuilt from the live docs.
+
+    search_fuzzy() tolerates typos instead. It works on whole words: each
+    query word is matched against the distinct words of the library,
+    found through a trigram index over those words and confirmed with
+    edit_distance(), and tracks are ranked by how well their words match.
+
+    query() runs a structured utils.query.Query against per-field indexes
+    that build_pending() fills alongside the postings.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        """Start with no docs."""
+        self.texts: List[Optional[str]] = []  # doc id -> text, None once removed
+        self.paths: List[Optional[str]] = []
+        self.doc_of: Dict[str, int] = {}
+        self.postings: Dict[str, array] = {}
+        self._pending: List[int] = []  # Docs not yet in the posting lists
+        self._last_query: Optional[str] = None
+        self._last_docs: Optional[List[int]] = None
+        self.word_docs: Dict[str, array] = {}  # Library word -> docs containing it
+        self.word_postings: Dict[str, List[str]] = {}  # word_trigrams() gram -> library words
+        self._sorted_words: Optional[List[str]] = None  # For prefix lookups, rebuilt when words are added
+        self._word_scores: Dict[Tuple[str, bool], Dict[int, float]] = {}  # Cached word_scores()
+        self.records: List[Optional[tuple]] = []  # doc -> QUERY_FIELDS values until indexed
+        self.signatures: List[int] = []  # doc -> hash of its text and record, to skip unchanged re-adds
+        self.fields = {
+            field: RangeIndex(field) if field in NUMERIC_FIELDS
+            else TextColumn() if field == 'title' else ValueIndex()
+            for field in QUERY_FIELDS
+        }
+
+    def __len__(self):
+        return len(self.doc_of)
+
+    def add(self, track: Dict):
+        """Index a track, replacing any previous entry for its path."""
+        path = track['path']
+        text = FIELD_SEPARATOR.join(
+            (track.get(field) or '') for field in SEARCH_FIELDS
+        ).casefold()
+        record = tuple(track.get(field) for field in QUERY_FIELDS)
+        signature = hash((text, record))
+        doc = self.doc_of.get(path)
+        if doc is not None:
+            if self.signatures[doc] == signature:
+                return
+            self.remove(path)
+        self._append(path, text, record, signature)
+
+    def _append(self, path: str, text: str, record: tuple, signature: int):
+        """Add a doc, to be indexed by build_pending()."""
+        doc = len(self.texts)
+        self.texts.append(text)
+        self.paths.append(path)
+        self.records.append(record)
+        self.signatures.append(signature)
+        self.doc_of[path] = doc
+        self._pending.append(doc)
+        self._last_query = None
+
+    def add_many(self, tracks: Iterable[Dict]):
+        """Index several tracks."""
+        for track in tracks:
+            self.add(track)
+
+    def remove(self, path: str):
+        """Drop a track from the index."""
+        doc = self.doc_of.pop(path, None)
+        if doc is not None:
+            # Posting lists keep the id, candidates are checked against texts
+            self.texts[doc] = None
+            self.paths[doc] = None
+            self.records[doc] = None
+            self._last_query = None
+            removed = len(self.texts) - len(self.doc_of)
+            if removed >= COMPACT_MIN_REMOVED and removed >= len(self.texts) * COMPACT_REMOVED_FRACTION:
+                self.compact()
+
+    def compact(self):
+        """Rebuild the index from the live docs, dropping removed ones and renumbering the rest.
+
+        The live docs are queued again, so the postings are rebuilt in
+        build_pending() steps like a fresh index.
+        """
+        live = sorted(self.doc_of.values())
+        docs = [
+            (self.paths[doc], self.texts[doc],
+             self.records[doc] if self.records[doc] is not None
+             else tuple(self.fields[field].value(doc) for field in QUERY_FIELDS),
+             self.signatures[doc])
+            for doc in live
+        ]
+        self._reset()
+        for path, text, record, signature in docs:
+            self._append(path, text, record, signature)
+
+    def build_pending(self, limit: Optional[int] = None) -> bool:
+        """Add up to limit pending docs to the posting lists, return True if any remain."""
+        count = len(self._pending) if limit is None else min(limit, len(self._pending))
+        postings = self.postings
+        for doc in self._pending[:count]:
+            text = self.texts[doc]
+            if text is None:
+                continue
+            for gram in trigrams(text):
+                posting = postings.get(gram)
+                if posting is None:
+                    posting = postings[gram] = array('I')
+                posting.append(doc)
+            for word in set(WORD_PATTERN.findall(text)):
+                docs = self.word_docs.get(word)
+                if docs is None:
+                    docs = self.word_docs[word] = array('I')
+                    self._add_word(word)
+                docs.append(doc)
+            for field, value in zip(QUERY_FIELDS, self.records[doc]):
+                self.fields[field].add(doc, value)
+            self.records[doc] = None
+        del self._pending[:count]
+        if count:
+            self._word_scores.clear()
+        return bool(self._pending)
+
+    def search(self, query: str) -> Optional[List[str]]:
+        """Return the paths matching every word of a query, or None for an empty query."""
+        query = query.casefold().strip()
+        words = query.split()
+        if not words:
+            return None
+        paths = self.paths
+        return [paths[doc] for doc in self._search_docs(query, words)]
+
+    def query(self, query: Query) -> Tuple[List[str], QueryPlan]:
+        """Return the paths matching a structured query, in index order, and the plan that found them."""
+        plan = compile_query(query, self)
+        paths = self.paths
+        return [paths[doc] for doc in sorted(plan.execute())], plan
+
+    def search_fuzzy(self, query: str, limit: int = FUZZY_RESULT_LIMIT) -> Optional[List[str]]:
+        """Return up to limit paths ranked by how closely they match a query, or None for an empty query.
+
+        Each query word scores its closest word in a track: 1 for the same
+        word, less for a word a few typos away, and the last word also
+        matches words it begins, as it may still be being typed.
+        """
+        words = WORD_PATTERN.findall(query.casefold())
+        if not words:
+            return None
+        self.build_pending()
+        per_word = [self.word_scores(word, position == len(words) - 1)
+                    for position, word in enumerate(words)]
+        # Copy the largest in one step, add the others doc by doc
+        per_word.sort(key=len, reverse=True)
+        scores = dict(per_word[0])
+        get = scores.get
+        for word_scores in per_word[1:]:
+            for doc, similarity in word_scores.items():
+                scores[doc] = get(doc, 0.0) + similarity
+
+        texts = self.texts
+        if len(self.doc_of) < len(texts):
+            # Postings still hold removed docs until the next compaction
+            scores = {doc: score for doc, score in scores.items() if texts[doc] is not None}
+        top = heapq.nlargest(limit, scores, key=scores.__getitem__)
+        paths = self.paths
+        return [paths[doc] for doc in top]
+
+    def word_scores(self, word: str, prefix: bool = False) -> Dict[int, float]:
+        """Return doc -> similarity of its closest word to a query word, for docs with a close word."""
+        key = (word, prefix)
+        scores = self._word_scores.get(key)
+        if scores is None:
+            scores = {}
+            # Ascending similarity, so a doc keeps the closest of its words
+            for match, similarity in sorted(self._similar_words(word, prefix), key=lambda item: item[1]):
+                scores.update(dict.fromkeys(self.word_docs[match], similarity))
+            if len(self._word_scores) >= WORD_SCORE_CACHE:
+                self._word_scores.clear()
+            self._word_scores[key] = scores
+        return scores
+
+    def _similar_words(self, word: str, prefix: bool) -> List[Tuple[str, float]]:
+        """Return the library words close to a query word, with their similarity from 0 to 1."""
+        matches = {}
+        if word in self.word_docs:
+            matches[word] = 1.0
+        limit = max_edits(word)
+        if limit:
+            grams = word_trigrams(word)
+            counts = Counter()
+            for gram in grams:
+                counts.update(self.word_postings.get(gram, ()))
+            # Every edit changes at most 4 padded trigrams of a word
+            needed = max(1, len(grams) - 4 * limit)
+            candidates = heapq.nlargest(
+                FUZZY_WORD_CANDIDATES,
+                (other for other, count in counts.items()
+                 if count >= needed and abs(len(other) - len(word)) <= limit and other != word),
+                key=counts.__getitem__
+            )
+            for other in candidates:
+                distance = edit_distance(word, other, limit)
+                if distance <= limit:
+                    matches[other] = 1.0 - distance / max(len(word), len(other))
+        if prefix and len(word) >= MIN_PREFIX_LENGTH:
+            if self._sorted_words is None:
+                self._sorted_words = sorted(self.word_docs)
+            sorted_words = self._sorted_words
+            start = bisect_left(sorted_words, word)
+            for other in sorted_words[start:start + PREFIX_MATCHES]:
+                if not other.startswith(word):
+                    break
+                # Completions rank below typo matches of similar length
+                similarity = 0.5 + 0.5 * len(word) / len(other)
+                if matches.get(other, 0.0) < similarity:
+                    matches[other] = similarity
+
+        return list(matches.items())
+
+    def _add_word(self, word: str):
+        """Add a new library word to the word trigram index."""
+        for gram in word_trigrams(word):
+            words = self.word_postings.get(gram)
+            if words is None:
+                words = self.word_postings[gram] = []
+            words.append(word)
+        self._sorted_words = None
+
+    def _search_docs(self, query: str, words: List[str]) -> List[int]:
+        """Return the ids of the live docs containing every word."""
+        if self._last_query is not None and query.startswith(self._last_query):
+            # Typing further can only narrow the previous result
+            candidates = self._last_docs
+        else:
+            candidates = self.candidates(words)
+
+        texts = self.texts
+        if candidates is None:
+            candidates = range(len(texts))
+        # Removed docs have no text, so the first test filters them out
+        docs = [doc for doc in candidates if texts[doc] and words[0] in texts[doc]]
+        for word in words[1:]:
+            docs = [doc for doc in docs if word in texts[doc]]
+
+        self._last_query = query
+        self._last_docs = docs
+        return docs
+
+    def candidates(self, words: List[str]) -> Optional[Iterable[int]]:
+        """Return the smallest posting list covering the query, or None to scan all."""
+        long_words = [word for word in words if len(word) >= 3]
+        if not long_words:
+            return None
+        self.build_pending()
+        best = None
+        for word in long_words:
+            for gram in trigrams(word):
+                posting = self.postings.get(gram)
+                if posting is None:
+                    return ()
+                if best is None or len(posting) < len(best):
+                    best = posting
+        return best
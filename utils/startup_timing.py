@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+from typing import List, Tuple
+
+STARTUP_TIMING_ENV = 'MUSIC_APP_STARTUP_TIMING'
+STARTUP_TIMING_FLAG = '--startup-timing'
+
+
+def startup_timing_enabled() -> bool:
+    """Return True if the startup breakdown was asked for by env var or command line flag."""
+    return (os.environ.get(STARTUP_TIMING_ENV, '') in ('1', 'true', 'yes')
+            or STARTUP_TIMING_FLAG in sys.argv)
+
+
+class StartupTimer:
+    """Records how long each startup phase took, for a report once the window is usable."""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases: List[Tuple[str, float]] = []  # (phase, seconds)
+
+    def mark(self, phase: str):
+        """Close the phase running since the previous mark."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self):
+        """Print the per-phase breakdown and the total."""
+        if not self.enabled:
+            return
+        width = max((len(phase) for phase, _ in self.phases), default=0)
+        print("Startup timing:")
+        for phase, seconds in self.phases:
+            print(f"  {phase:<{width}}  {seconds * 1000:8.1f} ms")
+        print(f"  {'total':<{width}}  {(self._last - self.started) * 1000:8.1f} ms")
+
+
+# Started when first imported, which main.py does before anything heavy
+startup_timer = StartupTimer(startup_timing_enabled())